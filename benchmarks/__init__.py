@@ -0,0 +1,6 @@
+"""
+The gau2grid benchmark suite, run it from the repository root with:
+    python -m gau2grid.bench
+"""
+
+from .cases import basis_sets, suite
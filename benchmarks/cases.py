@@ -0,0 +1,86 @@
+"""
+Benchmark cases over the reference basis sets, angular momenta, grid sizes, and derivative levels.
+
+Every case is a dictionary:
+    kind      : "shell" for a single shell kernel call, "basis" for the screened driver over the whole basis
+    basis     : the name of the reference basis set
+    L         : the angular momentum of the shell ("shell" cases only)
+    npoints   : the number of grid points
+    grad      : the derivative level
+    spherical : spherical or cartesian functions
+    block_size, nthreads : the driver settings ("basis" cases only), explicit so that results never depend on a
+                tuned profile
+"""
+
+import importlib.util
+import itertools
+import os
+
+from gau2grid import tune
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_suites = {
+    "quick": {
+        "basis": ["cc-pVDZ", "cc-pVQZ"],
+        "npoints": [100, 10000],
+        "grad": [0, 1],
+        "spherical": [True],
+    },
+    "full": {
+        "basis": ["cc-pVDZ", "cc-pVTZ", "cc-pVQZ", "cc-pV5Z", "cc-pV6Z"],
+        "npoints": [100, 1000, 10000, 100000, 1000000],
+        "grad": [0, 1, 2],
+        "spherical": [False, True],
+    },
+}
+
+_loaded = {}
+
+
+def basis_sets():
+    """
+    Returns the reference basis sets of the test suite by name.
+    """
+
+    if "test_basis" not in _loaded:
+        path = os.path.join(_root, "tests", "ref_basis.py")
+        spec = importlib.util.spec_from_file_location("ref_basis", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded["test_basis"] = module.test_basis
+
+    return _loaded["test_basis"]
+
+
+def suite(name="quick", kinds=("shell", "basis"), **overrides):
+    """
+    Returns the cases of a named suite, "quick" or "full". Any of the basis, npoints, grad, or spherical lists of
+    the suite may be overridden, and L restricts the angular momenta of the shell cases. The block_size and nthreads
+    of the basis cases default to those of an untuned driver.
+    """
+
+    if name not in _suites:
+        raise KeyError("Benchmark suite '%s' not understood, available suites: %s" % (name, ", ".join(_suites)))
+
+    params = dict(_suites[name])
+    L_values = overrides.pop("L", None)
+    settings = {k: overrides.pop(k, None) for k in ["block_size", "nthreads"]}
+    settings = {k: tune._defaults[k] if v is None else v for k, v in settings.items()}
+    params.update({k: v for k, v in overrides.items() if v is not None})
+
+    cases = []
+    for basis, npoints, grad, spherical in itertools.product(params["basis"], params["npoints"], params["grad"],
+                                                             params["spherical"]):
+        common = {"basis": basis, "npoints": npoints, "grad": grad, "spherical": spherical}
+
+        if "shell" in kinds:
+            shells = basis_sets()[basis]
+            for L in sorted(set(shell["am"] for shell in shells)):
+                if (L_values is None) or (L in L_values):
+                    cases.append(dict(common, kind="shell", L=L))
+
+        if "basis" in kinds:
+            cases.append(dict(common, kind="basis", **settings))
+
+    return cases
@@ -2,28 +2,15 @@
 Cartesian to regular solid harmonics conversion code.
 """
 
-import numpy as np
+from fractions import Fraction
 
-# Arbitrary precision math with 100 decimal places
-import mpmath
-mpmath.mp.dps = 100
+import numpy as np
 
+from . import memoize
 from . import order
 
-
-class Memoize(object):
-    """
-    Simple memoize class for RSH_coefs which is quite expensive
-    """
-
-    def __init__(self, func):
-        self.func = func
-        self.mem = {}
-
-    def __call__(self, *args):
-        if args not in self.mem:
-            self.mem[args] = self.func(*args)
-        return self.mem[args]
+# The memoizing decorator moved to memoize.py
+Memoize = memoize.Memoize
 
 
 def quanta_to_string(lx, ly, lz):
@@ -47,17 +34,142 @@ def quanta_to_string(lx, ly, lz):
     return string
 
 
-@Memoize
+@memoize.memoize(persist=True)
+def cart_to_RSH_exact(l):
+    """
+    Computes the coefficients of the regular solid harmonics of angular momentum l in exact rational arithmetic.
+
+    Uses the same expansion as cart_to_RSH_coeffs_mpmath, eq. 23 of F. C. Pickard, H. F. Schaefer and B. R. Brooks,
+    JCP, 140, 184101 (2014), with both of its inner sums brought to integer sums over a common denominator:
+        sum_i (-1)^i (2l - 2i)! / ((l - i)! (i - j)! (l - m - 2i)!)
+            = sum_i (-1)^i [(2l - 2i)! / ((l - i)! (l - m - 2i)!)] [M! / (i - j)!] / M!,  M = (l - m) / 2 - j
+        sum_k (-1)^k / ((j - k)! k! (lx - 2k)! (m - lx + 2k)!) = sum_k (-1)^k C(j, k) C(m, lx - 2k) / (j! m!)
+    The only irrational factor of a component is the square root of its normalization
+    sqrt(2^[m > 0] (l - m)! / (l + m)!), which is kept as its exact radicand.
+
+    Returns
+    -------
+    components : list of (Fraction, list)
+        For each component in the order 0, +1, -1, +2, -2, ... the radicand and the ((lx, ly, lz), rational) terms,
+        the coefficient of a term is rational * sqrt(radicand)
+    """
+
+    # Factorials by n! = n (n - 1)!
+    fac = [1]
+    for n in range(1, 2 * l + 1):
+        fac.append(fac[-1] * n)
+
+    ret = []
+    for m in range(l + 1):
+        radicand = Fraction(fac[l - m] * (2 if m else 1), fac[l + m])
+
+        real = []
+        imaginary = []
+        for lz in range(l + 1):
+            for ly in range(l - lz + 1):
+                lx = l - ly - lz
+                if ((lx + ly - m) % 2) or (lx + ly < m):
+                    continue
+                j = (lx + ly - m) // 2
+                M = (l - m) // 2 - j
+
+                # (2l - 2i)! / ((l - i)! (l - m - 2i)!) is a multinomial coefficient and an integer
+                p2 = 0
+                for i in range(j, (l - m) // 2 + 1):
+                    p2 += (-1)**i * (fac[2 * l - 2 * i] // (fac[l - i] * fac[l - m - 2 * i])) * (fac[M] // fac[i - j])
+
+                p3 = 0
+                for k in range(j + 1):
+                    if (lx >= 2 * k) and (m + 2 * k >= lx):
+                        p3 += (-1)**k * _comb(fac, j, k) * _comb(fac, m, lx - 2 * k)
+
+                # The m! of the prefactor m! / 2^l cancels against the m! of the second sum
+                if (p2 == 0) or (p3 == 0):
+                    continue
+                p = Fraction(p2 * p3, 2**l * fac[M] * fac[j])
+
+                # Odd m - lx are the imaginary part, the sign is (-1)^floor((m - lx) / 2)
+                if ((m - lx) // 2) % 2:
+                    p = -p
+                if (m - lx) % 2:
+                    imaginary.append(((lx, ly, lz), p))
+                else:
+                    real.append(((lx, ly, lz), p))
+
+        ret.append((radicand, real))
+        if m:
+            ret.append((radicand, imaginary))
+
+    return ret
+
+
+def _comb(fac, n, k):
+    """
+    The binomial coefficient n choose k from a table of factorials.
+    """
+    return fac[n] // (fac[k] * fac[n - k])
+
+
+def _isqrt(n):
+    """
+    The integer square root of n by Newton's iteration, math.isqrt needs Python 3.8.
+    """
+    if n == 0:
+        return 0
+
+    x = 1 << ((n.bit_length() + 1) // 2)
+    while True:
+        y = (x + n // x) // 2
+        if y >= x:
+            return x
+        x = y
+
+
+def _sqrt_product(rational, radicand):
+    """
+    Returns rational * sqrt(radicand) as a float, the square root is taken in integer arithmetic to over 100 bits.
+    """
+
+    value = rational * rational * radicand
+    shift = max(0, 110 + (value.denominator.bit_length() - value.numerator.bit_length()) // 2)
+    root = Fraction(_isqrt((value.numerator << (2 * shift)) // value.denominator), 1 << shift)
+
+    return float(root) if rational > 0 else -float(root)
+
+
+@memoize.memoize(persist=True)
 def cart_to_RSH_coeffs(l):
     """
     Generates a coefficients [ coef, x power, y power, z power ] for each component of
     a regular solid harmonic (in terms of raw Cartesians) with angular momentum l.
 
-    See eq. 23 of ACS, F. C. Pickard, H. F. Schaefer and B. R. Brooks, JCP, 140, 184101 (2014)
+    The coefficients are computed exactly, see cart_to_RSH_exact, and rounded to floats.
 
     Returns coeffs with order 0, +1, -1, +2, -2, ...
     """
 
+    return [[(xyz, _sqrt_product(rational, radicand)) for xyz, rational in terms]
+            for radicand, terms in cart_to_RSH_exact(l)]
+
+
+@memoize.memoize(persist=True)
+def cart_to_RSH_coeffs_mpmath(l):
+    """
+    Generates a coefficients [ coef, x power, y power, z power ] for each component of
+    a regular solid harmonic (in terms of raw Cartesians) with angular momentum l.
+
+    See eq. 23 of ACS, F. C. Pickard, H. F. Schaefer and B. R. Brooks, JCP, 140, 184101 (2014)
+
+    Returns coeffs with order 0, +1, -1, +2, -2, ... as mpmath floats, cart_to_RSH_coeffs is exact and much faster.
+    """
+
+    # Arbitrary precision math with 100 decimal places, mpmath is slow to import and only loaded here
+    import mpmath
+    with mpmath.workdps(100):
+        return _cart_to_RSH_coeffs(l, mpmath)
+
+
+def _cart_to_RSH_coeffs(l, mpmath):
     terms = []
     for m in range(l + 1):
         thisterm = {}
@@ -125,56 +237,109 @@ def cart_to_RSH_coeffs(l):
     return terms
 
 
-def cart_to_spherical_transform(data, L, cart_order):
+def _spherical_rows(L, spherical_order):
     """
-    Transforms a cartesian x points matrix into a spherical x points matrix.
+    Returns the row of each component of cart_to_RSH_coeffs in the spherical order, see order.py.
     """
+    rows = {m: idx for idx, m in order.spherical_order_factory(L, spherical_order)}
+    return [rows[m] for idx, m in order.gaussian_spherical_order(L)]
 
-    cart_order = {x[1:]: x[0] for x in order.cartesian_order_factory(L, cart_order)}
+
+def _cartesian_scales(L, cart_order, normalization):
+    """
+    Returns the {(l, m, n): (index, factor)} of the Cartesian components, the transformations divide by the factor
+    the components were scaled by, see normalization.py.
+    """
+    # Imported here, normalization.py imports this module
+    from . import normalization as norm
+
+    factors = norm.cartesian_factors(L, cart_order, normalization)
+    return {x[1:]: (x[0], factors[x[0]]) for x in order.cartesian_order_factory(L, cart_order)}
+
+
+def cart_to_spherical_transform(data, L, cart_order, out=None, spherical_order="gaussian", normalization="none"):
+    """
+    Transforms a cartesian x points matrix into a spherical x points matrix, leading axes are batched over.
+    The result is written to out if given. The Cartesian components are scaled by the normalization convention.
+    """
+
+    cart_order = _cartesian_scales(L, cart_order, normalization)
     RSH_coefs = cart_to_RSH_coeffs(L)
+    rows = _spherical_rows(L, spherical_order)
 
     nspherical = len(RSH_coefs)
-    ret = np.zeros((nspherical, data.shape[1]))
+    if out is None:
+        ret = np.zeros(data.shape[:-2] + (nspherical, data.shape[-1]))
+    else:
+        ret = out
+        ret[...] = 0.0
+
+    for idx, spherical in zip(rows, RSH_coefs):
+        for cart_index, scale in spherical:
+            cidx, factor = cart_order[cart_index]
+            ret[..., idx, :] += (float(scale) / factor) * data[..., cidx, :]
+
+    return ret
+
+
+@memoize.memoize(persist=True)
+def cart_to_spherical_matrix(L, cart_order, spherical_order="gaussian", normalization="none"):
+    """
+    Returns the dense (nspherical, ncart) cartesian to spherical transformation matrix of Cartesian components
+    scaled by the normalization convention.
+    """
+
+    cart_order = _cartesian_scales(L, cart_order, normalization)
+    RSH_coefs = cart_to_RSH_coeffs(L)
+    rows = _spherical_rows(L, spherical_order)
 
-    idx = 0
-    for spherical in RSH_coefs:
+    ret = np.zeros((len(RSH_coefs), len(cart_order)))
+    for idx, spherical in zip(rows, RSH_coefs):
         for cart_index, scale in spherical:
-            ret[idx] += float(scale) * data[cart_order[cart_index]]
-        idx += 1
+            cidx, factor = cart_order[cart_index]
+            ret[idx, cidx] += float(scale) / factor
 
     return ret
 
 
-def transformation_generator(L, cart_order, function_name="generated_transformer", spacer=""):
+def transformation_generator(L,
+                             cart_order,
+                             function_name="generated_transformer",
+                             spacer="",
+                             spherical_order="gaussian",
+                             normalization="none"):
     """
-    Builds a conversion from cartesian to spherical coordinates
+    Builds a conversion from cartesian to spherical coordinates, the spherical components are written in
+    spherical_order. The Cartesian scaling of the normalization convention is folded into the coefficients.
     """
 
-    cart_order = {x[1:]: x[0] for x in order.cartesian_order_factory(L, cart_order)}
+    cart_order = _cartesian_scales(L, cart_order, normalization)
     RSH_coefs = cart_to_RSH_coeffs(L)
+    rows = _spherical_rows(L, spherical_order)
 
     nspherical = len(RSH_coefs)
 
     s1 = "    "
 
     ret = []
-    ret.append("def " + function_name + "_%d(data):" % L)
-    ret.append(s1 + "ret = np.zeros((%d, data.shape[1]))" % nspherical)
+    ret.append("def " + function_name + "_%d(data, ret=None):" % L)
+    ret.append(s1 + "if ret is None:")
+    ret.append(s1 + "    ret = np.empty(data.shape[:-2] + (%d, data.shape[-1]))" % nspherical)
 
     ret.append("")
     ret.append("# Contraction loops")
 
-    idx = 0
-    for spherical in RSH_coefs:
+    for idx, spherical in zip(rows, RSH_coefs):
         op = " ="
         for cart_index, scale in spherical:
+            cidx, factor = cart_order[cart_index]
+            scale = float(scale) / factor
             if scale != 1.0:
-                ret.append(s1 + "ret[%d] %s % .16f * data[%d]" % (idx, op, scale, cart_order[cart_index]))
+                ret.append(s1 + "ret[..., %d, :] %s %s * data[..., %d, :]" % (idx, op, repr(scale), cidx))
             else:
-                ret.append(s1 + "ret[%d] %s data[%d]" % (idx, op, cart_order[cart_index]))
+                ret.append(s1 + "ret[..., %d, :] %s data[..., %d, :]" % (idx, op, cidx))
             op = "+="
         ret.append("")
-        idx += 1
 
     ret.append(s1 + "return ret")
 
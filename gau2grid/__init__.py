@@ -1,8 +1,41 @@
 """
 Gau2grid base init
+
+Submodules and the public classes are imported on first access, "import gau2grid" itself loads neither NumPy nor
+mpmath and the code generator, mpmath, and the reference implementation are only loaded by the code that uses them.
+The module level __getattr__ this relies on (PEP 562) needs Python 3.7.
 """
 
-from . import generator
-from . import python_reference as ref
-from . import RSH
-from . import order
\ No newline at end of file
+import importlib
+
+_submodules = [
+    "generator", "python_reference", "RSH", "order", "basis", "layout", "screening", "radial", "table", "codec",
+    "cache", "tune", "profiling", "memoize", "normalization", "kernels", "precompile", "driver", "xc",
+    "trajectory"
+]
+
+_aliases = {"ref": "python_reference"}
+
+# Public classes by the submodule that defines them
+_classes = {"BasisSet": "basis", "CollocationCache": "cache", "BlockCodec": "codec", "FrameEvaluator": "trajectory"}
+
+__all__ = sorted(_submodules + list(_aliases) + list(_classes))
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module("." + name, __name__)
+
+    if name in _aliases:
+        ret = importlib.import_module("." + _aliases[name], __name__)
+    elif name in _classes:
+        ret = getattr(importlib.import_module("." + _classes[name], __name__), name)
+    else:
+        raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+
+    globals()[name] = ret
+    return ret
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
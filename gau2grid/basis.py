@@ -0,0 +1,247 @@
+"""
+A compact array-backed basis set container.
+"""
+
+import hashlib
+
+import numpy as np
+
+
+def _shell_nfunc(L, spherical):
+    """
+    Number of functions in shells of angular momentum L, works on arrays of L.
+    """
+    if spherical:
+        return 2 * L + 1
+    else:
+        return (L + 1) * (L + 2) // 2
+
+
+class BasisSet(object):
+    """
+    A basis set stored as flat NumPy arrays.
+
+    Parameters
+    ----------
+    centers : array_like
+        The (ncenter, 3) cartesian centers
+    shell_center : array_like
+        The (nshell) center index of each shell
+    am : array_like
+        The (nshell) angular momentum of each shell
+    prim_offsets : array_like
+        The (nshell + 1) offsets of each shell into the primitive arrays
+    exponents : array_like
+        The (nprim) exponents of all primitives
+    coefficients : array_like
+        The (nprim) contraction coefficients of all primitives
+    """
+
+    __slots__ = ["centers", "shell_center", "am", "prim_offsets", "exponents", "coefficients", "center_offsets",
+                 "center_shells"]
+
+    def __init__(self, centers, shell_center, am, prim_offsets, exponents, coefficients):
+
+        self.centers = np.asarray(centers, dtype=np.double).reshape(-1, 3)
+        self.shell_center = np.asarray(shell_center, dtype=int)
+        self.am = np.asarray(am, dtype=int)
+        self.prim_offsets = np.asarray(prim_offsets, dtype=int)
+        self.exponents = np.asarray(exponents, dtype=np.double)
+        self.coefficients = np.asarray(coefficients, dtype=np.double)
+
+        if (self.shell_center.shape[0] != self.am.shape[0]) or (self.prim_offsets.shape[0] != self.am.shape[0] + 1):
+            raise ValueError("BasisSet: shell_center, am, and prim_offsets do not describe the same shells")
+
+        if self.exponents.shape != self.coefficients.shape:
+            raise ValueError("BasisSet: exponents and coefficients must have the same length")
+
+        # Center to shell map in compressed row form
+        self.center_shells = np.argsort(self.shell_center, kind="mergesort")
+        counts = np.bincount(self.shell_center, minlength=self.centers.shape[0])
+        self.center_offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    @classmethod
+    def from_dict(cls, basis):
+        """
+        Builds a BasisSet from a list of shell dictionaries with "am", "coef", "exp", and "center" keys.
+        """
+
+        if len(basis) == 0:
+            raise ValueError("BasisSet: Cannot build an empty basis")
+
+        raw_centers = np.array([shell["center"] for shell in basis], dtype=np.double).reshape(-1, 3)
+        centers, first, shell_center = np.unique(raw_centers, axis=0, return_index=True, return_inverse=True)
+
+        # Keep the centers in order of appearance
+        appearance = np.argsort(first)
+        rank = np.empty_like(appearance)
+        rank[appearance] = np.arange(appearance.shape[0])
+
+        nprims = [len(shell["exp"]) for shell in basis]
+        for shell, nprim in zip(basis, nprims):
+            if len(shell["coef"]) != nprim:
+                raise ValueError("BasisSet: Shell has a different number of exponents and coefficients")
+
+        return cls(
+            centers=centers[appearance],
+            shell_center=rank[shell_center.ravel()],
+            am=[shell["am"] for shell in basis],
+            prim_offsets=np.concatenate(([0], np.cumsum(nprims))),
+            exponents=np.concatenate([np.asarray(shell["exp"], dtype=np.double) for shell in basis]),
+            coefficients=np.concatenate([np.asarray(shell["coef"], dtype=np.double) for shell in basis]))
+
+    def to_dict(self):
+        """
+        Returns the basis as a list of shell dictionaries with "am", "coef", "exp", and "center" keys.
+        """
+
+        return [self[x] for x in range(self.nshell)]
+
+    @property
+    def nshell(self):
+        return self.am.shape[0]
+
+    @property
+    def nprim(self):
+        return self.exponents.shape[0]
+
+    @property
+    def ncenter(self):
+        return self.centers.shape[0]
+
+    @property
+    def max_am(self):
+        return int(self.am.max())
+
+    @property
+    def shell_centers(self):
+        """
+        The (nshell, 3) center of each shell.
+        """
+        return self.centers[self.shell_center]
+
+    def nbf(self, spherical=True):
+        """
+        The number of basis functions.
+        """
+        return int(np.sum(_shell_nfunc(self.am, spherical)))
+
+    def function_offsets(self, spherical=True):
+        """
+        The (nshell + 1) offsets of each shell into the basis functions.
+        """
+        return np.concatenate(([0], np.cumsum(_shell_nfunc(self.am, spherical))))
+
+    def function_centers(self, spherical=True):
+        """
+        The (nbf) center index of each basis function.
+        """
+        return np.repeat(self.shell_center, _shell_nfunc(self.am, spherical))
+
+    def with_centers(self, centers):
+        """
+        Returns the basis on new (ncenter, 3) centers, such as another geometry of the same molecule. All shell data
+        are shared with this basis, not copied.
+        """
+
+        centers = np.asarray(centers, dtype=np.double)
+        if centers.shape != self.centers.shape:
+            raise ValueError("BasisSet: expected %s centers, found %s" % (str(self.centers.shape), str(centers.shape)))
+
+        ret = BasisSet.__new__(BasisSet)
+        for name in self.__slots__:
+            setattr(ret, name, getattr(self, name))
+        ret.centers = centers
+        return ret
+
+    def digest(self):
+        """
+        Returns a hex digest of the basis data, equal basis sets have equal digests.
+        """
+        h = hashlib.sha1()
+        for data in [self.centers, self.shell_center, self.am, self.prim_offsets, self.exponents, self.coefficients]:
+            h.update(np.ascontiguousarray(data).tobytes())
+        return h.hexdigest()
+
+    def shells_on_center(self, center):
+        """
+        Returns the shell indices that are located on a center.
+        """
+        return self.center_shells[self.center_offsets[center]:self.center_offsets[center + 1]]
+
+    def shell(self, idx):
+        """
+        Returns the (L, coeffs, exponents, center) of a shell to pass to the shell kernels, primitive data are views.
+        """
+        if idx < 0:
+            idx += self.nshell
+        pstart, pstop = self.prim_offsets[idx], self.prim_offsets[idx + 1]
+        return (int(self.am[idx]), self.coefficients[pstart:pstop], self.exponents[pstart:pstop],
+                self.centers[self.shell_center[idx]])
+
+    def padded_primitives(self, shells=None):
+        """
+        Returns the (nshell, max_nprim) coefficients and exponents of the shells for batched kernels, shorter
+        contractions are padded with zero coefficients and exponents.
+        """
+
+        if shells is None:
+            shells = np.arange(self.nshell)
+        shells = np.asarray(shells, dtype=int)
+
+        starts = self.prim_offsets[shells]
+        nprims = self.prim_offsets[shells + 1] - starts
+
+        cols = np.arange(nprims.max())
+        mask = cols < nprims[:, None]
+        idx = np.where(mask, starts[:, None] + cols, 0)
+
+        coeffs = np.where(mask, self.coefficients[idx], 0.0)
+        exponents = np.where(mask, self.exponents[idx], 0.0)
+        return coeffs, exponents
+
+    def __len__(self):
+        return self.nshell
+
+    def __iter__(self):
+        for x in range(self.nshell):
+            yield self[x]
+
+    def __getitem__(self, key):
+        """
+        Integer keys return a shell dictionary, slices return a BasisSet whose primitive arrays are views.
+        """
+
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.nshell)
+            if step != 1:
+                raise IndexError("BasisSet: Only contiguous slices are supported")
+            stop = max(start, stop)
+
+            pstart, pstop = self.prim_offsets[start], self.prim_offsets[stop]
+            return BasisSet(self.centers, self.shell_center[start:stop], self.am[start:stop],
+                            self.prim_offsets[start:stop + 1] - pstart, self.exponents[pstart:pstop],
+                            self.coefficients[pstart:pstop])
+
+        if (key < -self.nshell) or (key >= self.nshell):
+            raise IndexError("BasisSet: Shell index out of range")
+
+        L, coeffs, exponents, center = self.shell(key)
+        return {"am": L, "coef": coeffs, "exp": exponents, "center": center}
+
+    def __reduce__(self):
+        return (BasisSet, (self.centers, self.shell_center, self.am, self.prim_offsets, self.exponents,
+                           self.coefficients))
+
+    def __repr__(self):
+        return "BasisSet(nshell=%d, nprim=%d, ncenter=%d, max_am=%d)" % (self.nshell, self.nprim, self.ncenter,
+                                                                          self.max_am)
+
+
+def as_basis(basis):
+    """
+    Returns basis as a BasisSet, converting from the list of shell dictionaries format if needed.
+    """
+    if isinstance(basis, BasisSet):
+        return basis
+    return BasisSet.from_dict(basis)
@@ -0,0 +1,253 @@
+"""
+Benchmark runner of the collocation kernels and drivers.
+
+Runs the cases of the benchmarks package in the repository root, reports the throughput in points * functions per
+second and the peak memory of every case, saves the results as JSON, and compares them against a saved baseline:
+    python -m gau2grid.bench --suite quick --output results.json
+    python -m gau2grid.bench --suite quick --baseline results.json
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import basis as basis_set
+from . import driver
+from . import layout
+from . import screening
+from . import tune
+
+# Output tensors plus kernel scratch, an estimate used to skip cases that do not fit in memory
+_memory_factor = 3
+
+
+def case_id(case):
+    """
+    Returns a unique string naming a case, results are matched to baselines by it.
+    """
+    ret = "%s/%s" % (case["kind"], case["basis"])
+    if case["kind"] == "shell":
+        ret += "/L%d" % case["L"]
+    ret += "/n%d/g%d/%s/%s" % (case["npoints"], case["grad"], "sph" if case["spherical"] else "cart",
+                                case.get("backend", "numpy"))
+    if case["kind"] != "shell":
+        ret += "/b%d/t%d" % _driver_settings(case)
+    return ret
+
+
+def _driver_settings(case):
+    """
+    Returns the block_size and nthreads of a driver case, the untuned defaults if not given so that a tuned profile
+    never changes the results.
+    """
+    return (case.get("block_size", tune._defaults["block_size"]), case.get("nthreads", tune._defaults["nthreads"]))
+
+
+def grid(basis, npoints, seed=0):
+    """
+    Random points within 4 bohr of the basis centers sorted into compact blocks.
+    """
+    return tune.tuning_grid(basis, npoints, seed=seed)
+
+
+def _case_setup(case, basis_sets):
+    basis = basis_set.as_basis(basis_sets[case["basis"]])
+    xyz = grid(basis, case["npoints"])
+    backend = case.get("backend", "numpy")
+
+    if case["kind"] == "shell":
+        shell = int(np.flatnonzero(basis.am == case["L"])[0])
+        L, coeffs, exponents, center = basis.shell(shell)
+        kernel = driver.get_kernel(backend, L)
+        nfunc = basis_set._shell_nfunc(L, case["spherical"])
+
+        def func():
+            kernel(xyz, L, coeffs, exponents, center, grad=case["grad"], spherical=case["spherical"])
+    else:
+        index = screening.basis_index(basis, grad=case["grad"])
+        nfunc = basis.nbf(case["spherical"])
+        block_size, nthreads = _driver_settings(case)
+
+        def func():
+            driver.compute_basis_collocation(xyz, basis, grad=case["grad"], spherical=case["spherical"],
+                                             backend=backend, block_size=block_size, nthreads=nthreads, index=index)
+
+    return func, nfunc
+
+
+def run_case(case, basis_sets, repeats=3, max_memory=2 * 1024**3):
+    """
+    Runs a single case.
+
+    Returns
+    -------
+    result : dict
+        The case with the best "time" of repeats runs, the "throughput" in points * functions per second, and the
+        "peak_bytes" allocated during a run, or "skipped" if the case does not fit in max_memory
+    """
+
+    result = dict(case)
+    result["id"] = case_id(case)
+    if case["kind"] != "shell":
+        result["block_size"], result["nthreads"] = _driver_settings(case)
+
+    func, nfunc = _case_setup(case, basis_sets)
+    estimate = _memory_factor * layout.ncomponents(case["grad"]) * nfunc * case["npoints"] * 8
+    if estimate > max_memory:
+        result["skipped"] = "needs about %d MB" % (estimate // 1024**2)
+        return result
+
+    # Warm up kernel generation and caches
+    func()
+
+    best = float("inf")
+    for x in range(repeats):
+        t = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t)
+
+    # Peak memory in a separate run, tracing slows allocations down
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result["nfunc"] = nfunc
+    result["time"] = best
+    result["throughput"] = case["npoints"] * nfunc / best
+    result["peak_bytes"] = peak
+    return result
+
+
+def run(cases, basis_sets, repeats=3, max_memory=2 * 1024**3, stream=None):
+    """
+    Runs all cases and returns the results document, progress is printed to stream if given.
+    """
+
+    results = []
+    for case in cases:
+        result = run_case(case, basis_sets, repeats=repeats, max_memory=max_memory)
+        results.append(result)
+        if stream is not None:
+            stream.write(format_result(result) + "\n")
+            stream.flush()
+
+    return {"machine": tune.machine(), "results": results}
+
+
+def format_result(result):
+    """
+    Formats a result as a single line.
+    """
+    if "skipped" in result:
+        return "%-45s skipped, %s" % (result["id"], result["skipped"])
+
+    return "%-45s %10.4f s %10.3e pts*fn/s %9.1f MB" % (result["id"], result["time"], result["throughput"],
+                                                        result["peak_bytes"] / 1024**2)
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compares results against a baseline document.
+
+    Returns
+    -------
+    comparison : list of dict
+        The "id", "time", "baseline_time", "ratio" (time / baseline_time), and whether the case is a "regression"
+        (ratio above 1 + tolerance) of every case present in both documents
+    """
+
+    base = {result["id"]: result for result in baseline["results"] if "time" in result}
+
+    ret = []
+    for result in results["results"]:
+        if ("time" not in result) or (result["id"] not in base):
+            continue
+
+        ratio = result["time"] / base[result["id"]]["time"]
+        ret.append({
+            "id": result["id"],
+            "time": result["time"],
+            "baseline_time": base[result["id"]]["time"],
+            "ratio": ratio,
+            "regression": ratio > 1.0 + tolerance,
+        })
+
+    return ret
+
+
+def main(argv=None):
+    """
+    The command line interface, returns 1 if a regression against the baseline was found and 0 otherwise.
+    """
+
+    parser = argparse.ArgumentParser(prog="python -m gau2grid.bench", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--suite", default="quick", help="the benchmark suite, quick or full")
+    parser.add_argument("--kind", nargs="+", default=["shell", "basis"], help="shell and/or basis cases")
+    parser.add_argument("--basis", nargs="+", help="restrict to these basis sets")
+    parser.add_argument("--L", nargs="+", type=int, help="restrict the shell cases to these angular momenta")
+    parser.add_argument("--npoints", nargs="+", type=int, help="restrict to these grid sizes")
+    parser.add_argument("--grad", nargs="+", type=int, help="restrict to these derivative levels")
+    parser.add_argument("--cartesian", action="store_true", help="only cartesian functions")
+    parser.add_argument("--backend", default="numpy", help="the kernel backend")
+    parser.add_argument("--block-size", type=int, help="the block size of the basis cases")
+    parser.add_argument("--nthreads", type=int, help="the thread count of the basis cases")
+    parser.add_argument("--repeats", type=int, default=3, help="the best of this many runs is reported")
+    parser.add_argument("--max-memory", type=float, default=2.0, help="skip cases needing more GB than this")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON results file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="slowdown ratio above 1 counted a regression")
+    args = parser.parse_args(argv)
+
+    try:
+        import benchmarks
+    except ImportError:
+        parser.error("the benchmarks package was not found, run from the root of the gau2grid repository")
+
+    cases = benchmarks.suite(
+        args.suite,
+        kinds=args.kind,
+        basis=args.basis,
+        L=args.L,
+        npoints=args.npoints,
+        grad=args.grad,
+        spherical=[False] if args.cartesian else None,
+        block_size=args.block_size,
+        nthreads=args.nthreads)
+    for case in cases:
+        case["backend"] = args.backend
+
+    results = run(
+        cases,
+        benchmarks.basis_sets(),
+        repeats=args.repeats,
+        max_memory=args.max_memory * 1024**3,
+        stream=sys.stdout)
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as handle:
+            baseline = json.load(handle)
+
+        comparison = compare(results, baseline, tolerance=args.tolerance)
+        print("")
+        print("%-45s %10s %10s %7s" % ("Case", "Time", "Baseline", "Ratio"))
+        for item in comparison:
+            print("%-45s %10.4f %10.4f %7.2f%s" % (item["id"], item["time"], item["baseline_time"], item["ratio"],
+                                                  "  REGRESSION" if item["regression"] else ""))
+
+        if any(item["regression"] for item in comparison):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+A cache of collocation blocks for repeated evaluations on a fixed grid and basis, such as the iterations of an SCF.
+"""
+
+import collections
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+
+
+class CollocationCache(object):
+    """
+    A least recently used cache of collocation blocks with a memory budget.
+
+    Blocks are stored under (basis digest, block id, grad, spherical, ...) keys, see block_key. When the blocks held
+    in memory exceed max_bytes the least recently used blocks are evicted, either dropped or, if spill_dir is given,
+    written to that directory and reloaded on their next use.
+
+    All operations are thread-safe. Blocks may be stored compressed by a codec, see codec.BlockCodec, the budget
+    then applies to the compressed size.
+
+    The counters in stats() compare the average time to load a block with the average time to compute one, caching
+    only pays off while reloading stays cheaper than recomputing.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The memory budget of the blocks held in memory
+    spill_dir : str, optional
+        A local directory evicted blocks are written to, evicted blocks are dropped if None
+    codec : BlockCodec, optional
+        Compresses the stored blocks, blocks are stored as copies if None
+    """
+
+    def __init__(self, max_bytes=(1 << 30), spill_dir=None, codec=None):
+
+        self.max_bytes = int(max_bytes)
+        self.codec = codec
+        self.spill_dir = spill_dir
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._blocks = collections.OrderedDict()
+        self._spilled = {}
+        self.nbytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spills = 0
+        self.load_time = 0.0
+        self.compute_time = 0.0
+
+    @staticmethod
+    def block_key(basis_digest, block, grad, spherical, *args):
+        """
+        Returns the key of a block of points, the block id is a digest of its coordinates. Any further arguments that
+        change the values, such as the cartesian order, are appended to the key.
+        """
+        block_id = hashlib.sha1(np.ascontiguousarray(block).tobytes()).hexdigest()
+        return (basis_digest, block_id, int(grad), bool(spherical)) + tuple(args)
+
+    def __len__(self):
+        return len(self._blocks) + len(self._spilled)
+
+    def __contains__(self, key):
+        return (key in self._blocks) or (key in self._spilled)
+
+    def get(self, key, out=None):
+        """
+        Returns the block stored under key, written to out if given, or None if the block is not cached.
+        """
+
+        t = time.perf_counter()
+        with self._lock:
+            if key in self._blocks:
+                self._blocks.move_to_end(key)
+                data = self._blocks[key]
+                self.hits += 1
+            elif key in self._spilled:
+                filename = self._spilled.pop(key)
+                if self.codec is None:
+                    data = np.load(filename)
+                else:
+                    with open(filename, "rb") as handle:
+                        data = pickle.load(handle)
+                os.remove(filename)
+                self.disk_hits += 1
+                self._insert(key, data)
+            else:
+                self.misses += 1
+                return None
+
+        # Stored blocks are never modified, they are copied out without the lock so callers never hold them
+        if self.codec is not None:
+            data = self.codec.decode(data, out=out)
+        elif out is not None:
+            out[...] = data
+            data = out
+        else:
+            data = data.copy()
+
+        with self._lock:
+            self.load_time += time.perf_counter() - t
+        return data
+
+    def put(self, key, data, compute_time=0.0):
+        """
+        Stores a copy of the block data under key, compute_time is the time it took to compute the block.
+        """
+
+        if self.codec is None:
+            data = np.array(data)
+        else:
+            data = self.codec.encode(data)
+
+        with self._lock:
+            self.compute_time += compute_time
+            self.discard(key)
+            self._insert(key, data)
+
+    def discard(self, key):
+        """
+        Removes a block from the cache.
+        """
+        with self._lock:
+            if key in self._blocks:
+                self.nbytes -= self._blocks.pop(key).nbytes
+            elif key in self._spilled:
+                os.remove(self._spilled.pop(key))
+
+    def clear(self):
+        """
+        Removes all blocks from the cache, the counters are kept.
+        """
+        with self._lock:
+            for key in list(self._spilled):
+                self.discard(key)
+            self._blocks.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """
+        Returns the cache counters and the average load and compute times of a block.
+        """
+
+        with self._lock:
+            loads = self.hits + self.disk_hits
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "spills": self.spills,
+                "blocks": len(self._blocks),
+                "spilled_blocks": len(self._spilled),
+                "nbytes": self.nbytes,
+                "load_time": (self.load_time / loads) if loads else 0.0,
+                "compute_time": (self.compute_time / self.misses) if self.misses else 0.0,
+            }
+
+    def _insert(self, key, data):
+        # Blocks larger than the budget are never held
+        if data.nbytes > self.max_bytes:
+            self._evict(key, data)
+            return
+
+        self._blocks[key] = data
+        self.nbytes += data.nbytes
+        while self.nbytes > self.max_bytes:
+            old_key, old_data = self._blocks.popitem(last=False)
+            self.nbytes -= old_data.nbytes
+            self._evict(old_key, old_data)
+
+    def _evict(self, key, data):
+        self.evictions += 1
+        if self.spill_dir is None:
+            return
+
+        filename = os.path.join(self.spill_dir, hashlib.sha1(repr(key).encode()).hexdigest())
+        if self.codec is None:
+            filename += ".npy"
+            np.save(filename, data)
+        else:
+            filename += ".pkl"
+            with open(filename, "wb") as handle:
+                pickle.dump(data, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spilled[key] = filename
+        self.spills += 1
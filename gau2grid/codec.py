@@ -0,0 +1,124 @@
+"""
+Compressed storage of collocation blocks.
+
+Collocation blocks are mostly zeros (screened shells) and small magnitude values. A block is stored as integers
+quantized against a scale per row (each function of each component), values below the quantization step become
+exact zeros, and the integers are optionally compressed with zlib.
+"""
+
+import zlib
+
+import numpy as np
+
+# Integer types the quantized values are stored in, the smallest holding the quantization range is used
+_quantized_types = [np.int8, np.int16, np.int32, np.int64]
+
+# Quantization beyond the 53 bit mantissa of a double is lossless storage
+_max_steps = 2**52
+
+
+class EncodedBlock(object):
+    """
+    A compressed block, see BlockCodec.
+    """
+
+    __slots__ = ["shape", "dtype", "rows", "steps", "payload"]
+
+    def __init__(self, shape, dtype, rows, steps, payload):
+        self.shape = shape
+        self.dtype = dtype
+        self.rows = rows
+        self.steps = steps
+        self.payload = payload
+
+    @property
+    def nbytes(self):
+        ret = len(self.payload) + self.rows.nbytes
+        if self.steps is not None:
+            ret += self.steps.nbytes
+        return ret
+
+
+class BlockCodec(object):
+    """
+    Encodes (..., npoints) blocks to within an absolute error of tol times the largest magnitude of each row.
+
+    Every row is divided into steps of 2 * tol * max|row| and stored in the smallest integer type holding its
+    range, e.g. int16 for tol >= 1.5e-5 and int32 for tol >= 2.4e-10. Tolerances below 2^-53, or tol=None, store
+    the doubles themselves and the codec is lossless. Rows that are entirely zero, the screened shells, are not
+    stored in either case.
+
+    Parameters
+    ----------
+    tol : float, optional
+        The error bound relative to the largest magnitude of each row, lossless if None
+    level : int
+        The zlib compression level, 0 skips zlib. Decoding without zlib is several times faster and much faster than
+        recomputing a block, zlib only pays off when memory or disk space is the bottleneck
+    """
+
+    def __init__(self, tol=1.e-9, level=0):
+
+        if (tol is not None) and not (0.0 < tol < 1.0):
+            raise ValueError("BlockCodec: tol must be between 0 and 1, found %s" % str(tol))
+
+        self.tol = tol
+        self.level = level
+
+        self.dtype = None
+        if tol is not None:
+            nsteps = int(np.ceil(0.5 / tol))
+            for dtype in _quantized_types:
+                if nsteps > _max_steps:
+                    break
+                if nsteps <= np.iinfo(dtype).max:
+                    self.dtype = dtype
+                    break
+
+    def encode(self, data):
+        """
+        Compresses an array into an EncodedBlock.
+        """
+
+        data = np.asarray(data, dtype=np.double)
+        flat = data.reshape(-1, data.shape[-1])
+
+        # Only the rows with a nonzero value are kept
+        amax = np.abs(flat).max(axis=-1)
+        rows = np.flatnonzero(amax).astype(np.int32)
+        flat = flat[rows]
+
+        if self.dtype is None:
+            return EncodedBlock(data.shape, np.double, rows, None, self._compress(flat))
+
+        # Values are multiples of a step of 2 * tol * max|row|
+        steps = amax[rows, None] * (2.0 * self.tol)
+        quantized = np.rint(flat / steps).astype(self.dtype)
+
+        return EncodedBlock(data.shape, self.dtype, rows, steps, self._compress(quantized))
+
+    def _compress(self, data):
+        if self.level:
+            return zlib.compress(data.tobytes(), self.level)
+        return data.tobytes()
+
+    def decode(self, block, out=None):
+        """
+        Decompresses an EncodedBlock, writing to out if given.
+        """
+
+        if out is None:
+            out = np.zeros(block.shape)
+        else:
+            out[...] = 0.0
+
+        payload = block.payload
+        if self.level:
+            payload = zlib.decompress(payload)
+
+        data = np.frombuffer(payload, dtype=block.dtype).reshape(-1, block.shape[-1])
+        if block.steps is not None:
+            data = data * block.steps
+
+        out[np.unravel_index(block.rows, block.shape[:-1])] = data
+        return out
@@ -0,0 +1,416 @@
+"""
+Basis-level collocation drivers built on top of the shell kernels.
+"""
+
+import concurrent.futures
+import time
+
+import numpy as np
+
+from . import basis as basis_set
+from . import generator
+from . import layout as output_layout
+from . import normalization as norm
+from . import profiling
+from . import screening
+from . import table
+from . import tune
+
+_backends = ["numpy", "table", "reference"]
+
+# Backends whose kernels evaluate (nshell, 3) centers and padded (nshell, nprim) primitives in a single call
+_batched_backends = ["numpy", "table"]
+
+
+def get_kernel(backend,
+               L,
+               cart_order="row",
+               profile=False,
+               spherical_order="gaussian",
+               normalization="none",
+               components=None):
+    """
+    Returns a shell kernel for angular momenta up to L with the signature:
+        kernel(xyz, L, coeffs, exponents, center, grad=0, spherical=True, out=None, xyz_soa=False, exp_atol=None)
+
+    Kernels of batched backends also accept (nshell, 3) centers and (nshell, nprim) padded primitives of many
+    shells of the same L and return (nshell, nfunc, npoints) arrays. Every kernel truncates the primitive
+    exponentials below exp_atol to zero, see radial.exp_cutoff. With profile=True the generated kernels are
+    instrumented for profiling.py, the other backends always record their stages to an active profiler. All
+    kernels write their components in cart_order and spherical_order, see order.py, normalized by the
+    normalization convention, see normalization.py.
+
+    Kernels compute all components through grad = 3, or only a selection of components if given, in which case the
+    grad argument is ignored and the output holds the selected components in order, see layout.select_components.
+    """
+
+    norm.check_convention(normalization)
+    if components is not None:
+        components = output_layout.select_components(components)[0]
+
+    if backend == "numpy":
+        return generator.numpy_kernel(L, cart_order, "power", bool(profile), spherical_order, normalization,
+                                      components)
+    elif backend == "reference":
+        # The reference implementation is only loaded when used
+        from . import python_reference
+
+        def reference_kernel(xyz,
+                             L,
+                             coeffs,
+                             exponents,
+                             center,
+                             grad=0,
+                             spherical=True,
+                             out=None,
+                             xyz_soa=False,
+                             exp_atol=None):
+            return python_reference.compute_collocation(
+                xyz,
+                L,
+                coeffs,
+                exponents,
+                center,
+                grad=grad,
+                spherical=spherical,
+                cart_order=cart_order,
+                out=out,
+                xyz_soa=xyz_soa,
+                spherical_order=spherical_order,
+                normalization=normalization,
+                components=components,
+                exp_atol=exp_atol)
+
+        return reference_kernel
+    elif backend == "table":
+
+        def table_kernel(xyz,
+                         L,
+                         coeffs,
+                         exponents,
+                         center,
+                         grad=0,
+                         spherical=True,
+                         out=None,
+                         xyz_soa=False,
+                         exp_atol=None):
+            return table.compute_collocation(
+                xyz,
+                L,
+                coeffs,
+                exponents,
+                center,
+                grad=grad,
+                spherical=spherical,
+                cart_order=cart_order,
+                out=out,
+                xyz_soa=xyz_soa,
+                exp_atol=exp_atol,
+                spherical_order=spherical_order,
+                normalization=normalization,
+                components=components)
+
+        return table_kernel
+    else:
+        raise KeyError("Backend '%s' not understood, available backends: %s" % (backend, ", ".join(_backends)))
+
+
+def compute_basis_collocation(xyz,
+                              basis,
+                              grad=0,
+                              spherical=True,
+                              cart_order="row",
+                              spherical_order="gaussian",
+                              normalization="none",
+                              backend=None,
+                              block_size=None,
+                              threshold=1.e-14,
+                              index=None,
+                              layout="component",
+                              order="C",
+                              out=None,
+                              xyz_soa=False,
+                              exp_atol=None,
+                              cache=None,
+                              nthreads=None,
+                              components=None):
+    """
+    Computes the collocation matrix of an entire basis on a set of points.
+
+    The points are processed in consecutive blocks of block_size, for each block only the shells whose extent
+    (see screening.shell_cutoff_radius) reaches the block are evaluated, all other values are left as zero.
+    Blocks should be spatially compact for the screening to be effective, as DFT grid blocks are. For batched
+    backends all significant shells of the same L in a block are evaluated in a single kernel call. Blocks are
+    distributed over nthreads threads, NumPy releases the GIL in its array operations.
+
+    The backend, block_size, and nthreads left as None are taken from the tuned profile of the machine if there is
+    one, and otherwise default to "numpy", 128, and 1, see tune.py. A tuned profile may pick a backend per L.
+
+    While a profiler is active instrumented kernels are used and the driver records its "screening", "scatter",
+    and "cache" stages and counts the blocks, points, and computed and screened shells, see profiling.py.
+
+    Parameters
+    ----------
+    xyz : array_like
+        The (N, 3) cartesian points to compute the grid on, or (3, N) if xyz_soa (see layout.grid_soa)
+    basis : BasisSet or list of dict
+        The basis, either as a BasisSet or as shells with "am", "coef", "exp", and "center" keys
+    grad : int
+        The derivative level to compute, through third derivatives
+    spherical : bool
+        Transform the shells to spherical harmonics or not
+    cart_order : str
+        The cartesian ordering of the shells, see order.py
+    spherical_order : str
+        The spherical ordering of the shells, see order.py
+    normalization : str
+        The normalization convention, see normalization.py. With "full" the coefficients of the basis are the raw
+        contraction coefficients, they are normalized once for the entire computation
+    backend : str or list of str, optional
+        The shell kernel used, "numpy" (generated), "table" (table-driven, best at high L), or "reference", or a
+        list of the kernel of each L
+    block_size : int, optional
+        The number of points in each block
+    threshold : float
+        The screening threshold of the shell extents
+    index : ShellIndex, optional
+        A prebuilt index of the basis to skip the cutoff radii construction
+    layout : str
+        The storage layout of the output tensor, "component" or "points", see layout.py
+    order : str
+        The memory order of the output tensor, "C" or "F"
+    out : array_like, optional
+        A zeroed output storage tensor in the given layout, see layout.allocate
+    xyz_soa : bool
+        If True xyz is a (3, N) structure-of-arrays block, every point block is then a set of contiguous rows
+    exp_atol : float, optional
+        Truncate the primitive exponentials below this absolute value, their peak being one, to zero, e.g. 1.e-6 in
+        early SCF iterations. Primitives truncated on a whole block are skipped, see radial.radial_derivatives.
+        Exact if None
+    cache : CollocationCache, optional
+        A cache of the (ncomp, nbf, npoints) blocks of the output, blocks found in the cache are copied instead of
+        computed and computed blocks are added to it. Blocks are identified by their coordinates, see cache.py
+    nthreads : int, optional
+        The number of threads computing blocks
+    components : tuple of str, optional
+        Only compute this selection of components, such as ("PHI", "PHI_XXX"), grad is then set by the selection
+        and the output tensor holds the selected components in order, see layout.select_components
+
+    Returns
+    -------
+    output : dict of array_like
+        The (nbf, N) collocation matrices as views into the output tensor
+    """
+
+    if xyz_soa:
+        npoints = xyz[0].shape[0]
+    else:
+        npoints = xyz.shape[0]
+
+    # Shell metadata, kernels, and settings, the contraction normalization is folded into the coefficients once
+    kernel = BlockKernel(basis, grad=grad, spherical=spherical, cart_order=cart_order, spherical_order=spherical_order,
+                         normalization=normalization, backend=backend, block_size=block_size, nthreads=nthreads,
+                         exp_atol=exp_atol, components=components)
+    basis = kernel.basis
+    grad = kernel.grad
+    components = kernel.components
+    block_size = kernel.block_size
+    nthreads = kernel.nthreads
+    offsets = kernel.offsets
+    nbf = offsets[-1]
+
+    if index is None:
+        index = screening.basis_index(basis, threshold=threshold, grad=grad)
+
+    prof = profiling.current()
+
+    if out is None:
+        out = output_layout.allocate(nbf, npoints, grad, layout=layout, order=order, components=components)
+    tensor = output_layout.logical_view(out, layout)
+
+    if cache is not None:
+        basis_digest = basis.digest()
+
+    def compute_block(start):
+        stop = min(start + block_size, npoints)
+        if xyz_soa:
+            block = tuple(x[start:stop] for x in xyz)
+        else:
+            block = xyz[start:stop]
+
+        if prof is not None:
+            prof.count(blocks=1, points=stop - start)
+            tic = prof.start()
+
+        if cache is not None:
+            key = cache.block_key(basis_digest, block, grad, spherical, cart_order, spherical_order, normalization,
+                                  threshold, exp_atol, components)
+            found = cache.get(key, out=tensor[:, :, start:stop]) is not None
+            if prof is not None:
+                prof.count(cache_hits=int(found), cache_misses=int(not found))
+                prof.record("cache", tic)
+            if found:
+                return
+            t = time.perf_counter()
+
+        if prof is not None:
+            tic = prof.start()
+        shells = index.significant_shells(block, xyz_soa=xyz_soa)
+        if prof is not None:
+            prof.count(shells_computed=shells.shape[0], shells_screened=basis.nshell - shells.shape[0])
+            prof.record("screening", tic)
+
+        kernel(block, shells, xyz_soa=xyz_soa, out=tensor[:, :, start:stop], rows=offsets[shells])
+
+        if cache is not None:
+            if prof is not None:
+                tic = prof.start()
+            cache.put(key, tensor[:, :, start:stop], compute_time=time.perf_counter() - t)
+            if prof is not None:
+                prof.record("cache", tic)
+
+    # Blocks write disjoint columns of the output
+    starts = range(0, npoints, block_size)
+    if nthreads > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=nthreads) as executor:
+            list(executor.map(profiling.propagate(compute_block), starts))
+    else:
+        for start in starts:
+            compute_block(start)
+
+    return output_layout.output_dict(tensor, grad, components)
+
+
+class BlockKernel(object):
+    """
+    Evaluates a selection of shells, such as the significant shells of a block of points, into a compact
+    (ncomp, nfunc, npoints) tensor that only holds the functions of those shells. The fused drivers are built on it
+    and never store the collocation of the entire basis.
+
+    The kernels, backends, and function offsets are resolved once on construction, see compute_basis_collocation
+    for the parameters. With normalization="full" the coefficients of the basis are normalized once, self.basis
+    holds the normalized basis.
+    """
+
+    def __init__(self,
+                 basis,
+                 grad=0,
+                 spherical=True,
+                 cart_order="row",
+                 spherical_order="gaussian",
+                 normalization="none",
+                 backend=None,
+                 block_size=None,
+                 nthreads=None,
+                 exp_atol=None,
+                 components=None):
+
+        basis = basis_set.as_basis(basis)
+        if normalization == "full":
+            basis = norm.normalize_basis(basis)
+        kernel_normalization = norm.kernel_convention(normalization, spherical)
+
+        if components is not None:
+            components, grad = output_layout.select_components(components)
+
+        self.basis = basis
+        self.grad = grad
+        self.spherical = spherical
+        self.exp_atol = exp_atol
+        self.components = components
+        self.ncomp = output_layout.ncomponents(grad, components)
+        self.offsets = basis.function_offsets(spherical)
+        self.nfunc = np.diff(self.offsets)
+
+        self.backends, self.block_size, self.nthreads = tune.driver_settings(grad, basis.max_am, backend, block_size,
+                                                                             nthreads)
+        prof = profiling.current()
+        self.kernels = {
+            name: get_kernel(name,
+                             basis.max_am,
+                             cart_order,
+                             profile=prof is not None,
+                             spherical_order=spherical_order,
+                             normalization=kernel_normalization,
+                             components=components)
+            for name in set(self.backends)
+        }
+        self.batched = all(name in _batched_backends for name in self.backends)
+
+    def functions(self, shells):
+        """
+        Returns the basis function index of each row of the compact tensor of shells.
+        """
+        shells = np.asarray(shells, dtype=int)
+        nfunc = self.nfunc[shells]
+        starts = np.repeat(self.offsets[shells] - np.cumsum(nfunc) + nfunc, nfunc)
+        return starts + np.arange(int(nfunc.sum()))
+
+    def __call__(self, block, shells, shell_centers=None, xyz_soa=False, out=None, rows=None):
+        """
+        Computes the compact collocation of shells on a block of points, or writes it into given rows of out.
+
+        Parameters
+        ----------
+        block : array_like
+            The (N, 3) points, or (3, N) if xyz_soa
+        shells : array_like
+            The shell indices to evaluate
+        shell_centers : array_like, optional
+            The (nshell, 3) centers of all shells of the basis, such as those of another geometry, the centers of
+            the basis if None
+        xyz_soa : bool
+            If True block is a (3, N) structure-of-arrays block
+        out : array_like, optional
+            The (ncomp, nfunc, N) tensor to write to
+        rows : array_like, optional
+            The first row of out of each shell, such as the function offsets of the shells to write into the
+            (ncomp, nbf, N) tensor of the entire basis, the compact rows if None
+
+        Returns
+        -------
+        tensor : array_like
+            The (ncomp, nfunc, N) collocation of the functions of shells, in the order of functions(shells)
+        """
+
+        shells = np.asarray(shells, dtype=int)
+        npoints = block[0].shape[0] if xyz_soa else block.shape[0]
+        if shell_centers is None:
+            shell_centers = self.basis.shell_centers
+
+        nfunc = self.nfunc[shells]
+        if rows is None:
+            rows = np.cumsum(nfunc) - nfunc
+        if out is None:
+            out = np.empty((self.ncomp, int(nfunc.sum()), npoints))
+
+        basis = self.basis
+        if not self.batched:
+            for shell, row, shell_nfunc in zip(shells, rows, nfunc):
+                L, coeffs, exponents, center = basis.shell(shell)
+                self.kernels[self.backends[L]](block, L, coeffs, exponents, shell_centers[shell], grad=self.grad,
+                                               spherical=self.spherical, out=out[:, row:row + shell_nfunc],
+                                               xyz_soa=xyz_soa, exp_atol=self.exp_atol)
+            return out
+
+        prof = profiling.current()
+        shell_am = basis.am[shells]
+        for L in np.unique(shell_am):
+            mask = shell_am == L
+            batch = shells[mask]
+            coeffs, exponents = basis.padded_primitives(batch)
+            batch_nfunc = nfunc[mask][0]
+
+            batch_out = np.empty((self.ncomp, batch.shape[0], batch_nfunc, npoints))
+            self.kernels[self.backends[L]](block, int(L), coeffs, exponents, shell_centers[batch], grad=self.grad,
+                                           spherical=self.spherical, out=batch_out, xyz_soa=xyz_soa,
+                                           exp_atol=self.exp_atol)
+
+            if prof is not None:
+                tic = prof.start()
+            batch_rows = (rows[mask][:, None] + np.arange(batch_nfunc)).ravel()
+            out[:, batch_rows] = batch_out.reshape(self.ncomp, -1, npoints)
+            if prof is not None:
+                prof.record("scatter", tic)
+
+        return out
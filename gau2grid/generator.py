@@ -2,16 +2,83 @@
 This is a Python-based automatic generator.
 """
 
+import linecache
+
 import numpy as np
 
+from . import kernels
+from . import layout
+from . import memoize
+from . import normalization as norm
 from . import order
 from . import RSH
 
-
-def numpy_generator(L, function_name="generated_compute_numpy_shells", cart_order="row"):
+_monomial_modes = ["power", "recurrence"]
+
+# The derivatives of the radial part S by derivative level, in terms of the radial derivatives V1 .. V4
+_radial_derivatives = [
+    [("S0", "V1")],
+    [("SX", "V2 * xc"), ("SY", "V2 * yc"), ("SZ", "V2 * zc")],
+    [
+        ("SXY", "V3 * xc * yc"),
+        ("SXZ", "V3 * xc * zc"),
+        ("SYZ", "V3 * yc * zc"),
+        ("SXX", "V3 * xc * xc + V2"),
+        ("SYY", "V3 * yc * yc + V2"),
+        ("SZZ", "V3 * zc * zc + V2"),
+    ],
+    [
+        ("SXXX", "V4 * xc * xc * xc + 3.0 * V3 * xc"),
+        ("SXXY", "V4 * xc * xc * yc + V3 * yc"),
+        ("SXXZ", "V4 * xc * xc * zc + V3 * zc"),
+        ("SXYY", "V4 * xc * yc * yc + V3 * xc"),
+        ("SXYZ", "V4 * xc * yc * zc"),
+        ("SXZZ", "V4 * xc * zc * zc + V3 * xc"),
+        ("SYYY", "V4 * yc * yc * yc + 3.0 * V3 * yc"),
+        ("SYYZ", "V4 * yc * yc * zc + V3 * zc"),
+        ("SYZZ", "V4 * yc * zc * zc + V3 * yc"),
+        ("SZZZ", "V4 * zc * zc * zc + 3.0 * V3 * zc"),
+    ],
+]
+
+
+def numpy_generator(L,
+                    function_name="generated_compute_numpy_shells",
+                    cart_order="row",
+                    monomials="power",
+                    profile=False,
+                    spherical_order="gaussian",
+                    normalization="none",
+                    components=None):
     """
+    Generates the source of a NumPy collocation kernel for angular momenta up to L.
+
+    The kernel writes every component into a single (ncomp, nfunc, npoints) tensor, either the (possibly strided)
+    out array given by the caller or a new C-ordered tensor, and returns a dictionary of views into it.
+
+    The Cartesian monomials x^l y^m z^n are built either as products of rows of per-direction power tables
+    (monomials="power", up to two multiplies each) or from a monomial of one lower degree by a single multiply
+    (monomials="recurrence"), lower degree monomials are then shared with the derivative terms.
+
+    The Cartesian and spherical components are written directly in cart_order and spherical_order, see order.py.
+    The Cartesian scaling of the normalization convention is folded into the constants of the Cartesian rows and
+    the spherical transformation, "full" kernels also normalize the contraction coefficients of every call, see
+    normalization.py.
+
+    If profile is True the kernel records the time of each of its stages to the active profiler, see profiling.py.
+
+    Derivatives are generated through grad = 3. If components is a selection of component names, see
+    layout.select_components, the kernel only computes those components and only the radial derivatives they
+    need, into a (len(components), nfunc, npoints) tensor. The grad argument of such kernels is ignored.
     """
 
+    if monomials not in _monomial_modes:
+        raise KeyError("Monomial mode '%s' not understood, available modes: %s" % (monomials,
+                                                                                   ", ".join(_monomial_modes)))
+    norm.check_convention(normalization)
+    if components is not None:
+        components, selected_grad = layout.select_components(components)
+
     # Builds a few tmps
     s1 = "    "
     s2 = "    " * 2
@@ -19,255 +86,467 @@ def numpy_generator(L, function_name="generated_compute_numpy_shells", cart_orde
 
     # Function definition
     ret = []
-    ret.append("def %s(xyz, L, coeffs, exponents, center, grad=2, spherical=True):" % function_name)
+
+    def record(stage):
+        if profile:
+            ret.append(s1 + "if prof is not None:")
+            ret.append(s1 + "    tic = prof.record(%s, tic)" % repr(stage))
+
+    ret.append("def %s(xyz, L, coeffs, exponents, center, grad=2, spherical=True, out=None, xyz_soa=False, "
+               "exp_atol=None):" % function_name)
 
     ret.append("")
     ret.append(s1 + "# Make sure NumPy is in locals")
     ret.append(s1 + "import numpy as np")
+    ret.append(s1 + "from gau2grid import radial")
+    if components is not None:
+        ret.append(s1 + "grad = %d" % selected_grad)
+    if profile:
+        ret.append(s1 + "from gau2grid import profiling")
+        ret.append(s1 + "prof = profiling.current()")
+        ret.append(s1 + "if prof is not None:")
+        ret.append(s1 + "    tic = prof.start()")
     ret.append("")
 
-    ret.append(s1 + "# Unpack shell data")
-    ret.append(s1 + "nprim = len(coeffs)")
-    ret.append(s1 + "npoints = xyz.shape[0]")
+    ret.append(s1 + "# Unpack shell data, (nshell, 3) centers and (nshell, nprim) primitives batch same L shells")
+    ret.append(s1 + "center = np.asarray(center)")
+    ret.append(s1 + "coeffs = np.asarray(coeffs)")
+    ret.append(s1 + "exponents = np.asarray(exponents)")
+    if normalization == "full":
+        ret.append(s1 + "from gau2grid import normalization")
+        ret.append(s1 + "coeffs = normalization.contraction_coefficients(L, coeffs, exponents)")
     ret.append("")
 
-    ret.append(s1 + "# First compute the diff distance in each cartesian")
-    ret.append(s1 + "xc = xyz[:, 0] - center[0]")
-    ret.append(s1 + "yc = xyz[:, 1] - center[1]")
-    ret.append(s1 + "zc = xyz[:, 2] - center[2]")
+    ret.append(s1 + "# First compute the diff distance in each cartesian, (3, N) or (x, y, z) input is contiguous")
+    ret.append(s1 + "if xyz_soa:")
+    ret.append(s1 + "    xc = xyz[0] - center[..., 0, None]")
+    ret.append(s1 + "    yc = xyz[1] - center[..., 1, None]")
+    ret.append(s1 + "    zc = xyz[2] - center[..., 2, None]")
+    ret.append(s1 + "else:")
+    ret.append(s1 + "    xc = xyz[:, 0] - center[..., 0, None]")
+    ret.append(s1 + "    yc = xyz[:, 1] - center[..., 1, None]")
+    ret.append(s1 + "    zc = xyz[:, 2] - center[..., 2, None]")
+    ret.append(s1 + "npoints = xc.shape[-1]")
     ret.append(s1 + "R2 = xc * xc + yc * yc + zc * zc")
+    if profile:
+        ret.append(s1 + "if prof is not None:")
+        ret.append(s1 + "    nshell = R2.size // max(npoints, 1)")
+        ret.append(s1 + "    prof.count(kernel_calls=1, shells=nshell, shell_points=nshell * npoints)")
+        ret.append(s1 + "    tic = prof.record('distance', tic)")
     ret.append("")
 
     # All gaussian derivatives
-    ret.append(s1 + "# Build up the derivates in each direction")
-    ret.append(s1 + "V1 = np.zeros((npoints))")
-    ret.append(s1 + "V2 = np.zeros((npoints))")
-    ret.append(s1 + "V3 = np.zeros((npoints))")
-    ret.append(s1 + "for K in range(nprim):")
-    ret.append(s1 + "    T1 = coeffs[K] * np.exp(-exponents[K] * R2)")
-    ret.append(s1 + "    T2 = -2.0 * exponents[K] * T1")
-    ret.append(s1 + "    T3 = -2.0 * exponents[K] * T2")
-    ret.append(s1 + "    V1 += T1")
-    ret.append(s1 + "    V2 += T2")
-    ret.append(s1 + "    V3 += T3")
+    ret.append(s1 + "# Build up the derivates in each direction, all primitives at once")
+    ret.append(s1 + "V = radial.radial_derivatives(R2, coeffs, exponents, min(grad, %d), exp_atol=exp_atol)" %
+               layout.max_grad)
+    ret.append(s1 + "V1 = V[0]")
+    for level in range(1, layout.max_grad + 1):
+        ret.append(s1 + "if grad > %d:" % (level - 1))
+        ret.append(s1 + "    V%d = V[%d]" % (level + 1, level))
+    record("radial")
     ret.append("")
-    ret.append(s1 + "S0 = V1.copy()")
-    ret.append(s1 + "SX = V2 * xc")
-    ret.append(s1 + "SY = V2 * yc")
-    ret.append(s1 + "SZ = V2 * zc")
-    ret.append(s1 + "SXY = V3 * xc * yc")
-    ret.append(s1 + "SXZ = V3 * xc * zc")
-    ret.append(s1 + "SYZ = V3 * yc * zc")
-    ret.append(s1 + "SXX = V3 * xc * xc + V2")
-    ret.append(s1 + "SYY = V3 * yc * yc + V2")
-    ret.append(s1 + "SZZ = V3 * zc * zc + V2")
+    if components is None:
+        ret.append(s1 + "S0 = V1")
+        for level in range(1, layout.max_grad + 1):
+            ret.append(s1 + "if grad > %d:" % (level - 1))
+            for name, expr in _radial_derivatives[level]:
+                ret.append(s1 + "    %s = %s" % (name, expr))
+    else:
+        # Only the radial derivatives the selection uses
+        used = set()
+        for l in range(L + 1):
+            for name, idx, component, terms in _collocation_terms(l, cart_order, selected_grad, components=components):
+                used.update(radial for coef, radial, mono in terms)
+        for level in range(selected_grad + 1):
+            for name, expr in _radial_derivatives[level]:
+                if name in used:
+                    ret.append(s1 + "%s = %s" % (name, expr))
     ret.append("")
 
     # Directional power derivs for angular momenta > 0
-    ret.append(s1 + "# Power matrix for higher angular momenta")
-    ret.append(s1 + "xc_pow = np.zeros((L + 1, npoints))")
-    ret.append(s1 + "yc_pow = np.zeros((L + 1, npoints))")
-    ret.append(s1 + "zc_pow = np.zeros((L + 1, npoints))")
-    ret.append("")
-    ret.append(s1 + "xc_pow[0] = xc")
-    ret.append(s1 + "yc_pow[0] = yc")
-    ret.append(s1 + "zc_pow[0] = zc")
-
-    ret.append(s1 + "for LL in range(1, L):")
-    ret.append(s1 + "    xc_pow[LL] = xc_pow[LL - 1] * xc")
-    ret.append(s1 + "    yc_pow[LL] = yc_pow[LL - 1] * yc")
-    ret.append(s1 + "    zc_pow[LL] = zc_pow[LL - 1] * zc")
-    ret.append("")
+    if monomials == "power":
+        ret.append(s1 + "# Power matrix for higher angular momenta")
+        ret.append(s1 + "xc_pow = np.zeros((L + 1, ) + xc.shape)")
+        ret.append(s1 + "yc_pow = np.zeros((L + 1, ) + yc.shape)")
+        ret.append(s1 + "zc_pow = np.zeros((L + 1, ) + zc.shape)")
+        ret.append("")
+        ret.append(s1 + "xc_pow[0] = xc")
+        ret.append(s1 + "yc_pow[0] = yc")
+        ret.append(s1 + "zc_pow[0] = zc")
+
+        ret.append(s1 + "for LL in range(1, L):")
+        ret.append(s1 + "    xc_pow[LL] = xc_pow[LL - 1] * xc")
+        ret.append(s1 + "    yc_pow[LL] = yc_pow[LL - 1] * yc")
+        ret.append(s1 + "    zc_pow[LL] = zc_pow[LL - 1] * zc")
+        ret.append("")
+    record("powers")
 
     # Build output data
-    ret.append(s1 + "# Allocate data")
+    ret.append(s1 + "# Allocate data, batched shells are (nshell, ncart, npoints)")
     ret.append(s1 + "ncart = int((L + 1) * (L + 2) / 2)")
+    ret.append(s1 + "out_shape = R2.shape[:-1] + (ncart, npoints)")
+    ret.append("")
+
+    if components is None:
+        ret.append(s1 + "if grad > %d:" % layout.max_grad)
+        ret.append(s1 + "    raise ValueError('Only grid derivatives through third derivatives (grad = %d) have been "
+                   "implemented')" % layout.max_grad)
+        nnames = [layout.ncomponents(level) for level in range(layout.max_grad + 1)]
+        ret.append(s1 + "names = %s[:%s[grad]]" % (str(layout.component_names(layout.max_grad)), str(nnames)))
+    else:
+        ret.append(s1 + "names = %s" % str(list(components)))
+    ret.append(s1 + "if out is None:")
+    ret.append(s1 + "    nfunc = (2 * L + 1) if spherical else ncart")
+    ret.append(s1 + "    out = np.empty((len(names), ) + out_shape[:-2] + (nfunc, npoints))")
     ret.append("")
 
-    ret.append(s1 + "output = {}")
-    ret.append(s1 + "output['PHI'] = np.zeros((ncart, npoints))")
-    ret.append(s1 + "if grad > 0:")
-    ret.append(s1 + "    output['PHI_X'] = np.zeros((ncart, npoints))")
-    ret.append(s1 + "    output['PHI_Y'] = np.zeros((ncart, npoints))")
-    ret.append(s1 + "    output['PHI_Z'] = np.zeros((ncart, npoints))")
-    ret.append(s1 + "if grad > 1:")
-    ret.append(s1 + "    output['PHI_XX'] = np.zeros((ncart, npoints))")
-    ret.append(s1 + "    output['PHI_YY'] = np.zeros((ncart, npoints))")
-    ret.append(s1 + "    output['PHI_ZZ'] = np.zeros((ncart, npoints))")
-    ret.append(s1 + "    output['PHI_XY'] = np.zeros((ncart, npoints))")
-    ret.append(s1 + "    output['PHI_XZ'] = np.zeros((ncart, npoints))")
-    ret.append(s1 + "    output['PHI_YZ'] = np.zeros((ncart, npoints))")
-    ret.append(s1 + "if grad > 2:")
-    ret.append(s1 + "    raise ValueError('Only grid derivatives through Hessians (grad = 2) has been implemented')")
+    ret.append(s1 + "# Cartesian components go straight to out unless they are transformed")
+    ret.append(s1 + "if spherical:")
+    ret.append(s1 + "    cart = np.empty((len(names), ) + out_shape)")
+    ret.append(s1 + "else:")
+    ret.append(s1 + "    cart = out")
+    ret.append(s1 + "output = dict(zip(names, cart))")
     ret.append("")
 
-    # Build individual angular moment
+    # Build individual angular moment, one straight-line body per derivative level
     ret.append("# Angular momentum loops")
     for l in range(L + 1):
         ret.append(s1 + "if L == %d:" % l)
-        ret.extend(_numpy_am_build(l, cart_order, s2))
-
+        if components is not None:
+            ret.extend(
+                _numpy_am_build(
+                    l,
+                    cart_order,
+                    selected_grad,
+                    s2,
+                    monomials=monomials,
+                    normalization=normalization,
+                    components=components))
+            continue
+
+        for grad in range(layout.max_grad + 1):
+            if grad == 0:
+                ret.append(s2 + "if grad == 0:")
+            elif grad == layout.max_grad:
+                ret.append(s2 + "else:")
+            else:
+                ret.append(s2 + "elif grad == %d:" % grad)
+            ret.extend(_numpy_am_build(l, cart_order, grad, s3, monomials=monomials, normalization=normalization))
+
+    record("cartesian")
     ret.append("# If Cartesian were done, return")
     ret.append(s1 + "if spherical is False:")
     ret.append(s2 + "return output")
     ret.append("")
+    ret.append("# Transform all components at once")
 
     # Now spherical transformers
     spherical_func = "spherical_trans"
     for l in range(L + 1):
-        ret.extend(RSH.transformation_generator(l, cart_order, function_name=spherical_func, spacer=s1))
+        ret.extend(
+            RSH.transformation_generator(
+                l,
+                cart_order,
+                function_name=spherical_func,
+                spacer=s1,
+                spherical_order=spherical_order,
+                normalization=normalization))
 
     for l in range(L + 1):
-        name = spherical_func + str(l)
         ret.append(s1 + "if L == %d:" % l)
-        ret.append(s2 + "for k, v in output.items():")
-        ret.append(s3 + "output[k] = %s_%d(output[k])" % (spherical_func, l))
+        ret.append(s2 + "%s_%d(cart, out)" % (spherical_func, l))
         ret.append("")
 
-    ret.append(s1 + "return output")
+    record("spherical")
+    ret.append(s1 + "return dict(zip(names, out))")
 
     return "\n".join(ret)
 
 
-def _numpy_am_build(L, cart_order, spacer=""):
-    ret = []
-    names = ["X", "Y", "Z"]
+@memoize.memoize(maxsize=64)
+def numpy_kernel(L,
+                 cart_order="row",
+                 monomials="power",
+                 profile=False,
+                 spherical_order="gaussian",
+                 normalization="none",
+                 components=None):
+    """
+    Generates and compiles the NumPy collocation kernel for angular momenta up to L, see numpy_generator. Kernels
+    with profile=True are instrumented for profiling.py, kernels given a tuple of components only compute those.
 
-    s1 = "    "
-    # Generator
+    Kernels written ahead of time by precompile.py are imported instead of generated, kernels generated at runtime
+    are registered with linecache so that tracebacks show their source.
+
+    Returns a function with the signature of the generated code:
+        kernel(xyz, L, coeffs, exponents, center, grad=2, spherical=True, out=None, xyz_soa=False, exp_atol=None)
+    """
+
+    if (monomials == "power") and (not profile) and (components is None):
+        kernel = kernels.load_kernel(L, cart_order, spherical_order, normalization)
+        if kernel is not None:
+            return kernel
+
+    function_name = "generated_compute_numpy_shells"
+    code = numpy_generator(L, function_name=function_name, cart_order=cart_order, monomials=monomials,
+                           profile=profile, spherical_order=spherical_order, normalization=normalization,
+                           components=components)
+
+    filename = "<gau2grid %s %s%s%s>" % (kernels.module_name(L, cart_order, spherical_order, normalization),
+                                         monomials, " profile" if profile else "",
+                                         "" if components is None else " " + ",".join(components))
+    linecache.cache[filename] = (len(code), None, code.splitlines(True), filename)
+
+    namespace = {}
+    exec(compile(code, filename, "exec"), namespace)
+    return namespace[function_name]
+
+
+def _deriv_index(name):
+    """
+    Returns the (dx, dy, dz) derivative index of an output or radial name such as PHI_XY or SXY.
+    """
+    letters = name.split("_")[-1] if name.startswith("PHI") else name[1:]
+    return (letters.count("X"), letters.count("Y"), letters.count("Z"))
+
+
+def _radial_name(alpha):
+    """
+    Returns the name of the radial derivative S with derivative index alpha.
+    """
+    if sum(alpha) == 0:
+        return "S0"
+    return "S" + "X" * alpha[0] + "Y" * alpha[1] + "Z" * alpha[2]
+
+
+def _monomial_derivative(lmn, beta):
+    """
+    Differentiates the monomial x^l y^m z^n by the derivative index beta, returns (coef, (l', m', n')).
+    """
+    coef = 1
+    for power, deriv in zip(lmn, beta):
+        if deriv > power:
+            return 0, None
+        for k in range(deriv):
+            coef *= power - k
+    return coef, tuple(power - deriv for power, deriv in zip(lmn, beta))
+
+
+def _binomial(n, k):
+    ret = 1
+    for x in range(k):
+        ret = ret * (n - x) // (x + 1)
+    return ret
+
+
+def _collocation_terms(L, cart_order, grad, normalization="none", components=None):
+    """
+    Expands every Cartesian output row of angular momentum L through derivative level grad by the Leibniz rule:
+        d^D (S x^l y^m z^n) = sum_a binom(D, a) (d^a S) (d^(D - a) x^l y^m z^n)
+
+    Returns a list of (name, idx, component, terms) where terms is a list of (coef, radial name, monomial) and
+    repeated (radial, monomial) products are merged into a single term. The coefficients include the Cartesian
+    scaling of the normalization convention. Only the rows of a selection of components are expanded if given.
+    """
+
+    names = layout.component_names(grad) if components is None else components
+
+    factors = norm.cartesian_factors(L, cart_order, normalization)
+
+    ret = []
     for idx, l, m, n in order.cartesian_order_factory(L, cart_order):
+        component = "X" * l + "Y" * m + "Z" * n
+        if component == "":
+            component = "0"
+
+        for name in names:
+            deriv = _deriv_index(name)
+            terms = {}
+            for ax in range(deriv[0] + 1):
+                for ay in range(deriv[1] + 1):
+                    for az in range(deriv[2] + 1):
+                        alpha = (ax, ay, az)
+                        beta = (deriv[0] - ax, deriv[1] - ay, deriv[2] - az)
+                        mcoef, mono = _monomial_derivative((l, m, n), beta)
+                        if mcoef == 0:
+                            continue
+
+                        coef = mcoef * _binomial(deriv[0], ax) * _binomial(deriv[1], ay) * _binomial(deriv[2], az)
+                        key = (_radial_name(alpha), mono)
+                        terms[key] = terms.get(key, 0) + coef
+
+            terms = [(coef * factors[idx] if factors[idx] != 1.0 else coef, radial, mono)
+                     for (radial, mono), coef in sorted(terms.items(), key=_term_order)]
+            ret.append((name, idx, component, terms))
+
+    return ret
+
+
+def _term_order(item):
+    # Highest radial derivative first so that each row starts with a full product
+    (radial, mono), coef = item
+    return (-sum(_deriv_index(radial)), radial, mono)
+
+
+def _monomial_operand(mono, monomials):
+    """
+    Returns the operand of the monomial x^l y^m z^n, None for x^0 y^0 z^0. Temporaries are ("M", (l, m, n)).
+    """
+
+    nonzero = [p for p in mono if p > 0]
+    if len(nonzero) == 0:
+        return None
+    elif sum(mono) == 1:
+        return ["xc", "yc", "zc"][mono.index(1)]
+    elif (monomials == "power") and (len(nonzero) == 1):
+        # A single power is a row of the power tables
+        return _build_xyz_pow(*mono)[0]
+    else:
+        return ("M", mono)
+
+
+def _monomial_parent(mono):
+    """
+    Returns the (parent monomial, coordinate) pair whose product is mono in the recurrence build.
+    """
+    for num, coord in enumerate(["xc", "yc", "zc"]):
+        if mono[num] > 0:
+            parent = list(mono)
+            parent[num] -= 1
+            return tuple(parent), coord
+
+
+def _term_operands(coef, radial, mono, monomials):
+    """
+    Returns the operands whose product is a term, temporaries are tuples:
+        ("C", coef, radial) - the scaled radial coef * radial
+        ("M", (l, m, n))    - the monomial x^l y^m z^n
+    """
+
+    ret = []
+    if coef == 1:
+        ret.append(radial)
+    else:
+        ret.append(("C", coef, radial))
+
+    mono = _monomial_operand(mono, monomials)
+    if mono is not None:
+        ret.append(mono)
+
+    return ret
 
-        l = l + 2
-        m = m + 2
-        n = n + 2
-        ld1 = l - 1
-        ld2 = l - 2
-        md1 = m - 1
-        md2 = m - 2
-        nd1 = n - 1
-        nd2 = n - 2
-        tmp_ret = []
-
-        # Set grads back to zero
-        x_grad, y_grad, z_grad = False, False, False
-
-        name = "X" * ld2 + "Y" * md2 + "Z" * nd2
-        if name == "":
-            name = "0"
-
-        # Density
-        tmp_ret.append("# Density AM=%d Component=%s" % (L, name))
-
-        tmp_ret.append(_build_xyz_pow("A", 1.0, l, m, n))
-        tmp_ret.append("output['PHI'][%d] = S0 * A" % idx)
-
-        tmp_ret.append("if grad > 0:")
-
-        # Gradient
-        tmp_ret.append(s1 + "# Gradient AM=%d Component=%s" % (L, name))
-        tmp_ret.append(s1 + "output['PHI_X'][%d] = SX * A" % idx)
-        tmp_ret.append(s1 + "output['PHI_Y'][%d] = SY * A" % idx)
-        tmp_ret.append(s1 + "output['PHI_Z'][%d] = SZ * A" % idx)
-
-        AX = _build_xyz_pow("AX", ld2, ld1, m, n)
-        if AX is not None:
-            x_grad = True
-            tmp_ret.append(s1 + AX)
-            tmp_ret.append(s1 + "output['PHI_X'][%d] += S0 * AX" % idx)
-
-        AY = _build_xyz_pow("AY", md2, l, md1, n)
-        if AY is not None:
-            y_grad = True
-            tmp_ret.append(s1 + AY)
-            tmp_ret.append(s1 + "output['PHI_Y'][%d] += S0 * AY" % idx)
-
-        AZ = _build_xyz_pow("AZ", nd2, l, m, nd1)
-        if AZ is not None:
-            z_grad = True
-            tmp_ret.append(s1 + AZ)
-            tmp_ret.append(s1 + "output['PHI_Z'][%d] += S0 * AZ" % idx)
-
-        tmp_ret.append("if grad > 1:")
-        # Hessian temporaries
-        tmp_ret.append("# Hessian AM=%d Component=%s" % (L, name))
-
-        # S Hess
-        # We will build S Hess, grad 1, grad 2, A Hess
-
-        # XX
-        tmp_ret.append(s1 + "output['PHI_XX'][%d] = SXX * A" % idx)
-        if x_grad:
-            tmp_ret.append(s1 + "output['PHI_XX'][%d] += SX * AX" % idx)
-            tmp_ret.append(s1 + "output['PHI_XX'][%d] += SX * AX" % idx)
-
-        AXX = _build_xyz_pow("AXX", ld2 * (ld2 - 1), ld2, m, n)
-        if AXX is not None:
-            rhs = AXX.split(" = ")[-1]
-            tmp_ret.append(s1 + "output['PHI_XX'][%d] += %s * S0" % (idx, rhs))
-
-        # YY
-        tmp_ret.append(s1 + "output['PHI_YY'][%d] = SYY * A" % idx)
-        if y_grad:
-            tmp_ret.append(s1 + "output['PHI_YY'][%d] += SY * AY" % idx)
-            tmp_ret.append(s1 + "output['PHI_YY'][%d] += SY * AY" % idx)
-        AYY = _build_xyz_pow("AYY", md2 * (md2 - 1), l, md2, n)
-        if AYY is not None:
-            rhs = AYY.split(" = ")[-1]
-            tmp_ret.append(s1 + "output['PHI_YY'][%d] += %s * S0" % (idx, rhs))
-
-        # ZZ
-        tmp_ret.append(s1 + "output['PHI_ZZ'][%d] = SZZ * A" % idx)
-        if z_grad:
-            tmp_ret.append(s1 + "output['PHI_ZZ'][%d] += SZ * AZ" % idx)
-            tmp_ret.append(s1 + "output['PHI_ZZ'][%d] += SZ * AZ" % idx)
-        AZZ = _build_xyz_pow("AZZ", nd2 * (nd2 - 1), l, m, nd2)
-        if AZZ is not None:
-            rhs = AZZ.split(" = ")[-1]
-            tmp_ret.append(s1 + "output['PHI_ZZ'][%d] += %s * S0" % (idx, rhs))
-
-        # XY
-        tmp_ret.append(s1 + "output['PHI_XY'][%d] = SXY * A" % idx)
-
-        if y_grad:
-            tmp_ret.append(s1 + "output['PHI_XY'][%d] += SX * AY" % idx)
-        if x_grad:
-            tmp_ret.append(s1 + "output['PHI_XY'][%d] += SY * AX" % idx)
-
-        AXY = _build_xyz_pow("AXY", ld2 * md2, ld1, md1, n)
-        if AXY is not None:
-            rhs = AXY.split(" = ")[-1]
-            tmp_ret.append(s1 + "output['PHI_XY'][%d] += %s * S0" % (idx, rhs))
-
-        # XZ
-        tmp_ret.append(s1 + "output['PHI_XZ'][%d] = SXZ * A" % idx)
-        if z_grad:
-            tmp_ret.append(s1 + "output['PHI_XZ'][%d] += SX * AZ" % idx)
-        if x_grad:
-            tmp_ret.append(s1 + "output['PHI_XZ'][%d] += SZ * AX" % idx)
-        AXZ = _build_xyz_pow("AXZ", ld2 * nd2, ld1, m, nd1)
-        if AXZ is not None:
-            rhs = AXZ.split(" = ")[-1]
-            tmp_ret.append(s1 + "output['PHI_XZ'][%d] += %s * S0" % (idx, rhs))
-
-        # YZ
-        tmp_ret.append(s1 + "output['PHI_YZ'][%d] = SYZ * A" % idx)
-        if z_grad:
-            tmp_ret.append(s1 + "output['PHI_YZ'][%d] += SY * AZ" % idx)
-        if y_grad:
-            tmp_ret.append(s1 + "output['PHI_YZ'][%d] += SZ * AY" % idx)
-        AYZ = _build_xyz_pow("AYZ", md2 * nd2, l, md1, nd1)
-        if AYZ is not None:
-            # tmp_ret.append(s1 + AYZ)
-            rhs = AYZ.split(" = ")[-1]
-            tmp_ret.append(s1 + "output['PHI_YZ'][%d] += %s * S0" % (idx, rhs))
-
-        idx += 1
-        tmp_ret.append(" ")
-
-        # Post process ret
-
-        # Extend it out
-        ret.extend(tmp_ret)
+
+def _numpy_am_build(L, cart_order, grad, spacer="", monomials="power", normalization="none", components=None):
+    """
+    Builds the straight-line code of the Cartesian collocation rows of angular momentum L through grad.
+
+    Shared monomials and scaled radial derivatives are computed once, right before their first use, into slots of
+    a single work array W that are recycled after their last use. All products are written with out= and
+    accumulated in place so no temporaries are allocated past W.
+    """
+
+    names = layout.component_names(grad) if components is None else components
+    rows = _collocation_terms(L, cart_order, grad, normalization, components)
+
+    # Build the operation list, temporaries are defined right before their first use
+    ops = []
+    defined = set()
+
+    def require(tmp):
+        if (not isinstance(tmp, tuple)) or (tmp in defined):
+            return
+        defined.add(tmp)
+
+        operands = []
+        if (tmp[0] == "M") and (monomials == "recurrence"):
+            parent, coord = _monomial_parent(tmp[1])
+            operands = [_monomial_operand(parent, monomials), coord]
+            require(operands[0])
+
+        ops.append(("def", tmp, operands))
+
+    for name, idx, component, terms in rows:
+        if name == names[0]:
+            ops.append(("comment", "# AM=%d Component=%s" % (L, component), []))
+
+        target = "%s[..., %d, :]" % (name, idx)
+        first = True
+        for coef, radial, mono in terms:
+            operands = _term_operands(coef, radial, mono, monomials)
+            for tmp in operands:
+                require(tmp)
+
+            ops.append(("set" if first else "add", target, operands))
+            first = False
+
+    # Last use of each temporary
+    last_use = {}
+    for num, (kind, target, operands) in enumerate(ops):
+        for tmp in operands:
+            if isinstance(tmp, tuple):
+                last_use[tmp] = num
+
+    # Assign work slots and write the code, slot 0 is the product scratch T
+    ret = []
+    slots = {}
+    free = []
+    nslots = 1
+    scratch = False
+
+    def expr(operand):
+        if isinstance(operand, tuple):
+            return "W[%d]" % slots[operand]
+        return operand
+
+    for num, (kind, target, operands) in enumerate(ops):
+        if kind == "comment":
+            ret.append(target)
+            continue
+
+        if kind == "def":
+            if len(free):
+                slots[target] = free.pop()
+            else:
+                slots[target] = nslots
+                nslots += 1
+            out = expr(target)
+
+            if target[0] == "C":
+                ret.append("np.multiply(%s, %s, out=%s)" % (target[2], repr(float(target[1])), out))
+            elif monomials == "recurrence":
+                ret.append("np.multiply(%s, %s, out=%s)" % (expr(operands[0]), operands[1], out))
+            else:
+                factors = _build_xyz_pow(*target[1])
+                ret.append("np.multiply(%s, %s, out=%s)" % (factors[0], factors[1], out))
+                for factor in factors[2:]:
+                    ret.append("np.multiply(%s, %s, out=%s)" % (out, factor, out))
+
+        elif kind == "set":
+            if len(operands) == 1:
+                ret.append("%s = %s" % (target, expr(operands[0])))
+            else:
+                ret.append("np.multiply(%s, %s, out=%s)" % (expr(operands[0]), expr(operands[1]), target))
+
+        else:
+            if len(operands) == 1:
+                ret.append("%s += %s" % (target, expr(operands[0])))
+            else:
+                scratch = True
+                ret.append("np.multiply(%s, %s, out=T)" % (expr(operands[0]), expr(operands[1])))
+                ret.append("%s += T" % target)
+
+        for tmp in operands:
+            if isinstance(tmp, tuple) and last_use[tmp] == num:
+                free.append(slots[tmp])
+
+    # Work arrays and output names
+    header = []
+    header.append("%s, = cart" % ", ".join(names))
+    if (nslots > 1) or scratch:
+        header.append("W = np.empty((%d, ) + R2.shape)" % nslots)
+        header.append("T = W[0]")
+    ret = header + ret
+    ret.append(" ")
 
     # Add the spacer in
     for x in range(len(ret)):
@@ -277,35 +556,17 @@ def _numpy_am_build(L, cart_order, spacer=""):
     return ret
 
 
-def _build_xyz_pow(name, pref, l, m, n, shift=2):
-    l = l - shift
-    m = m - shift
-    n = n - shift
-
-    if (pref <= 0) or (l < 0) or (n < 0) or (m < 0):
-        return None
-
-    mul = " "
-    if pref == 1:
-        ret = name + " ="
-    else:
-        # Basically always an int
-        ret = name + " = %2.1f" % float(pref)
-        mul = " * "
+def _build_xyz_pow(l, m, n):
+    """
+    Returns the power table rows whose product is the monomial x^l y^m z^n.
+    """
 
+    ret = []
     if l > 0:
-        ret += mul + "xc_pow[%d]" % (l - 1)
-        mul = " * "
-
+        ret.append("xc_pow[%d]" % (l - 1))
     if m > 0:
-        ret += mul + "yc_pow[%d]" % (m - 1)
-        mul = " * "
-
+        ret.append("yc_pow[%d]" % (m - 1))
     if n > 0:
-        ret += mul + "zc_pow[%d]" % (n - 1)
-        mul = " * "
-
-    if mul == " ":
-        ret += " 1"
+        ret.append("zc_pow[%d]" % (n - 1))
 
     return ret
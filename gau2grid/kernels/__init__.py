@@ -0,0 +1,59 @@
+"""
+Ahead-of-time generated kernel modules, written by gau2grid.precompile at install time or from its command line.
+
+Every module holds the generated NumPy kernel for angular momenta up to L of one cartesian and spherical order and
+normalization convention and is only imported the first time generator.numpy_kernel asks for that kernel. Modules
+record a digest of the generator sources they were written from, modules written by a different version of the
+generator are ignored and the kernel is generated at runtime instead.
+"""
+
+import hashlib
+import importlib
+import os
+
+from .. import memoize
+
+# The sources the generated code is built from
+_sources = ["generator.py", "layout.py", "normalization.py", "order.py", "RSH.py"]
+
+
+def module_name(L, cart_order="row", spherical_order="gaussian", normalization="none"):
+    """
+    Returns the name of the kernel module for angular momenta up to L.
+    """
+    return "numpy_%s_%s_%s_L%d" % (cart_order, spherical_order, normalization, L)
+
+
+@memoize.Memoize
+def source_digest():
+    """
+    Returns a hex digest of the generator sources, or None if the sources are not available.
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    h = hashlib.sha1()
+    try:
+        for name in _sources:
+            with open(os.path.join(root, name), "rb") as handle:
+                h.update(handle.read())
+    except OSError:
+        return None
+
+    return h.hexdigest()
+
+
+def load_kernel(L, cart_order="row", spherical_order="gaussian", normalization="none"):
+    """
+    Imports the precompiled kernel for angular momenta up to L, returns None if it was not built or is stale.
+    """
+
+    try:
+        module = importlib.import_module("." + module_name(L, cart_order, spherical_order, normalization), __name__)
+    except ImportError:
+        return None
+
+    digest = source_digest()
+    if (digest is not None) and (getattr(module, "generator_digest", None) != digest):
+        return None
+
+    return module.generated_compute_numpy_shells
@@ -0,0 +1,156 @@
+"""
+Output tensor layouts for the collocation kernels and drivers.
+
+All outputs are a single (ncomp, nfunc, npoints) tensor, "ncomp" running over the components of component_names,
+or over a selection of them (see select_components).
+The storage of that tensor may be:
+    - "component" : (ncomp, nfunc, npoints) component-major storage
+    - "points"    : (ncomp, npoints, nfunc) points-major storage, each component is an (npoints, nfunc) matrix
+in either C or Fortran order. Kernels always write through the logical (ncomp, nfunc, npoints) view of the storage.
+
+Input points are either (N, 3) points-major arrays (extra columns such as weights are ignored) or (3, N)
+structure-of-arrays blocks whose contiguous x, y, and z rows the kernels stream directly (xyz_soa=True).
+"""
+
+import numpy as np
+
+_component_names = [["PHI"], ["PHI_X", "PHI_Y", "PHI_Z"], ["PHI_XX", "PHI_YY", "PHI_ZZ", "PHI_XY", "PHI_XZ", "PHI_YZ"],
+                    [
+                        "PHI_XXX", "PHI_XXY", "PHI_XXZ", "PHI_XYY", "PHI_XYZ", "PHI_XZZ", "PHI_YYY", "PHI_YYZ",
+                        "PHI_YZZ", "PHI_ZZZ"
+                    ]]
+
+# The highest derivative level implemented
+max_grad = len(_component_names) - 1
+
+_layouts = ["component", "points"]
+
+
+def component_names(grad):
+    """
+    Returns the names of the output components through derivative level grad in tensor order.
+    """
+    if grad > max_grad:
+        raise ValueError("Only grid derivatives through third derivatives (grad = %d) have been implemented" %
+                         max_grad)
+
+    ret = []
+    for names in _component_names[:grad + 1]:
+        ret.extend(names)
+    return ret
+
+
+def ncomponents(grad, components=None):
+    """
+    Returns the number of output components through derivative level grad, or of a selection of components.
+    """
+    if components is not None:
+        return len(components)
+    return len(component_names(grad))
+
+
+def derivative_level(name):
+    """
+    Returns the derivative level of a component name, PHI_XYZ is 3.
+    """
+    return len(name.split("_")[1]) if "_" in name else 0
+
+
+def select_components(components):
+    """
+    Validates a selection of component names, such as ("PHI", "PHI_XXX"), and returns the (names, grad) of the
+    selection where grad is the derivative level needed to compute it.
+    """
+
+    names = tuple(components)
+    known = component_names(max_grad)
+    for name in names:
+        if name not in known:
+            raise KeyError("Component '%s' not understood, available components: %s" % (name, ", ".join(known)))
+    if (len(names) == 0) or (len(set(names)) != len(names)):
+        raise ValueError("A component selection must hold at least one component and no repeats")
+
+    return names, max(derivative_level(name) for name in names)
+
+
+def allocate(nfunc, npoints, grad, layout="component", order="C", components=None):
+    """
+    Allocates a zeroed output storage tensor.
+
+    Parameters
+    ----------
+    nfunc : int
+        The number of functions
+    npoints : int
+        The number of points
+    grad : int
+        The derivative level
+    layout : str
+        The storage layout, "component" (ncomp, nfunc, npoints) or "points" (ncomp, npoints, nfunc)
+    order : str
+        The memory order of the storage, "C" or "F"
+    components : tuple of str, optional
+        A selection of components to allocate instead of all components through grad
+
+    Returns
+    -------
+    storage : array_like
+        The output storage tensor
+    """
+
+    ncomp = ncomponents(grad, components)
+    if layout == "component":
+        shape = (ncomp, nfunc, npoints)
+    elif layout == "points":
+        shape = (ncomp, npoints, nfunc)
+    else:
+        raise KeyError("Output layout '%s' not understood, available layouts: %s" % (layout, ", ".join(_layouts)))
+
+    if order not in ["C", "F"]:
+        raise KeyError("Output order '%s' not understood, must be C or F" % order)
+
+    return np.zeros(shape, order=order)
+
+
+def logical_view(storage, layout="component"):
+    """
+    Returns the (ncomp, nfunc, npoints) view of an output storage tensor.
+    """
+    if layout == "component":
+        return storage
+    elif layout == "points":
+        return storage.transpose(0, 2, 1)
+    else:
+        raise KeyError("Output layout '%s' not understood, available layouts: %s" % (layout, ", ".join(_layouts)))
+
+
+def output_dict(tensor, grad, components=None):
+    """
+    Returns the dictionary of (nfunc, npoints) component views of a logical output tensor, of all components
+    through grad or of a selection of components.
+    """
+    if components is not None:
+        return dict(zip(components, tensor))
+    return dict(zip(component_names(grad), tensor))
+
+
+def grid_soa(xyzw):
+    """
+    Converts an (N, 3) or (N, 4) points-major grid into contiguous structure-of-arrays form once.
+
+    Returns
+    -------
+    xyz : array_like
+        The (3, N) C-ordered coordinates
+    weights : array_like or None
+        The (N) contiguous weights if xyzw has a fourth column
+    """
+
+    xyzw = np.asarray(xyzw, dtype=np.double)
+    xyz = np.ascontiguousarray(xyzw[:, :3].T)
+
+    weights = None
+    if xyzw.shape[1] > 3:
+        weights = np.ascontiguousarray(xyzw[:, 3])
+
+    return xyz, weights
@@ -0,0 +1,237 @@
+"""
+A thread-safe memoizing decorator for the expensive, pure functions of gau2grid such as the solid harmonic
+coefficients, the transformation matrices, and the generated kernels.
+
+Concurrent calls with the same arguments are single-flight: the first caller computes the value while the others
+wait for it, so a thread-pool driver never builds the same kernel twice. Caches may be bounded to their most recently
+used entries and report their statistics through stats().
+
+Caches declared with persist=True are also stored on disk when $GAU2GRID_CACHE_DIR is set, and are loaded from
+there by later processes. Each computed value is appended to the file, persisted values are dropped when the module
+of the memoized function changes. Persistence is best-effort, a cache directory that can not be written does not
+fail the memoized calls.
+"""
+
+import collections
+import functools
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+
+_persist_version = 2
+
+
+def cache_dir():
+    """
+    Returns the directory of the persisted caches, None if persistence is disabled.
+    """
+    return os.environ.get("GAU2GRID_CACHE_DIR", None) or None
+
+
+class _Flight(object):
+    """
+    A computation in progress that other callers of the same key wait on.
+    """
+
+    __slots__ = ["event", "value", "failed"]
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.failed = False
+
+
+class Memoize(object):
+    """
+    Memoizes a function on its (hashable) arguments.
+
+    Parameters
+    ----------
+    func : callable
+        The function to memoize
+    maxsize : int, optional
+        Keep only this many of the most recently used values, unbounded if None
+    persist : bool
+        Store the values in $GAU2GRID_CACHE_DIR if it is set, the values must be picklable
+    """
+
+    def __init__(self, func, maxsize=None, persist=False):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.maxsize = maxsize
+        self.persist = persist
+
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._loaded_from = None
+        self._persist_key = None
+        self._save_lock = threading.Lock()
+        self._stale = False
+        self.mem = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+        self.compute_time = 0.0
+
+    def __call__(self, *args, **kwargs):
+        key = args
+        if kwargs:
+            key = args + (None, ) + tuple(sorted(kwargs.items()))
+
+        while True:
+            with self._lock:
+                self._load()
+                if key in self.mem:
+                    self.mem.move_to_end(key)
+                    self.hits += 1
+                    return self.mem[key]
+
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+                    break
+                self.waits += 1
+
+            # Another thread computes this key, a failed computation is retried by the next caller
+            flight.event.wait()
+            if not flight.failed:
+                return flight.value
+
+        t = time.perf_counter()
+        try:
+            value = self.func(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                del self._flights[key]
+            flight.failed = True
+            flight.event.set()
+            raise
+
+        # Waiters are released even if the bookkeeping below fails
+        try:
+            with self._lock:
+                self.misses += 1
+                self.compute_time += time.perf_counter() - t
+                self.mem[key] = value
+                if (self.maxsize is not None) and (len(self.mem) > self.maxsize):
+                    self.mem.popitem(last=False)
+                    self.evictions += 1
+                del self._flights[key]
+        finally:
+            flight.value = value
+            flight.event.set()
+
+        self._save(key, value)
+        return value
+
+    def __len__(self):
+        return len(self.mem)
+
+    def clear(self):
+        """
+        Removes all values from memory, persisted values are kept.
+        """
+        with self._lock:
+            self.mem.clear()
+
+    def stats(self):
+        """
+        Returns the number of hits, misses, waits on computations of other threads, and evictions, the number of
+        values held, and the total time spent computing values.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "evictions": self.evictions,
+                "size": len(self.mem),
+                "maxsize": self.maxsize,
+                "compute_time": self.compute_time,
+            }
+
+    def filename(self):
+        """
+        Returns the file the values are persisted to, None if they are not persisted.
+        """
+        directory = cache_dir()
+        if (not self.persist) or (directory is None):
+            return None
+        return os.path.join(directory, "%s.%s.pkl" % (self.func.__module__, self.func.__qualname__))
+
+    def _version(self):
+        # Persisted values are only valid for the code that computed them
+        if self._persist_key is None:
+            h = hashlib.sha1(self.func.__code__.co_code)
+            source = getattr(sys.modules.get(self.func.__module__), "__file__", None)
+            if source is not None:
+                with open(source, "rb") as handle:
+                    h.update(handle.read())
+            self._persist_key = (_persist_version, h.hexdigest())
+        return self._persist_key
+
+    def _load(self):
+        filename = self.filename()
+        if (filename is None) or (filename == self._loaded_from):
+            return
+        self._loaded_from = filename
+
+        # The file is a sequence of (version, values) records, a truncated last record ends it
+        try:
+            with open(filename, "rb") as handle:
+                while True:
+                    try:
+                        version, values = pickle.load(handle)
+                    except (EOFError, ValueError, pickle.UnpicklingError):
+                        break
+
+                    if version != self._version():
+                        self._stale = True
+                        continue
+                    for key, value in values.items():
+                        self.mem.setdefault(key, value)
+        except OSError:
+            return
+
+    def _save(self, key, value):
+        """
+        Appends a new value to the persisted file, the file is only rewritten to drop the values of older code.
+        Persistence is best-effort, a directory that can not be written only loses the persisted values.
+        """
+        filename = self.filename()
+        if filename is None:
+            return
+
+        with self._save_lock:
+            try:
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                if not self._stale:
+                    with open(filename, "ab") as handle:
+                        pickle.dump((self._version(), {key: value}), handle, protocol=pickle.HIGHEST_PROTOCOL)
+                    return
+
+                with self._lock:
+                    values = dict(self.mem)
+                tmp = "%s.%d.%d" % (filename, os.getpid(), threading.get_ident())
+                with open(tmp, "wb") as handle:
+                    pickle.dump((self._version(), values), handle, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, filename)
+                self._stale = False
+            except OSError:
+                return
+
+
+def memoize(maxsize=None, persist=False):
+    """
+    Returns a decorator memoizing a function with the given options, see Memoize.
+    """
+
+    def decorator(func):
+        return Memoize(func, maxsize=maxsize, persist=persist)
+
+    return decorator
@@ -0,0 +1,125 @@
+"""
+Contains the normalization conventions of the collocation kernels.
+
+Normalization conventions:
+    - "none"      : the coefficients are used as given and the Cartesian components are the bare x^l y^m z^n, with
+                    coefficients normalizing the x^L component (as Psi4's) the xy type components are not normalized
+    - "cartesian" : as "none", but every Cartesian component is scaled to the norm of x^L by
+                    sqrt((2L - 1)!! / ((2l - 1)!! (2m - 1)!! (2n - 1)!!))
+    - "full"      : the coefficients are the contraction coefficients of normalized primitives as found in basis set
+                    files, the primitive and contraction normalizations are folded into them and every Cartesian
+                    component is normalized
+
+The spherical components of every convention are the same, given the same coefficients. The Cartesian scaling is
+applied at generation time, it is folded into the constants of the generated kernels, the prefactor tables of the
+table kernel, and the cartesian to spherical transformations, so no pass over the output is needed.
+"""
+
+import math
+from fractions import Fraction
+
+import numpy as np
+
+from . import memoize
+from . import order
+from . import RSH
+
+_conventions = ["none", "cartesian", "full"]
+
+
+def check_convention(normalization):
+    """
+    Raises a KeyError if normalization is not a known convention.
+    """
+    if normalization not in _conventions:
+        raise KeyError("Normalization '%s' not understood, available conventions: %s" % (normalization,
+                                                                                          ", ".join(_conventions)))
+
+
+def _double_factorial(n):
+    ret = 1
+    for x in range(n, 0, -2):
+        ret *= x
+    return ret
+
+
+@memoize.memoize()
+def cartesian_factors(L, cart_order="row", normalization="none"):
+    """
+    Returns the scale factor of each Cartesian component of angular momentum L in cart_order, the square roots are
+    correctly rounded.
+    """
+
+    check_convention(normalization)
+
+    ncart = (L + 1) * (L + 2) // 2
+    if normalization == "none":
+        return (1.0, ) * ncart
+
+    ret = [None] * ncart
+    top = _double_factorial(2 * L - 1)
+    for idx, l, m, n in order.cartesian_order_factory(L, cart_order):
+        bottom = _double_factorial(2 * l - 1) * _double_factorial(2 * m - 1) * _double_factorial(2 * n - 1)
+        ret[idx] = RSH._sqrt_product(Fraction(1), Fraction(top, bottom))
+
+    return tuple(ret)
+
+
+def primitive_norms(L, exponents):
+    """
+    Returns the normalization of the x^L e^(-exponent R^2) primitives:
+        (2 exponent / pi)^(3/4) (4 exponent)^(L/2) / sqrt((2L - 1)!!)
+    """
+
+    exponents = np.asarray(exponents, dtype=np.double)
+    return (2.0 * exponents / math.pi)**0.75 * (4.0 * exponents)**(0.5 * L) / math.sqrt(_double_factorial(2 * L - 1))
+
+
+def contraction_coefficients(L, coeffs, exponents):
+    """
+    Folds the primitive and contraction normalizations into the contraction coefficients of normalized primitives
+    of a shell, or of (nshell, nprim) padded shells, so that the x^L component of the contraction is normalized.
+    Padded primitives with zero exponents stay zero.
+    """
+
+    coeffs = np.asarray(coeffs, dtype=np.double)
+    exponents = np.asarray(exponents, dtype=np.double)
+
+    # Overlap of the normalized primitives (2 sqrt(a_i a_j) / (a_i + a_j))^(L + 3/2)
+    asum = exponents[..., :, None] + exponents[..., None, :]
+    aprod = exponents[..., :, None] * exponents[..., None, :]
+    overlap = np.divide(2.0 * np.sqrt(aprod), asum, out=np.zeros_like(asum), where=asum > 0)**(L + 1.5)
+
+    norm = np.einsum("...i,...ij,...j->...", coeffs, overlap, coeffs)
+    norm = np.divide(1.0, np.sqrt(norm), out=np.zeros_like(norm), where=norm > 0)
+    return coeffs * primitive_norms(L, exponents) * norm[..., None]
+
+
+def kernel_convention(normalization, spherical=False):
+    """
+    Returns the convention of kernels fed coefficients that already went through contraction_coefficients. The
+    spherical components do not depend on the Cartesian scaling, spherical kernels are left unscaled.
+    """
+    check_convention(normalization)
+    if spherical:
+        return "none"
+    return "cartesian" if normalization == "full" else normalization
+
+
+def normalize_basis(basis):
+    """
+    Returns a BasisSet whose coefficients are the contraction_coefficients of the coefficients of basis.
+    """
+    # Imported here, basis.py is not needed by the kernels
+    from . import basis as basis_set
+
+    basis = basis_set.as_basis(basis)
+
+    coefficients = np.empty_like(basis.coefficients)
+    for shell in range(basis.nshell):
+        pstart, pstop = basis.prim_offsets[shell], basis.prim_offsets[shell + 1]
+        coefficients[pstart:pstop] = contraction_coefficients(basis.am[shell], basis.coefficients[pstart:pstop],
+                                                              basis.exponents[pstart:pstop])
+
+    return basis_set.BasisSet(basis.centers, basis.shell_center, basis.am, basis.prim_offsets, basis.exponents,
+                              coefficients)
@@ -1,7 +1,30 @@
 """
 Contains the different possible cartesian and spherical ordering codes.
+
+Cartesian orders:
+    - "row"    : x^L first, then decreasing powers of x and y, xx, xy, xz, yy, yz, zz for L = 2
+    - "cca"    : the CCA standard order, identical to "row"
+    - "molden" : the Molden order, xx, yy, zz, xy, xz, yz for L = 2, only defined through L = 4. Gaussian uses the
+                 same order for d and f shells
+
+Spherical orders of the components m = -L .. L, positive m are the cosine-like and negative m the sine-like
+components:
+    - "gaussian" : 0, +1, -1, +2, -2, ..., the order of Gaussian, Molden, and Psi4
+    - "cca"      : -L, ..., -1, 0, +1, ..., +L, the CCA standard order
 """
 
+# The Molden cartesian orders by L as monomial names
+_molden_orders = {
+    0: ["0"],
+    1: ["x", "y", "z"],
+    2: ["xx", "yy", "zz", "xy", "xz", "yz"],
+    3: ["xxx", "yyy", "zzz", "xyy", "xxy", "xxz", "xzz", "yzz", "yyz", "xyz"],
+    4: [
+        "xxxx", "yyyy", "zzzz", "xxxy", "xxxz", "xyyy", "yyyz", "xzzz", "yzzz", "xxyy", "xxzz", "yyzz", "xxyz", "xyyz",
+        "xyzz"
+    ],
+}
+
 
 def row_cartesian_order(L):
     idx = -1
@@ -14,8 +37,42 @@ def row_cartesian_order(L):
             yield (idx, l, m, n)
 
 
+def molden_cartesian_order(L):
+    if L not in _molden_orders:
+        raise KeyError("Cartesian order 'molden' is only defined through L = %d" % max(_molden_orders))
+
+    for idx, name in enumerate(_molden_orders[L]):
+        yield (idx, name.count("x"), name.count("y"), name.count("z"))
+
+
+_cartesian_orders = {"row": row_cartesian_order, "cca": row_cartesian_order, "molden": molden_cartesian_order}
+
+
 def cartesian_order_factory(L, order="row"):
-    if order == "row":
-        return row_cartesian_order(L)
-    else:
+    if order not in _cartesian_orders:
         raise KeyError("Cartesian order '%s' not understood" % order)
+    return _cartesian_orders[order](L)
+
+
+def gaussian_spherical_order(L):
+    yield (0, 0)
+    for m in range(1, L + 1):
+        yield (2 * m - 1, m)
+        yield (2 * m, -m)
+
+
+def cca_spherical_order(L):
+    for idx, m in enumerate(range(-L, L + 1)):
+        yield (idx, m)
+
+
+_spherical_orders = {"gaussian": gaussian_spherical_order, "cca": cca_spherical_order}
+
+
+def spherical_order_factory(L, order="gaussian"):
+    """
+    Yields the (idx, m) of each spherical component.
+    """
+    if order not in _spherical_orders:
+        raise KeyError("Spherical order '%s' not understood" % order)
+    return _spherical_orders[order](L)
@@ -0,0 +1,135 @@
+"""
+Writes the generated NumPy kernels as real modules of the gau2grid.kernels package.
+
+Precompiled kernels are imported like any other module, their bytecode is cached and they have real filenames and
+line numbers for tracebacks and profilers. setup.py runs this at install time, for a source checkout run:
+    python -m gau2grid.precompile --max-am 8
+"""
+
+import argparse
+import glob
+import itertools
+import os
+import py_compile
+import sys
+
+from . import generator
+from . import kernels
+
+# The highest angular momentum written by default
+default_max_am = 6
+
+_header = '''"""
+Generated NumPy collocation kernel for angular momenta up to L=%d in %s cartesian and %s spherical order with %s
+normalization, do not edit.
+
+Written by gau2grid.precompile, see generator.numpy_generator.
+"""
+
+generator_digest = %s
+
+
+'''
+
+
+def kernel_directory():
+    """
+    Returns the directory of the gau2grid.kernels package.
+    """
+    return os.path.dirname(os.path.abspath(kernels.__file__))
+
+
+def write_kernels(max_am=default_max_am,
+                  directory=None,
+                  cart_orders=("row", ),
+                  spherical_orders=("gaussian", ),
+                  normalizations=("none", ),
+                  compile=True):
+    """
+    Writes the kernel modules for angular momenta 0 through max_am.
+
+    Parameters
+    ----------
+    max_am : int
+        The highest angular momentum to write a kernel for
+    directory : str, optional
+        The directory to write the modules to, the gau2grid.kernels package if None
+    cart_orders : tuple of str
+        The cartesian orders to write kernels for
+    spherical_orders : tuple of str
+        The spherical orders to write kernels for
+    normalizations : tuple of str
+        The normalization conventions to write kernels for
+    compile : bool
+        Also write the bytecode of each module
+
+    Returns
+    -------
+    filenames : list of str
+        The modules written
+    """
+
+    if directory is None:
+        directory = kernel_directory()
+
+    ret = []
+    for cart_order, spherical_order, normalization, L in itertools.product(cart_orders, spherical_orders,
+                                                                           normalizations, range(max_am + 1)):
+        code = generator.numpy_generator(L, function_name="generated_compute_numpy_shells", cart_order=cart_order,
+                                         spherical_order=spherical_order, normalization=normalization)
+
+        filename = os.path.join(directory, kernels.module_name(L, cart_order, spherical_order, normalization) + ".py")
+        with open(filename, "w") as handle:
+            handle.write(_header % (L, cart_order, spherical_order, normalization, repr(kernels.source_digest())))
+            handle.write(code)
+            handle.write("\n")
+
+        if compile:
+            py_compile.compile(filename, doraise=True)
+        ret.append(filename)
+
+    return ret
+
+
+def clean_kernels(directory=None):
+    """
+    Removes all kernel modules written by write_kernels, returns the files removed.
+    """
+
+    if directory is None:
+        directory = kernel_directory()
+
+    ret = glob.glob(os.path.join(directory, "numpy_*_L*.py"))
+    ret += glob.glob(os.path.join(directory, "__pycache__", "numpy_*_L*.pyc"))
+    for filename in ret:
+        os.remove(filename)
+    return ret
+
+
+def main(argv=None):
+    """
+    The command line interface.
+    """
+
+    parser = argparse.ArgumentParser(prog="python -m gau2grid.precompile", description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--max-am", type=int, default=default_max_am, help="the highest angular momentum to write")
+    parser.add_argument("--cart-order", nargs="+", default=["row"], help="the cartesian orders to write")
+    parser.add_argument("--spherical-order", nargs="+", default=["gaussian"], help="the spherical orders to write")
+    parser.add_argument("--normalization", nargs="+", default=["none"], help="the normalizations to write")
+    parser.add_argument("--output", help="the directory to write to, the gau2grid.kernels package by default")
+    parser.add_argument("--clean", action="store_true", help="remove the written kernels instead")
+    args = parser.parse_args(argv)
+
+    if args.clean:
+        filenames = clean_kernels(args.output)
+        print("Removed %d kernel modules" % len(filenames))
+    else:
+        filenames = write_kernels(args.max_am, directory=args.output, cart_orders=args.cart_order,
+                                  spherical_orders=args.spherical_order, normalizations=args.normalization)
+        print("Wrote %d kernel modules to %s" % (len(filenames), os.path.dirname(filenames[0])))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
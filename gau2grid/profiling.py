@@ -0,0 +1,184 @@
+"""
+Opt-in stage-level instrumentation of the collocation kernels and drivers.
+
+Profiling is off unless a Profiler is active:
+    with gau2grid.profiling.Profiler() as prof:
+        gau2grid.driver.compute_basis_collocation(xyz, basis, grad=1)
+    report = prof.report()
+
+While a profiler is active the driver uses instrumented kernels which record the wall time of every stage of a
+kernel call, "distance", "radial", "powers", "cartesian", and "spherical", the driver itself records "screening",
+"scatter", and "cache", the fused drivers of xc.py record "contraction", and the number of exponentials evaluated
+and screened, shells, points, and blocks are counted. With no active profiler the regular, uninstrumented kernels
+are used.
+
+A profiler is active in the thread that entered it, gau2grid calls made by other threads are not recorded. The
+drivers run their worker threads with the profiler of the calling thread, see propagate.
+
+Profiler(memory=True) also records the peak bytes allocated by every stage through tracemalloc, tracing slows the
+kernels down by an order of magnitude or more so stage times are only meaningful without it. Allocations are
+traced process-wide, the byte counts are only valid for drivers run with nthreads=1 as the stages of other threads
+allocate concurrently. The peak is reset at the start of every stage on Python 3.9 and later, earlier versions
+record the bytes still allocated at the end of a stage instead of its peak.
+"""
+
+import json
+import threading
+import time
+import tracemalloc
+
+# The active Profiler and the Profilers it replaced, per thread
+_local = threading.local()
+
+# tracemalloc.reset_peak is new in Python 3.9
+_reset_peak = getattr(tracemalloc, "reset_peak", None)
+
+
+def current():
+    """
+    Returns the Profiler active in the calling thread, None when profiling is off.
+    """
+    return getattr(_local, "active", None)
+
+
+def propagate(func):
+    """
+    Returns func wrapped to run with the Profiler active in the calling thread, for the worker threads of drivers.
+    """
+
+    prof = current()
+    if prof is None:
+        return func
+
+    def wrapper(*args, **kwargs):
+        previous = current()
+        _local.active = prof
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.active = previous
+
+    return wrapper
+
+
+class Profiler(object):
+    """
+    Accumulates the time and allocated bytes of each stage and named counters over every instrumented call made
+    while it is active in the calling thread, see the module documentation. Profilers are thread-safe.
+
+    Parameters
+    ----------
+    memory : bool
+        Trace the bytes allocated by each stage with tracemalloc
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self._lock = threading.Lock()
+        self._started_tracing = False
+        self._enter_time = None
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all stages and counters.
+        """
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+            self.wall_time = 0.0
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        if not hasattr(_local, "stack"):
+            _local.stack = []
+        _local.stack.append(current())
+        _local.active = self
+        self._enter_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.wall_time += time.perf_counter() - self._enter_time
+        _local.active = _local.stack.pop()
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def start(self):
+        """
+        Returns the token the first stage of a call is measured from.
+        """
+        if self.memory and tracemalloc.is_tracing():
+            if _reset_peak is not None:
+                _reset_peak()
+            return (time.perf_counter(), tracemalloc.get_traced_memory()[0])
+        return (time.perf_counter(), None)
+
+    def record(self, stage, token):
+        """
+        Adds the time, and the peak bytes allocated above the memory in use, since token to stage. Returns the
+        token of the next stage.
+        """
+
+        elapsed = time.perf_counter() - token[0]
+        nbytes = 0
+        if (token[1] is not None) and tracemalloc.is_tracing():
+            current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            nbytes = max((peak_bytes if _reset_peak is not None else current_bytes) - token[1], 0)
+
+        with self._lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = self.stages[stage] = {"calls": 0, "time": 0.0, "bytes": 0}
+            entry["calls"] += 1
+            entry["time"] += elapsed
+            entry["bytes"] += nbytes
+
+        return self.start()
+
+    def count(self, **counters):
+        """
+        Adds to the named counters.
+        """
+        with self._lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def report(self):
+        """
+        Returns the profile as a dictionary:
+            wall_time : the time spent inside the profiler's with block
+            stages    : the "calls", "time", "bytes", and "fraction" of the total stage time of every stage
+            counters  : the counters, see the module documentation
+        """
+
+        with self._lock:
+            stages = {name: dict(entry) for name, entry in self.stages.items()}
+            counters = dict(self.counters)
+            wall_time = self.wall_time
+
+        total = sum(entry["time"] for entry in stages.values())
+        for entry in stages.values():
+            entry["fraction"] = (entry["time"] / total) if total else 0.0
+
+        return {"wall_time": wall_time, "stages": stages, "counters": counters}
+
+    def json_lines(self):
+        """
+        Returns the report as JSON lines, one {"kind": "stage", "name": ...} line per stage followed by one
+        {"kind": "counter", "name": ..., "value": ...} line per counter.
+        """
+
+        report = self.report()
+
+        ret = []
+        for name in sorted(report["stages"]):
+            ret.append(json.dumps(dict(kind="stage", name=name, **report["stages"][name]), sort_keys=True))
+        for name in sorted(report["counters"]):
+            ret.append(json.dumps({"kind": "counter", "name": name, "value": report["counters"][name]}))
+
+        return "\n".join(ret)
@@ -3,11 +3,28 @@ Python reference for the collocation matrix and transformation code.
 """
 import numpy as np
 
+from . import layout
+from . import normalization as norm
 from . import order
+from . import profiling
+from . import radial
 from . import RSH
 
 
-def compute_collocation(xyz, L, coeffs, exponents, center, grad=0, spherical=True, cart_order="row"):
+def compute_collocation(xyz,
+                        L,
+                        coeffs,
+                        exponents,
+                        center,
+                        grad=0,
+                        spherical=True,
+                        cart_order="row",
+                        out=None,
+                        xyz_soa=False,
+                        spherical_order="gaussian",
+                        normalization="none",
+                        components=None,
+                        exp_atol=None):
     """
     Computes the collocation matrix for a given set of cartesian points and a contracted gaussian of the form:
         \sum_i coeff_i e^(exponent_i * R^2)
@@ -16,7 +33,7 @@ def compute_collocation(xyz, L, coeffs, exponents, center, grad=0, spherical=Tru
     Parameters
     ----------
     xyz : array_like
-        The (N, 3) cartesian points to compute the grid on
+        The (N, 3) cartesian points to compute the grid on, or (3, N) / (x, y, z) if xyz_soa
     L : int
         The angular momentum of the gaussian
     coeffs : array_like
@@ -25,31 +42,85 @@ def compute_collocation(xyz, L, coeffs, exponents, center, grad=0, spherical=Tru
         The exponents of the gaussian
     center : array_like
         The cartesian center of the gaussian
-
-
+    grad : int
+        The derivative level to compute
+    spherical : bool
+        Transform the shell to spherical harmonics or not
+    cart_order : str
+        The cartesian ordering of the shell
+    out : array_like, optional
+        The (ncomp, nfunc, N) tensor to write the results to, see layout.py
+    xyz_soa : bool
+        If True xyz is in structure-of-arrays form, a (3, N) array or a (x, y, z) tuple of arrays
+    spherical_order : str
+        The spherical ordering of the shell, see order.py
+    normalization : str
+        The normalization convention, see normalization.py
+    components : tuple of str, optional
+        Only compute this selection of components, see layout.select_components, grad is then ignored
+    exp_atol : float, optional
+        Truncate the primitive exponentials below this absolute value to zero, see radial.exp_cutoff, exact if None
+
+    Returns
+    -------
+    output : dict of array_like
+        The (nfunc, N) views of each component of the output tensor
     """
 
+    if components is not None:
+        components, grad = layout.select_components(components)
+        full = compute_collocation(xyz, L, coeffs, exponents, center, grad=grad, spherical=spherical,
+                                   cart_order=cart_order, xyz_soa=xyz_soa, spherical_order=spherical_order,
+                                   normalization=normalization, exp_atol=exp_atol)
+        if out is None:
+            out = np.zeros((len(components), ) + full["PHI"].shape)
+        for num, name in enumerate(components):
+            out[num] = full[name]
+        return layout.output_dict(out, grad, components)
+
+    prof = profiling.current()
+    if prof is not None:
+        tic = prof.start()
+
     # Unpack the shell data
     nprim = len(coeffs)
-    npoints = xyz.shape[0]
+    if normalization == "full":
+        coeffs = norm.contraction_coefficients(L, coeffs, exponents)
 
     # First compute the diff distance in each cartesian
-    xc = xyz[:, 0] - center[0]
-    yc = xyz[:, 1] - center[1]
-    zc = xyz[:, 2] - center[2]
+    if xyz_soa:
+        xc = xyz[0] - center[0]
+        yc = xyz[1] - center[1]
+        zc = xyz[2] - center[2]
+    else:
+        xc = xyz[:, 0] - center[0]
+        yc = xyz[:, 1] - center[1]
+        zc = xyz[:, 2] - center[2]
+    npoints = xc.shape[0]
     R2 = xc * xc + yc * yc + zc * zc
+    if prof is not None:
+        prof.count(kernel_calls=1, shells=1, shell_points=npoints)
+        tic = prof.record("distance", tic)
 
     # Build up the derivates in each direction
     V1 = np.zeros((npoints))
     V2 = np.zeros((npoints))
     V3 = np.zeros((npoints))
+    V4 = np.zeros((npoints))
     for K in range(nprim):
         T1 = coeffs[K] * np.exp(-exponents[K] * R2)
+        if exp_atol is not None:
+            T1[exponents[K] * R2 > radial.exp_cutoff(exp_atol)] = 0.0
         T2 = -2.0 * exponents[K] * T1
         T3 = -2.0 * exponents[K] * T2
+        T4 = -2.0 * exponents[K] * T3
         V1 += T1
         V2 += T2
         V3 += T3
+        V4 += T4
+    if prof is not None:
+        prof.count(exp_calls=nprim * npoints)
+        tic = prof.record("radial", tic)
 
     S = V1.copy()
     SX = V2 * xc
@@ -61,64 +132,69 @@ def compute_collocation(xyz, L, coeffs, exponents, center, grad=0, spherical=Tru
     SXX = V3 * xc * xc + V2
     SYY = V3 * yc * yc + V2
     SZZ = V3 * zc * zc + V2
-
-    # SX, SY, SZ, SXX, SXZ, SXZ, SYY, SYZ, SZZ
-
-    # Power matrix for higher angular momenta
-    xc_pow = np.zeros((L + 3, npoints))
-    yc_pow = np.zeros((L + 3, npoints))
-    zc_pow = np.zeros((L + 3, npoints))
-
-    xc_pow[0] = 0.0
-    yc_pow[0] = 0.0
-    zc_pow[0] = 0.0
-    xc_pow[1] = 0.0
-    yc_pow[1] = 0.0
-    zc_pow[1] = 0.0
-    xc_pow[2] = 1.0
-    yc_pow[2] = 1.0
-    zc_pow[2] = 1.0
-
-    for LL in range(3, L + 3):
+    SXXX = V4 * xc * xc * xc + 3.0 * V3 * xc
+    SYYY = V4 * yc * yc * yc + 3.0 * V3 * yc
+    SZZZ = V4 * zc * zc * zc + 3.0 * V3 * zc
+    SXXY = V4 * xc * xc * yc + V3 * yc
+    SXXZ = V4 * xc * xc * zc + V3 * zc
+    SXYY = V4 * xc * yc * yc + V3 * xc
+    SYYZ = V4 * yc * yc * zc + V3 * zc
+    SXZZ = V4 * xc * zc * zc + V3 * xc
+    SYZZ = V4 * yc * zc * zc + V3 * yc
+    SXYZ = V4 * xc * yc * zc
+
+    # Power matrix for higher angular momenta, x^p is stored at p + 3 and negative powers are zero
+    xc_pow = np.zeros((L + 4, npoints))
+    yc_pow = np.zeros((L + 4, npoints))
+    zc_pow = np.zeros((L + 4, npoints))
+
+    xc_pow[3] = 1.0
+    yc_pow[3] = 1.0
+    zc_pow[3] = 1.0
+
+    for LL in range(4, L + 4):
         xc_pow[LL] = xc_pow[LL - 1] * xc
         yc_pow[LL] = yc_pow[LL - 1] * yc
         zc_pow[LL] = zc_pow[LL - 1] * zc
+    if prof is not None:
+        tic = prof.record("powers", tic)
 
     # Allocate data
     ncart = int((L + 1) * (L + 2) / 2)
-    output = {}
-    output["PHI"] = np.zeros((ncart, npoints))
-    if grad > 0:
-        output["PHI_X"] = np.zeros((ncart, npoints))
-        output["PHI_Y"] = np.zeros((ncart, npoints))
-        output["PHI_Z"] = np.zeros((ncart, npoints))
-    if grad > 1:
-        output["PHI_XX"] = np.zeros((ncart, npoints))
-        output["PHI_YY"] = np.zeros((ncart, npoints))
-        output["PHI_ZZ"] = np.zeros((ncart, npoints))
-        output["PHI_XY"] = np.zeros((ncart, npoints))
-        output["PHI_XZ"] = np.zeros((ncart, npoints))
-        output["PHI_YZ"] = np.zeros((ncart, npoints))
-    if grad > 2:
-        raise ValueError("Only grid derivatives through Hessians (grad = 2) has been implemented")
+    names = layout.component_names(grad)
+    if out is None:
+        nfunc = (2 * L + 1) if spherical else ncart
+        out = np.zeros((len(names), nfunc, npoints))
+
+    # Cartesian components go straight to out unless they are transformed
+    if spherical:
+        cart = np.zeros((len(names), ncart, npoints))
+    else:
+        cart = out
+    output = dict(zip(names, cart))
 
     # Loop over grid ordering data
     for idx, l, m, n in order.cartesian_order_factory(L, cart_order):
-        l = l + 2
-        m = m + 2
-        n = n + 2
+        # The powers of the monomial and their first three derivatives
+        px, py, pz = l, m, n
+        l = l + 3
+        m = m + 3
+        n = n + 3
 
         ld1 = l - 1
         ld2 = l - 2
+        ld3 = l - 3
         md1 = m - 1
         md2 = m - 2
+        md3 = m - 3
         nd1 = n - 1
         nd2 = n - 2
+        nd3 = n - 3
 
         A = xc_pow[l] * yc_pow[m] * zc_pow[n]
-        AX = ld2 * xc_pow[ld1] * yc_pow[m] * zc_pow[n]
-        AY = md2 * xc_pow[l] * yc_pow[md1] * zc_pow[n]
-        AZ = nd2 * xc_pow[l] * yc_pow[m] * zc_pow[nd1]
+        AX = px * xc_pow[ld1] * yc_pow[m] * zc_pow[n]
+        AY = py * xc_pow[l] * yc_pow[md1] * zc_pow[n]
+        AZ = pz * xc_pow[l] * yc_pow[m] * zc_pow[nd1]
 
         output["PHI"][idx] = S * A
         if grad > 0:
@@ -126,23 +202,52 @@ def compute_collocation(xyz, L, coeffs, exponents, center, grad=0, spherical=Tru
             output["PHI_Y"][idx] = S * AY + SY * A
             output["PHI_Z"][idx] = S * AZ + SZ * A
         if grad > 1:
-            AXY = ld2 * md2 * xc_pow[ld1] * yc_pow[md1] * zc_pow[n]
-            AXZ = ld2 * nd2 * xc_pow[ld1] * yc_pow[m] * zc_pow[nd1]
-            AYZ = md2 * nd2 * xc_pow[l] * yc_pow[md1] * zc_pow[nd1]
-            AXX = ld2 * (ld2 - 1) * xc_pow[ld2] * yc_pow[m] * zc_pow[n]
-            AYY = md2 * (md2 - 1) * xc_pow[l] * yc_pow[md2] * zc_pow[n]
-            AZZ = nd2 * (nd2 - 1) * xc_pow[l] * yc_pow[m] * zc_pow[nd2]
+            AXY = px * py * xc_pow[ld1] * yc_pow[md1] * zc_pow[n]
+            AXZ = px * pz * xc_pow[ld1] * yc_pow[m] * zc_pow[nd1]
+            AYZ = py * pz * xc_pow[l] * yc_pow[md1] * zc_pow[nd1]
+            AXX = px * (px - 1) * xc_pow[ld2] * yc_pow[m] * zc_pow[n]
+            AYY = py * (py - 1) * xc_pow[l] * yc_pow[md2] * zc_pow[n]
+            AZZ = pz * (pz - 1) * xc_pow[l] * yc_pow[m] * zc_pow[nd2]
             output["PHI_XX"][idx] = SXX * A + SX * AX + SX * AX + S * AXX
             output["PHI_YY"][idx] = SYY * A + SY * AY + SY * AY + S * AYY
             output["PHI_ZZ"][idx] = SZZ * A + SZ * AZ + SZ * AZ + S * AZZ
             output["PHI_XY"][idx] = SXY * A + SX * AY + SY * AX + S * AXY
             output["PHI_XZ"][idx] = SXZ * A + SX * AZ + SZ * AX + S * AXZ
             output["PHI_YZ"][idx] = SYZ * A + SY * AZ + SZ * AY + S * AYZ
+        if grad > 2:
+            AXXX = px * (px - 1) * (px - 2) * xc_pow[ld3] * yc_pow[m] * zc_pow[n]
+            AYYY = py * (py - 1) * (py - 2) * xc_pow[l] * yc_pow[md3] * zc_pow[n]
+            AZZZ = pz * (pz - 1) * (pz - 2) * xc_pow[l] * yc_pow[m] * zc_pow[nd3]
+            AXXY = px * (px - 1) * py * xc_pow[ld2] * yc_pow[md1] * zc_pow[n]
+            AXXZ = px * (px - 1) * pz * xc_pow[ld2] * yc_pow[m] * zc_pow[nd1]
+            AXYY = px * py * (py - 1) * xc_pow[ld1] * yc_pow[md2] * zc_pow[n]
+            AYYZ = py * (py - 1) * pz * xc_pow[l] * yc_pow[md2] * zc_pow[nd1]
+            AXZZ = px * pz * (pz - 1) * xc_pow[ld1] * yc_pow[m] * zc_pow[nd2]
+            AYZZ = py * pz * (pz - 1) * xc_pow[l] * yc_pow[md1] * zc_pow[nd2]
+            AXYZ = px * py * pz * xc_pow[ld1] * yc_pow[md1] * zc_pow[nd1]
+            output["PHI_XXX"][idx] = SXXX * A + 3 * SXX * AX + 3 * SX * AXX + S * AXXX
+            output["PHI_YYY"][idx] = SYYY * A + 3 * SYY * AY + 3 * SY * AYY + S * AYYY
+            output["PHI_ZZZ"][idx] = SZZZ * A + 3 * SZZ * AZ + 3 * SZ * AZZ + S * AZZZ
+            output["PHI_XXY"][idx] = SXXY * A + SXX * AY + 2 * SXY * AX + 2 * SX * AXY + SY * AXX + S * AXXY
+            output["PHI_XXZ"][idx] = SXXZ * A + SXX * AZ + 2 * SXZ * AX + 2 * SX * AXZ + SZ * AXX + S * AXXZ
+            output["PHI_XYY"][idx] = SXYY * A + SYY * AX + 2 * SXY * AY + 2 * SY * AXY + SX * AYY + S * AXYY
+            output["PHI_YYZ"][idx] = SYYZ * A + SYY * AZ + 2 * SYZ * AY + 2 * SY * AYZ + SZ * AYY + S * AYYZ
+            output["PHI_XZZ"][idx] = SXZZ * A + SZZ * AX + 2 * SXZ * AZ + 2 * SZ * AXZ + SX * AZZ + S * AXZZ
+            output["PHI_YZZ"][idx] = SYZZ * A + SZZ * AY + 2 * SYZ * AZ + 2 * SZ * AYZ + SY * AZZ + S * AYZZ
+            output["PHI_XYZ"][idx] = (SXYZ * A + SXY * AZ + SXZ * AY + SYZ * AX + SX * AYZ + SY * AXZ + SZ * AXY +
+                                      S * AXYZ)
+
+    # Scale the Cartesian components, the spherical transformation undoes the scaling
+    factors = norm.cartesian_factors(L, cart_order, normalization)
+    cart *= np.array(factors)[:, None]
+    if prof is not None:
+        tic = prof.record("cartesian", tic)
 
     if spherical:
-        for k, v in output.items():
-            tmp = output[k].shape
-            output[k] = RSH.cart_to_spherical_transform(output[k], L, cart_order)
+        RSH.cart_to_spherical_transform(
+            cart, L, cart_order, out=out, spherical_order=spherical_order, normalization=normalization)
+        if prof is not None:
+            prof.record("spherical", tic)
 
-    return output
+    return layout.output_dict(out, grad)
 
@@ -0,0 +1,146 @@
+"""
+Radial part of contracted gaussians evaluated for all primitives at once.
+"""
+
+import numpy as np
+
+from . import profiling
+
+# Primitives with exponent * R^2 above this value are dropped, e^-100 ~ 4e-44 is far below double precision of any
+# contraction even after the (2 exponent)^grad derivative factors
+primitive_cutoff = 100.0
+
+# Masked exponentials are several times slower per point than plain ones, they are only used when fewer than this
+# fraction of the points in a block are significant
+_sparse_exp_fraction = 0.02
+
+
+def exp_cutoff(exp_atol=None):
+    """
+    Returns the exponent * R^2 above which a primitive exponential is truncated to zero for the absolute threshold
+    exp_atol, every truncated exponential is then below exp_atol, its peak value being one. This is a primitive
+    truncation and not an accuracy target, a truncated value has no correct digits. Without a threshold only
+    exponentials that are negligible in double precision (primitive_cutoff) are truncated.
+    """
+    if exp_atol is None:
+        return primitive_cutoff
+
+    if not (0.0 < exp_atol < 1.0):
+        raise ValueError("The exponential truncation threshold exp_atol must be between 0 and 1, found %s" %
+                         str(exp_atol))
+
+    return min(primitive_cutoff, -np.log(exp_atol))
+
+
+def _screened_exp(arg, mask):
+    """
+    Returns e^-arg, zero where mask is False, and the number of exponentials evaluated. A masked exponential on a
+    fragmented mask is 4-7x slower per element than a plain one, so the whole block is evaluated and the entries
+    outside the mask are zeroed afterwards unless fewer than _sparse_exp_fraction of its entries are significant.
+    arg is overwritten.
+    """
+
+    np.negative(arg, out=arg)
+    nsignificant = np.count_nonzero(mask)
+    if nsignificant > _sparse_exp_fraction * mask.size:
+        E = np.exp(arg, out=arg)
+        if nsignificant < mask.size:
+            np.copyto(E, 0.0, where=~mask)
+        return E, mask.size
+
+    E = np.zeros(arg.shape)
+    np.exp(arg, out=E, where=mask)
+    return E, nsignificant
+
+
+def radial_derivatives(R2, coeffs, exponents, grad=0, exp_atol=None):
+    """
+    Computes the radial derivatives of a contracted gaussian:
+        V_k = \\sum_i coeff_i (-2 exponent_i)^k e^(-exponent_i R^2),  k = 0 .. grad
+
+    The exponentials of every primitive are evaluated as a single (nprim, npoints) block and contracted with one
+    matrix product. A primitive is dropped from the block if exponent * R^2 exceeds the cutoff (see exp_cutoff) on
+    every point of the block for every shell, when only a few significant points remain in the block the exponential
+    is only evaluated on those. Primitives with zero coefficients, such as the padding of batched shells, are never
+    evaluated.
+
+    With a truncation threshold exp_atol every primitive exponential below exp_atol is truncated to zero, the
+    absolute error of V_k is then bounded by exp_atol * \\sum_i |coeff_i| (2 exponent_i)^k, the radial derivative
+    scale at the center of the shell. Exponentials are only saved for the primitives that are truncated on the
+    whole block and for very sparse blocks, the truncated values are zero either way.
+
+    While a profiler is active the exponentials evaluated ("exp_calls") and screened ("exp_screened") are counted,
+    see profiling.py.
+
+    Parameters
+    ----------
+    R2 : array_like
+        The (..., npoints) squared distances to the shell centers
+    coeffs : array_like
+        The (..., nprim) contraction coefficients, leading axes broadcast against those of R2
+    exponents : array_like
+        The (..., nprim) exponents
+    grad : int
+        The highest radial derivative to compute
+    exp_atol : float, optional
+        The absolute value below which the primitive exponentials, whose peak is one, are truncated to zero, exact
+        to double precision if None
+
+    Returns
+    -------
+    V : array_like
+        The (grad + 1, ..., npoints) radial derivatives
+    """
+
+    batch = R2.shape[:-1]
+    npoints = R2.shape[-1]
+    coeffs = np.asarray(coeffs, dtype=np.double)
+    exponents = np.asarray(exponents, dtype=np.double)
+    if coeffs.shape[:-1] != batch:
+        coeffs = np.broadcast_to(coeffs, batch + coeffs.shape[-1:])
+        exponents = np.broadcast_to(exponents, batch + exponents.shape[-1:])
+    nprim = coeffs.shape[-1]
+    cutoff = exp_cutoff(exp_atol)
+
+    if (npoints == 0) or (nprim == 0):
+        return np.zeros((grad + 1, ) + R2.shape)
+
+    prof = profiling.current()
+    if prof is not None:
+        nexp = coeffs.size * npoints
+
+    # Drop the primitives that vanish on the whole block
+    active = exponents * R2.min(axis=-1)[..., None] <= cutoff
+    active &= coeffs != 0.0
+    keep = active.reshape(-1, nprim).any(axis=0)
+    if not keep.all():
+        keep = np.flatnonzero(keep)
+        if keep.shape[0] == 0:
+            if prof is not None:
+                prof.count(exp_screened=nexp)
+            return np.zeros((grad + 1, ) + R2.shape)
+
+        coeffs = coeffs[..., keep]
+        exponents = exponents[..., keep]
+        active = active[..., keep]
+
+    # (..., nkeep, npoints) exponentials, evaluated only where they are significant
+    arg = exponents[..., :, None] * R2[..., None, :]
+    mask = arg <= cutoff
+    mask &= active[..., None]
+    E, nsignificant = _screened_exp(arg, mask)
+
+    if prof is not None:
+        prof.count(exp_calls=nsignificant, exp_screened=nexp - nsignificant)
+
+    # (..., grad + 1, nkeep) weights coeff_i (-2 exponent_i)^k
+    weights = np.empty(batch + (grad + 1, coeffs.shape[-1]))
+    weights[..., 0, :] = coeffs
+    for k in range(1, grad + 1):
+        np.multiply(weights[..., k - 1, :], -2.0 * exponents, out=weights[..., k, :])
+
+    # (..., grad + 1, npoints) to (grad + 1, ..., npoints)
+    V = np.matmul(weights, E)
+    if len(batch):
+        V = V.transpose((len(batch), ) + tuple(range(len(batch))) + (len(batch) + 1, ))
+    return V
@@ -0,0 +1,171 @@
+"""
+Shell extents and a spatial index to find the significant shells of a block of points.
+"""
+
+import math
+
+import numpy as np
+
+from . import basis as basis_set
+
+
+def shell_cutoff_radius(L, coeffs, exponents, threshold=1.e-14, grad=0):
+    """
+    Estimates the distance beyond which a contracted shell (and its derivatives through grad) are smaller
+    than threshold. The envelope used is:
+        sum_i |coeff_i| (L + 2 exponent_i r)^grad r^L e^(-exponent_i r^2)
+
+    Parameters
+    ----------
+    L : int
+        The angular momentum of the gaussian
+    coeffs : array_like
+        The coefficients of the gaussian
+    exponents : array_like
+        The exponents of the gaussian
+    threshold : float
+        The value below which the shell is considered negligible
+    grad : int
+        The derivative level the radius must hold for
+
+    Returns
+    -------
+    radius : float
+        The cutoff radius of the shell
+    """
+
+    coeffs = np.abs(np.asarray(coeffs, dtype=np.double))
+    exponents = np.asarray(exponents, dtype=np.double)
+
+    def envelope(r):
+        return np.sum(coeffs * (L + 2.0 * exponents * r)**grad * np.exp(-exponents * r * r)) * r**L
+
+    # Every term of the envelope decreases past this point
+    lower = math.sqrt((L + grad) / (2.0 * exponents.min()))
+    if envelope(lower) <= threshold:
+        return lower
+
+    upper = max(2.0 * lower, 1.0)
+    while envelope(upper) > threshold:
+        lower = upper
+        upper *= 2.0
+
+    # Bisect to a relative precision of ~1.e-6
+    while (upper - lower) > 1.e-6 * upper:
+        mid = 0.5 * (lower + upper)
+        if envelope(mid) > threshold:
+            lower = mid
+        else:
+            upper = mid
+
+    return upper
+
+
+class ShellIndex(object):
+    """
+    A uniform cell index over the spheres (center, radius) of each shell's extent.
+
+    Each shell is binned into every cell its bounding box touches so that a query for a compact block of
+    points only visits the cells the block overlaps, its cost is proportional to the number of shells returned.
+    """
+
+    def __init__(self, centers, radii, cell_size=None):
+
+        self.centers = np.asarray(centers, dtype=np.double).reshape(-1, 3)
+        self.radii = np.asarray(radii, dtype=np.double)
+        self.nshell = self.radii.shape[0]
+
+        if self.centers.shape[0] != self.nshell:
+            raise ValueError("ShellIndex: centers and radii must have the same length")
+
+        if cell_size is None:
+            cell_size = np.median(self.radii) if self.nshell else 1.0
+        self.cell_size = max(float(cell_size), 1.e-8)
+
+        cells = {}
+        lower = np.floor((self.centers - self.radii[:, None]) / self.cell_size).astype(int)
+        upper = np.floor((self.centers + self.radii[:, None]) / self.cell_size).astype(int)
+        for shell in range(self.nshell):
+            lx, ly, lz = lower[shell]
+            ux, uy, uz = upper[shell]
+            for i in range(lx, ux + 1):
+                for j in range(ly, uy + 1):
+                    for k in range(lz, uz + 1):
+                        cells.setdefault((i, j, k), []).append(shell)
+
+        self.cells = {k: np.array(v, dtype=int) for k, v in cells.items()}
+
+    def query(self, lower, upper):
+        """
+        Returns the sorted indices of all shells whose extent intersects the box [lower, upper].
+        """
+
+        lower = np.asarray(lower, dtype=np.double)
+        upper = np.asarray(upper, dtype=np.double)
+
+        clower = np.floor(lower / self.cell_size).astype(int)
+        cupper = np.floor(upper / self.cell_size).astype(int)
+
+        # Huge boxes touch more cells than exist, a direct test is cheaper
+        ncells = np.prod(cupper - clower + 1)
+        if ncells > len(self.cells):
+            candidates = [v for k, v in self.cells.items() if np.all(k >= clower) and np.all(k <= cupper)]
+        else:
+            candidates = []
+            for i in range(clower[0], cupper[0] + 1):
+                for j in range(clower[1], cupper[1] + 1):
+                    for k in range(clower[2], cupper[2] + 1):
+                        cell = self.cells.get((i, j, k))
+                        if cell is not None:
+                            candidates.append(cell)
+
+        if len(candidates) == 0:
+            return np.zeros((0), dtype=int)
+
+        candidates = np.unique(np.concatenate(candidates))
+
+        # Exact sphere-box distance test
+        closest = np.clip(self.centers[candidates], lower, upper)
+        dist2 = np.sum((closest - self.centers[candidates])**2, axis=1)
+        return candidates[dist2 <= self.radii[candidates]**2]
+
+    def significant_shells(self, xyz, xyz_soa=False):
+        """
+        Returns the sorted indices of the shells that are significant on the (N, 3) or (3, N) if xyz_soa points.
+        """
+        if xyz_soa:
+            lower = [np.min(xyz[0]), np.min(xyz[1]), np.min(xyz[2])]
+            upper = [np.max(xyz[0]), np.max(xyz[1]), np.max(xyz[2])]
+            return self.query(lower, upper)
+
+        xyz = np.asarray(xyz)[:, :3]
+        return self.query(xyz.min(axis=0), xyz.max(axis=0))
+
+
+def basis_radii(basis, threshold=1.e-14, grad=0):
+    """
+    Returns the (nshell) cutoff radius of each shell of a basis. The radii do not depend on the centers, they hold
+    for every geometry of the basis.
+    """
+
+    basis = basis_set.as_basis(basis)
+
+    radii = np.empty(basis.nshell)
+    for x in range(basis.nshell):
+        L, coeffs, exponents, center = basis.shell(x)
+        radii[x] = shell_cutoff_radius(L, coeffs, exponents, threshold, grad)
+
+    return radii
+
+
+def basis_index(basis, threshold=1.e-14, grad=0, cell_size=None, radii=None):
+    """
+    Builds the ShellIndex of a basis from the cutoff radii of each shell, radii from basis_radii may be given to
+    skip their construction.
+    """
+
+    basis = basis_set.as_basis(basis)
+    if radii is None:
+        radii = basis_radii(basis, threshold=threshold, grad=grad)
+
+    return ShellIndex(basis.shell_centers, radii, cell_size=cell_size)
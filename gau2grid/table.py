@@ -0,0 +1,248 @@
+"""
+Table-driven collocation kernel whose cost does not grow with the number of Cartesian components.
+
+Every Cartesian component of a shell is evaluated at once: the monomials of each degree are built from the degree
+below with a single gather-multiply and the angular factor of every derivative is looked up in small per-L tables of
+monomial indices and prefactors, as (ncart, npoints) blocks. Only a handful of vectorized statements are executed per
+derivative component.
+"""
+
+import numpy as np
+
+from . import layout
+from . import memoize
+from . import normalization as norm
+from . import order
+from . import profiling
+from . import radial
+from . import RSH
+
+
+def _binomial(n, k):
+    ret = 1
+    for x in range(k):
+        ret = ret * (n - x) // (x + 1)
+    return ret
+
+
+def _degree_monomials(d):
+    """
+    Returns the (l, m, n) monomials of degree d in row order.
+    """
+    return [(l, m, n) for idx, l, m, n in order.row_cartesian_order(d)]
+
+
+@memoize.memoize(persist=True)
+def angular_tables(L, cart_order, grad, normalization="none", components=None):
+    """
+    Builds the lookup tables of the Cartesian components of angular momentum L, the Cartesian scaling of the
+    normalization convention is folded into the prefactors. Only the derivatives of a selection of components are
+    tabulated if given.
+
+    Returns
+    -------
+    recurrence : list
+        For each degree d = 1..L, the (parent index in degree d - 1, direction) arrays building the degree d
+        monomials as parent * (x, y, z)[direction]
+    derivatives : dict
+        For each derivative index beta, the (degree, (ncart) monomial indices into that degree, (ncart) prefactors)
+        of d^beta x^l y^m z^n for every component
+    terms : list
+        For each output component in layout (or selection) order, a list of (binomial, alpha, beta) whose sum
+        binomial * d^alpha S * d^beta (x^l y^m z^n) is the component
+    """
+
+    lmn = np.zeros((int((L + 1) * (L + 2) / 2), 3), dtype=int)
+    for idx, l, m, n in order.cartesian_order_factory(L, cart_order):
+        lmn[idx] = (l, m, n)
+    factors = np.array(norm.cartesian_factors(L, cart_order, normalization))
+
+    # Monomials of every degree from the degree below
+    recurrence = []
+    for d in range(1, L + 1):
+        lower = {mono: num for num, mono in enumerate(_degree_monomials(d - 1))}
+        parents = []
+        directions = []
+        for mono in _degree_monomials(d):
+            direction = [p > 0 for p in mono].index(True)
+            parent = list(mono)
+            parent[direction] -= 1
+            parents.append(lower[tuple(parent)])
+            directions.append(direction)
+        recurrence.append((np.array(parents, dtype=int), np.array(directions, dtype=int)))
+
+    derivatives = {}
+    terms = []
+    for name in (layout.component_names(grad) if components is None else components):
+        letters = name.split("_")[-1] if "_" in name else ""
+        deriv = (letters.count("X"), letters.count("Y"), letters.count("Z"))
+
+        comp_terms = []
+        for ax in range(deriv[0] + 1):
+            for ay in range(deriv[1] + 1):
+                for az in range(deriv[2] + 1):
+                    alpha = (ax, ay, az)
+                    beta = (deriv[0] - ax, deriv[1] - ay, deriv[2] - az)
+
+                    if beta not in derivatives:
+                        pref = factors.copy()
+                        for direction in range(3):
+                            for k in range(beta[direction]):
+                                pref *= np.maximum(lmn[:, direction] - k, 0)
+
+                        degree = L - sum(beta)
+                        if degree >= 0:
+                            lookup = {mono: num for num, mono in enumerate(_degree_monomials(degree))}
+                            index = [lookup.get(tuple(p), 0) for p in np.maximum(lmn - beta, 0)]
+                        else:
+                            index = [0] * lmn.shape[0]
+                        derivatives[beta] = (degree, np.array(index, dtype=int), pref)
+
+                    # Derivatives that vanish on every component
+                    if not np.any(derivatives[beta][2]):
+                        continue
+
+                    binom = _binomial(deriv[0], ax) * _binomial(deriv[1], ay) * _binomial(deriv[2], az)
+                    comp_terms.append((binom, alpha, beta))
+
+        terms.append(comp_terms)
+
+    return recurrence, derivatives, terms
+
+
+def compute_collocation(xyz,
+                        L,
+                        coeffs,
+                        exponents,
+                        center,
+                        grad=0,
+                        spherical=True,
+                        cart_order="row",
+                        out=None,
+                        xyz_soa=False,
+                        exp_atol=None,
+                        spherical_order="gaussian",
+                        normalization="none",
+                        components=None):
+    """
+    Computes the collocation matrix of a contracted gaussian with lookup tables, see python_reference for the
+    parameters. Like the generated kernels (nshell, 3) centers and (nshell, nprim) padded primitives evaluate many
+    shells of the same L at once into (nshell, nfunc, npoints) arrays. Primitive exponentials below exp_atol are
+    truncated to zero if given, see radial.radial_derivatives. The normalization convention is folded
+    into the tables and coefficients, see normalization.py. If components is a selection of component names only
+    those are computed, see layout.select_components, and grad is ignored. Stages are recorded to the active
+    profiler, see profiling.py.
+    """
+
+    if components is not None:
+        components, grad = layout.select_components(components)
+
+    prof = profiling.current()
+    if prof is not None:
+        tic = prof.start()
+
+    center = np.asarray(center, dtype=np.double)
+    coeffs = np.asarray(coeffs, dtype=np.double)
+    exponents = np.asarray(exponents, dtype=np.double)
+    if normalization == "full":
+        coeffs = norm.contraction_coefficients(L, coeffs, exponents)
+
+    # First compute the diff distance in each cartesian
+    if xyz_soa:
+        xc = xyz[0] - center[..., 0, None]
+        yc = xyz[1] - center[..., 1, None]
+        zc = xyz[2] - center[..., 2, None]
+    else:
+        xc = xyz[:, 0] - center[..., 0, None]
+        yc = xyz[:, 1] - center[..., 1, None]
+        zc = xyz[:, 2] - center[..., 2, None]
+    npoints = xc.shape[-1]
+    R2 = xc * xc + yc * yc + zc * zc
+    if prof is not None:
+        nshell = R2.size // max(npoints, 1)
+        prof.count(kernel_calls=1, shells=nshell, shell_points=nshell * npoints)
+        tic = prof.record("distance", tic)
+
+    # Radial derivatives V_k = sum_i coeff_i (-2 exponent_i)^k e^(-exponent_i R^2) of all primitives at once
+    V = radial.radial_derivatives(R2, coeffs, exponents, grad, exp_atol=exp_atol)
+    if prof is not None:
+        tic = prof.record("radial", tic)
+
+    S = {(0, 0, 0): V[0]}
+    if grad > 0:
+        S[(1, 0, 0)] = V[1] * xc
+        S[(0, 1, 0)] = V[1] * yc
+        S[(0, 0, 1)] = V[1] * zc
+    if grad > 1:
+        S[(2, 0, 0)] = V[2] * xc * xc + V[1]
+        S[(0, 2, 0)] = V[2] * yc * yc + V[1]
+        S[(0, 0, 2)] = V[2] * zc * zc + V[1]
+        S[(1, 1, 0)] = V[2] * xc * yc
+        S[(1, 0, 1)] = V[2] * xc * zc
+        S[(0, 1, 1)] = V[2] * yc * zc
+    if grad > 2:
+        S[(3, 0, 0)] = V[3] * xc * xc * xc + 3.0 * V[2] * xc
+        S[(0, 3, 0)] = V[3] * yc * yc * yc + 3.0 * V[2] * yc
+        S[(0, 0, 3)] = V[3] * zc * zc * zc + 3.0 * V[2] * zc
+        S[(2, 1, 0)] = V[3] * xc * xc * yc + V[2] * yc
+        S[(2, 0, 1)] = V[3] * xc * xc * zc + V[2] * zc
+        S[(1, 2, 0)] = V[3] * xc * yc * yc + V[2] * xc
+        S[(0, 2, 1)] = V[3] * yc * yc * zc + V[2] * zc
+        S[(1, 0, 2)] = V[3] * xc * zc * zc + V[2] * xc
+        S[(0, 1, 2)] = V[3] * yc * zc * zc + V[2] * yc
+        S[(1, 1, 1)] = V[3] * xc * yc * zc
+
+    # Monomials of every degree, (..., ndegree, npoints)
+    recurrence, derivatives, terms = angular_tables(L, cart_order, grad, normalization, components)
+    coords = np.stack([xc, yc, zc], axis=-2)
+    monomials = [np.ones(R2.shape[:-1] + (1, npoints))]
+    for parents, directions in recurrence:
+        monomials.append(monomials[-1][..., parents, :] * coords[..., directions, :])
+    if prof is not None:
+        tic = prof.record("powers", tic)
+
+    # Allocate data
+    ncart = int((L + 1) * (L + 2) / 2)
+    names = layout.component_names(grad) if components is None else components
+    if out is None:
+        nfunc = (2 * L + 1) if spherical else ncart
+        out = np.empty((len(names), ) + R2.shape[:-1] + (nfunc, npoints))
+
+    if spherical:
+        cart = np.empty((len(names), ) + R2.shape[:-1] + (ncart, npoints))
+    else:
+        cart = out
+
+    # Angular factors of every derivative with their prefactors, (..., ncart, npoints)
+    angular = {}
+    for beta, (degree, index, pref) in derivatives.items():
+        if not np.any(pref):
+            continue
+        if np.all(pref == 1.0) and np.array_equal(index, np.arange(index.shape[0])):
+            angular[beta] = monomials[degree]
+            continue
+        tmp = monomials[degree][..., index, :]
+        tmp *= pref[:, None]
+        angular[beta] = tmp
+
+    scratch = np.empty(R2.shape[:-1] + (ncart, npoints))
+    for num, comp_terms in enumerate(terms):
+        for term_num, (binom, alpha, beta) in enumerate(comp_terms):
+            sfactor = S[alpha][..., None, :]
+            if binom != 1:
+                sfactor = binom * sfactor
+
+            if term_num == 0:
+                np.multiply(sfactor, angular[beta], out=cart[num])
+            else:
+                np.multiply(sfactor, angular[beta], out=scratch)
+                cart[num] += scratch
+    if prof is not None:
+        tic = prof.record("cartesian", tic)
+
+    if spherical:
+        np.matmul(RSH.cart_to_spherical_matrix(L, cart_order, spherical_order, normalization), cart, out=out)
+        if prof is not None:
+            prof.record("spherical", tic)
+
+    return layout.output_dict(out, grad, components)
@@ -0,0 +1,260 @@
+"""
+Collocation of one basis on many geometries, such as the frames of a molecular dynamics trajectory or of a
+geometry scan.
+
+Only the centers of the basis change from frame to frame, everything else is resolved once by a FrameEvaluator:
+the kernels, backends, and driver settings, the shell data with their folded normalization, and the cutoff radii
+of the shells, which do not depend on the geometry. A frame only builds the spatial index of its shell centers
+before its blocks are evaluated.
+"""
+
+import collections
+import concurrent.futures
+import threading
+import time
+
+import numpy as np
+
+from . import basis as basis_set
+from . import driver
+from . import normalization as norm
+from . import profiling
+from . import screening
+from . import tune
+
+
+def _shared_grid(grids, xyz_soa):
+    """
+    Returns True if grids is a single grid rather than one grid per frame, structure-of-arrays grids are a (3, N)
+    array or a sequence of three (N) arrays.
+    """
+    if isinstance(grids, np.ndarray):
+        return (grids.ndim == 2) and ((not xyz_soa) or (grids.shape[0] == 3))
+
+    if xyz_soa and isinstance(grids, (tuple, list)) and (len(grids) == 3):
+        return all(np.ndim(x) == 1 for x in grids)
+
+    return False
+
+
+class FrameEvaluator(object):
+    """
+    Computes the collocation matrices of a basis on the geometries of a trajectory, each frame being the (ncenter,
+    3) centers of the basis and the grid of that frame.
+
+    The parameters are those of driver.compute_basis_collocation and apply to every frame. Frames are evaluated
+    with compute or with map, which pipelines a sequence of frames over a thread pool. The frames, points, and time
+    spent are accumulated for report.
+    """
+
+    def __init__(self,
+                 basis,
+                 grad=0,
+                 spherical=True,
+                 cart_order="row",
+                 spherical_order="gaussian",
+                 normalization="none",
+                 backend=None,
+                 block_size=None,
+                 threshold=1.e-14,
+                 layout="component",
+                 order="C",
+                 exp_atol=None,
+                 nthreads=None,
+                 components=None):
+
+        basis = basis_set.as_basis(basis)
+        if normalization == "full":
+            basis = norm.normalize_basis(basis)
+
+        self.basis = basis
+        self.grad = grad
+        self.spherical = spherical
+        self.cart_order = cart_order
+        self.spherical_order = spherical_order
+        self.layout = layout
+        self.order = order
+        self.exp_atol = exp_atol
+        self.components = components
+
+        # The basis is already normalized, the kernels only keep the Cartesian scaling of "full"
+        self.normalization = norm.kernel_convention(normalization)
+
+        self.backends, self.block_size, self.nthreads = tune.driver_settings(grad, basis.max_am, backend, block_size,
+                                                                             nthreads)
+        self.radii = screening.basis_radii(basis, threshold=threshold, grad=grad)
+        self.cell_size = np.median(self.radii)
+
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the accumulated frame counts and times.
+        """
+        with self._lock:
+            self.frames = 0
+            self.points = 0
+            self.compute_time = 0.0
+            self.wall_time = 0.0
+
+    def frame_basis(self, centers):
+        """
+        Returns the basis on the (ncenter, 3) centers of a frame.
+        """
+        return self.basis.with_centers(centers)
+
+    def _compute(self, xyz, centers, xyz_soa, out, nthreads):
+        t = time.perf_counter()
+
+        basis = self.frame_basis(centers)
+        index = screening.ShellIndex(basis.shell_centers, self.radii, cell_size=self.cell_size)
+        ret = driver.compute_basis_collocation(xyz,
+                                               basis,
+                                               grad=self.grad,
+                                               spherical=self.spherical,
+                                               cart_order=self.cart_order,
+                                               spherical_order=self.spherical_order,
+                                               normalization=self.normalization,
+                                               backend=self.backends,
+                                               block_size=self.block_size,
+                                               index=index,
+                                               layout=self.layout,
+                                               order=self.order,
+                                               out=out,
+                                               xyz_soa=xyz_soa,
+                                               exp_atol=self.exp_atol,
+                                               nthreads=nthreads,
+                                               components=self.components)
+
+        elapsed = time.perf_counter() - t
+        npoints = xyz[0].shape[0] if xyz_soa else xyz.shape[0]
+        with self._lock:
+            self.frames += 1
+            self.points += npoints
+            self.compute_time += elapsed
+
+        prof = profiling.current()
+        if prof is not None:
+            prof.count(frames=1)
+
+        return ret, elapsed
+
+    def compute(self, xyz, centers, xyz_soa=False, out=None):
+        """
+        Computes the collocation matrices of a single frame.
+
+        Parameters
+        ----------
+        xyz : array_like
+            The (N, 3) cartesian points of the frame, or (3, N) if xyz_soa
+        centers : array_like
+            The (ncenter, 3) centers of the basis in the frame
+        xyz_soa : bool
+            If True xyz is a (3, N) structure-of-arrays block
+        out : array_like, optional
+            A zeroed output storage tensor, see driver.compute_basis_collocation
+
+        Returns
+        -------
+        output : dict of array_like
+            The (nbf, N) collocation matrices of the frame
+        """
+
+        ret, elapsed = self._compute(xyz, centers, xyz_soa, out, self.nthreads)
+        with self._lock:
+            self.wall_time += elapsed
+        return ret
+
+    def map(self, centers, grids, xyz_soa=False, nthreads=1):
+        """
+        Yields the collocation matrices of a sequence of frames in order.
+
+        Frames are computed ahead of the caller by a pool of nthreads threads, so that the evaluation of the next
+        frames overlaps the use of the current one. At most two frames per thread are held ahead of the caller.
+        With more than one frame in flight each frame runs its blocks on a single thread.
+
+        Parameters
+        ----------
+        centers : array_like
+            The (nframe, ncenter, 3) centers of the basis in each frame, or a sequence of (ncenter, 3) centers
+        grids : array_like or sequence of array_like
+            The grid of each frame, or a single (N, 3) grid that all frames share, a (3, N) array or three (N)
+            arrays if xyz_soa
+        xyz_soa : bool
+            If True the grids are (3, N) structure-of-arrays blocks
+        nthreads : int
+            The number of frames computed concurrently
+
+        Yields
+        ------
+        output : dict of array_like
+            The (nbf, N) collocation matrices of each frame
+        """
+
+        if _shared_grid(grids, xyz_soa):
+            grids = [grids] * len(centers)
+        elif len(grids) != len(centers):
+            raise ValueError("FrameEvaluator: %d frames were given but %d grids" % (len(centers), len(grids)))
+
+        frame_threads = self.nthreads if nthreads <= 1 else 1
+        compute = profiling.propagate(self._compute)
+        t = time.perf_counter()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(nthreads, 1)) as executor:
+                pending = collections.deque()
+                for xyz, frame_centers in zip(grids, centers):
+                    if len(pending) >= 2 * max(nthreads, 1):
+                        yield pending.popleft().result()[0]
+                    pending.append(executor.submit(compute, xyz, frame_centers, xyz_soa, None, frame_threads))
+                while pending:
+                    yield pending.popleft().result()[0]
+        finally:
+            with self._lock:
+                self.wall_time += time.perf_counter() - t
+
+    def report(self):
+        """
+        Returns the number of frames and points evaluated, the time spent computing them, the wall time of the
+        calls including the time the caller spent between frames of map, and the frames per second of wall time.
+        """
+        with self._lock:
+            return {
+                "frames": self.frames,
+                "points": self.points,
+                "compute_time": self.compute_time,
+                "wall_time": self.wall_time,
+                "frames_per_second": self.frames / self.wall_time if self.wall_time > 0 else 0.0,
+            }
+
+
+def compute_trajectory_collocation(xyz, basis, centers, xyz_soa=False, nthreads=1, **kwargs):
+    """
+    Computes the collocation matrices of a basis on every frame of a trajectory, see FrameEvaluator.
+
+    Parameters
+    ----------
+    xyz : array_like or sequence of array_like
+        The grid of each frame, or a single grid that all frames share, see FrameEvaluator.map
+    basis : BasisSet or list of dict
+        The basis, its centers are replaced by those of each frame
+    centers : array_like
+        The (nframe, ncenter, 3) centers of the basis in each frame
+    xyz_soa : bool
+        If True the grids are (3, N) structure-of-arrays blocks
+    nthreads : int
+        The number of frames computed concurrently
+    kwargs :
+        The options of every frame, see driver.compute_basis_collocation
+
+    Returns
+    -------
+    outputs : list of dict of array_like
+        The (nbf, N) collocation matrices of each frame
+    report : dict
+        The frame counts and timings, see FrameEvaluator.report
+    """
+
+    evaluator = FrameEvaluator(basis, **kwargs)
+    ret = list(evaluator.map(centers, xyz, xyz_soa=xyz_soa, nthreads=nthreads))
+    return ret, evaluator.report()
@@ -0,0 +1,280 @@
+"""
+Per machine tuning of the collocation driver.
+
+The fastest backend for each L, the block size, and the thread count depend on the CPU. tune() micro-benchmarks the
+candidates on a small synthetic molecule and saves the winners to a JSON profile, compute_basis_collocation then
+takes every knob that is not given explicitly from the profile of the machine it runs on.
+
+The profile lives at $GAU2GRID_PROFILE or ~/.gau2grid/profile.json. Profiles written on a different machine are
+ignored. If $GAU2GRID_AUTOTUNE is set to 1 a missing profile is tuned and saved on first use.
+"""
+
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+from . import basis as basis_set
+
+_defaults = {"backend": "numpy", "block_size": 128, "nthreads": 1}
+
+_profile_version = 1
+
+# Loaded profiles by (path, modification time)
+_loaded = {}
+
+
+def profile_path():
+    """
+    Returns the path of the tuned profile.
+    """
+    default = os.path.join(os.path.expanduser("~"), ".gau2grid", "profile.json")
+    return os.environ.get("GAU2GRID_PROFILE", default)
+
+
+def machine():
+    """
+    Returns a description of the machine, profiles only apply to the machine they were tuned on.
+    """
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+
+
+def _valid_profile(profile):
+    """
+    Checks the structure the driver reads from a profile, a dictionary of settings dictionaries by derivative level.
+    """
+    if not isinstance(profile, dict) or not isinstance(profile.get("settings"), dict):
+        return False
+    return all(isinstance(settings, dict) for settings in profile["settings"].values())
+
+
+def load_profile(path=None):
+    """
+    Returns the tuned profile at path if it exists and was tuned on this machine, otherwise None. A profile that
+    can not be read or parsed, or that lacks its settings, is treated as missing.
+    """
+
+    if path is None:
+        path = profile_path()
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    key = (path, mtime)
+    if key not in _loaded:
+        try:
+            with open(path, "r") as handle:
+                profile = json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+        if not _valid_profile(profile):
+            profile = None
+        elif (profile.get("version") != _profile_version) or (profile.get("machine") != machine()):
+            profile = None
+        _loaded[key] = profile
+
+    return _loaded[key]
+
+
+def save_profile(profile, path=None):
+    """
+    Writes a profile to path, the file is replaced at once so readers never see a partial profile.
+    """
+
+    if path is None:
+        path = profile_path()
+
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+
+    tmp = "%s.%d" % (path, os.getpid())
+    with open(tmp, "w") as handle:
+        json.dump(profile, handle, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def driver_settings(grad, max_am, backend=None, block_size=None, nthreads=None):
+    """
+    Resolves the driver knobs that are None from the tuned profile, or from the defaults if there is no profile.
+    The backend may be a list with the backend of each L, L beyond the list use its last backend.
+
+    Returns
+    -------
+    backends : list of str
+        The backend of each L through max_am
+    block_size : int
+        The number of points in each block
+    nthreads : int
+        The number of threads
+    """
+
+    settings = {}
+    if (backend is None) or (block_size is None) or (nthreads is None):
+        profile = load_profile()
+        if (profile is None) and (os.environ.get("GAU2GRID_AUTOTUNE", "0") == "1"):
+            profile = tune()
+            save_profile(profile)
+
+        if profile is not None:
+            settings = profile["settings"].get(str(grad), {})
+
+    if backend is None:
+        backends = list(settings.get("backends", [_defaults["backend"]]))
+    elif isinstance(backend, str):
+        backends = [backend]
+    else:
+        backends = list(backend)
+    backends.extend(backends[-1:] * (max_am + 1 - len(backends)))
+
+    if block_size is None:
+        block_size = settings.get("block_size", _defaults["block_size"])
+
+    if nthreads is None:
+        nthreads = settings.get("nthreads", _defaults["nthreads"])
+
+    return backends[:max_am + 1], int(block_size), int(nthreads)
+
+
+def tuning_basis(max_am=4, ncenter=4):
+    """
+    A synthetic molecule with cc-pVTZ-like contracted shells through max_am on every center.
+    """
+
+    centers = np.zeros((ncenter, 3))
+    centers[:, 0] = 2.5 * np.arange(ncenter)
+    centers[1::2, 1] = 1.5
+
+    shells = []
+    for center in centers:
+        for L in range(max_am + 1):
+            nprim = max(1, 8 - 2 * L)
+            exponents = 0.15 * 3.5**np.arange(nprim)[::-1]
+            coeffs = np.linspace(0.2, 1.0, nprim)
+            shells.append({"am": L, "coef": coeffs, "exp": exponents, "center": center})
+
+    return basis_set.BasisSet.from_dict(shells)
+
+
+def tuning_grid(basis, npoints=8192, seed=0):
+    """
+    Random points around the basis centers sorted into spatially compact blocks, like a DFT grid.
+    """
+
+    rng = np.random.RandomState(seed)
+    lower = basis.centers.min(axis=0) - 4.0
+    upper = basis.centers.max(axis=0) + 4.0
+    xyz = lower + rng.rand(npoints, 3) * (upper - lower)
+
+    return xyz[np.lexsort((xyz[:, 2], np.floor(xyz[:, 1] / 2.0), np.floor(xyz[:, 0] / 2.0)))]
+
+
+def _best_time(func, repeats):
+    ret = float("inf")
+    for x in range(repeats):
+        t = time.perf_counter()
+        func()
+        ret = min(ret, time.perf_counter() - t)
+    return ret
+
+
+def tune(max_am=6,
+         grads=(0, 1, 2),
+         backends=("numpy", "table"),
+         block_sizes=(64, 128, 256, 512, 1024),
+         nthreads=None,
+         npoints=8192,
+         spherical=True,
+         repeats=3):
+    """
+    Micro-benchmarks the driver configurations and returns a profile of the fastest, see save_profile.
+
+    For every derivative level the backend of each L is chosen first with the default block size, then the block
+    size with those backends, and finally the thread count with that block size.
+
+    Parameters
+    ----------
+    max_am : int
+        The highest angular momentum to tune the backend of, higher L use the backend of max_am
+    grads : tuple of int
+        The derivative levels to tune
+    backends : tuple of str
+        The candidate backends
+    block_sizes : tuple of int
+        The candidate block sizes
+    nthreads : tuple of int, optional
+        The candidate thread counts, powers of two through the number of CPUs if None
+    npoints : int
+        The number of grid points of the benchmarks
+    spherical : bool
+        Benchmark spherical or cartesian functions
+    repeats : int
+        The best of repeats timings is used
+
+    Returns
+    -------
+    profile : dict
+        The winning settings of each derivative level with the timings of all candidates
+    """
+
+    # Avoid a circular import, the driver consults this module
+    from . import driver
+
+    if nthreads is None:
+        nthreads = [1]
+        while nthreads[-1] * 2 <= (os.cpu_count() or 1):
+            nthreads.append(nthreads[-1] * 2)
+
+    basis = tuning_basis(max_am)
+    xyz = tuning_grid(basis, npoints)
+
+    def run(basis, grad, backend, block_size, threads):
+        kwargs = {"backend": backend, "block_size": block_size, "nthreads": threads, "spherical": spherical}
+
+        # Warm up kernel generation and the screening index outside of the timings
+        driver.compute_basis_collocation(xyz[:block_size], basis, grad=grad, **kwargs)
+        return _best_time(lambda: driver.compute_basis_collocation(xyz, basis, grad=grad, **kwargs), repeats)
+
+    settings = {}
+    timings = {}
+    for grad in grads:
+        grad_timings = {"backends": [], "block_size": {}, "nthreads": {}}
+
+        # Backend of each L on its own shells
+        best_backends = []
+        for L in range(max_am + 1):
+            shells = [shell for shell in basis.to_dict() if shell["am"] == L]
+            times = {name: run(shells, grad, name, _defaults["block_size"], 1) for name in backends}
+            best_backends.append(min(times, key=times.get))
+            grad_timings["backends"].append(times)
+
+        for size in block_sizes:
+            grad_timings["block_size"][str(size)] = run(basis, grad, best_backends, size, 1)
+        best_size = int(min(grad_timings["block_size"], key=grad_timings["block_size"].get))
+
+        for threads in nthreads:
+            grad_timings["nthreads"][str(threads)] = run(basis, grad, best_backends, best_size, threads)
+        best_threads = int(min(grad_timings["nthreads"], key=grad_timings["nthreads"].get))
+
+        settings[str(grad)] = {"backends": best_backends, "block_size": best_size, "nthreads": best_threads}
+        timings[str(grad)] = grad_timings
+
+    return {
+        "version": _profile_version,
+        "machine": machine(),
+        "npoints": npoints,
+        "spherical": spherical,
+        "settings": settings,
+        "timings": timings,
+    }
@@ -0,0 +1,280 @@
+"""
+Fused exchange-correlation quadrature drivers.
+
+The drivers evaluate the collocation of the significant shells of one block of points at a time (see
+driver.BlockKernel) and immediately contract it with the density matrix or potential of the block, the collocation
+of the entire basis is never stored and memory is bounded by the block size.
+
+Grids are (N, 3) points or the (N, 4) points and weights arrays that DFT grids usually come as, the weights are then
+taken from the fourth column unless given.
+"""
+
+import collections
+import concurrent.futures
+
+import numpy as np
+
+from . import driver
+from . import profiling
+from . import screening
+
+
+def _grid_weights(xyz, weights, xyz_soa):
+    """
+    Returns the (N) quadrature weights of a grid, from the fourth column of (N, 4) grids if weights is None.
+    """
+
+    npoints = xyz[0].shape[0] if xyz_soa else xyz.shape[0]
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.double)
+    elif (not xyz_soa) and (xyz.shape[1] > 3):
+        weights = xyz[:, 3]
+    else:
+        weights = np.ones(npoints)
+
+    if weights.shape != (npoints, ):
+        raise ValueError("The grid has %d points but %s weights were given" % (npoints, str(weights.shape)))
+    return weights
+
+
+def _run_blocks(compute_block, accumulate, npoints, block_size, nthreads):
+    """
+    Calls accumulate with the result of compute_block(start, stop) of every block. Blocks are computed by nthreads
+    threads, at most two per thread are in flight so that memory stays bounded, and their results are accumulated
+    in order so that the result does not depend on the thread count.
+    """
+
+    blocks = [(start, min(start + block_size, npoints)) for start in range(0, npoints, block_size)]
+    if nthreads <= 1:
+        for start, stop in blocks:
+            accumulate(compute_block(start, stop))
+        return
+
+    compute_block = profiling.propagate(compute_block)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nthreads) as executor:
+        pending = collections.deque()
+        for start, stop in blocks:
+            if len(pending) >= 2 * nthreads:
+                accumulate(pending.popleft().result())
+            pending.append(executor.submit(compute_block, start, stop))
+        while pending:
+            accumulate(pending.popleft().result())
+
+
+def compute_xc_gradient(xyz,
+                        basis,
+                        density,
+                        potential,
+                        weights=None,
+                        spherical=True,
+                        cart_order="row",
+                        spherical_order="gaussian",
+                        normalization="none",
+                        backend=None,
+                        block_size=None,
+                        threshold=1.e-14,
+                        index=None,
+                        xyz_soa=False,
+                        exp_atol=None,
+                        nthreads=None):
+    """
+    Computes the nuclear gradient contraction of a local potential for every center of the basis:
+        G_A = sum_mn D_mn sum_p w_p v_p (d phi_m(p) / d R_A) phi_n(p)
+            = -sum_(m on A) sum_p w_p v_p (grad phi_m)(p) (D phi)_m(p)
+
+    The XC energy gradient of an LDA functional with a symmetric density D is 2 G with v = dE_xc / d rho.
+
+    Each block of points evaluates PHI and PHI_X, PHI_Y, PHI_Z of its significant shells only, contracts them with
+    the block of D between those functions and the weighted potential, and adds the result to the centers, the
+    derivative matrices of the basis are never stored.
+
+    Parameters
+    ----------
+    xyz : array_like
+        The (N, 3) or (N, 4) points and weights to compute the gradient on, or (3, N) if xyz_soa
+    basis : BasisSet or list of dict
+        The basis, see compute_basis_collocation
+    density : array_like
+        The (nbf, nbf) density matrix
+    potential : array_like
+        The (N) potential v at each point
+    weights : array_like, optional
+        The (N) quadrature weights, from the fourth column of xyz if None, or one
+    block_size, nthreads, backend : optional
+        The block and thread settings, taken from the tuned profile if None, see compute_basis_collocation
+    threshold, index, xyz_soa, exp_atol, spherical, cart_order, spherical_order, normalization :
+        See compute_basis_collocation
+
+    Returns
+    -------
+    gradient : array_like
+        The (ncenter, 3) gradient contraction of each center of the basis
+    """
+
+    kernel = driver.BlockKernel(basis, grad=1, spherical=spherical, cart_order=cart_order,
+                                spherical_order=spherical_order, normalization=normalization, backend=backend,
+                                block_size=block_size, nthreads=nthreads, exp_atol=exp_atol)
+    basis = kernel.basis
+    nbf = basis.nbf(spherical)
+
+    density = np.asarray(density, dtype=np.double)
+    if density.shape != (nbf, nbf):
+        raise ValueError("The density must be (%d, %d) for this basis, found %s" % (nbf, nbf, str(density.shape)))
+
+    weights = _grid_weights(xyz, weights, xyz_soa)
+    wv = weights * np.asarray(potential, dtype=np.double)
+    npoints = wv.shape[0]
+
+    if index is None:
+        index = screening.basis_index(basis, threshold=threshold, grad=1)
+    function_centers = basis.function_centers(spherical)
+    prof = profiling.current()
+
+    def compute_block(start, stop):
+        if xyz_soa:
+            block = tuple(x[start:stop] for x in xyz)
+        else:
+            block = xyz[start:stop, :3]
+
+        shells = index.significant_shells(block, xyz_soa=xyz_soa)
+        if shells.shape[0] == 0:
+            return None
+
+        phi = kernel(block, shells, xyz_soa=xyz_soa)
+        functions = kernel.functions(shells)
+
+        if prof is not None:
+            tic = prof.start()
+
+        # (D phi)_m w v on the block, then -grad phi_m . (D phi w v)_m summed over points
+        dphi = np.dot(density[np.ix_(functions, functions)], phi[0] * wv[start:stop])
+        contrib = -np.einsum("cmp,mp->mc", phi[1:4], dphi)
+
+        ret = np.zeros((basis.ncenter, 3))
+        for direction in range(3):
+            ret[:, direction] = np.bincount(function_centers[functions], weights=contrib[:, direction],
+                                            minlength=basis.ncenter)
+
+        if prof is not None:
+            prof.count(blocks=1, points=stop - start, shells_computed=shells.shape[0])
+            prof.record("contraction", tic)
+        return ret
+
+    gradient = np.zeros((basis.ncenter, 3))
+
+    def accumulate(result):
+        if result is not None:
+            gradient[...] += result
+
+    _run_blocks(compute_block, accumulate, npoints, kernel.block_size, kernel.nthreads)
+    return gradient
+
+
+def compute_xc_matrix(xyz,
+                      basis,
+                      potential,
+                      weights=None,
+                      spherical=True,
+                      cart_order="row",
+                      spherical_order="gaussian",
+                      normalization="none",
+                      backend=None,
+                      block_size=None,
+                      threshold=1.e-14,
+                      index=None,
+                      xyz_soa=False,
+                      exp_atol=None,
+                      nthreads=None,
+                      out=None):
+    """
+    Computes the matrix of a local potential over the basis by quadrature:
+        V_mn = sum_p w_p v_p phi_m(p) phi_n(p)
+
+    Each block of points evaluates PHI of its significant shells only and adds its contribution to the block of V
+    between those functions as symmetric rank-k updates: the points are scaled by sqrt(|w_p v_p|) and split by the
+    sign of w_p v_p so that every update is a B B^T product, which NumPy evaluates with BLAS syrk at half the cost
+    of a general product. Memory is bounded by the block size, the collocation of the basis is never stored.
+
+    Parameters
+    ----------
+    xyz : array_like
+        The (N, 3) or (N, 4) points and weights to integrate over, or (3, N) if xyz_soa
+    basis : BasisSet or list of dict
+        The basis, see compute_basis_collocation
+    potential : array_like
+        The (N) potential v at each point
+    weights : array_like, optional
+        The (N) quadrature weights, from the fourth column of xyz if None, or one
+    out : array_like, optional
+        An (nbf, nbf) matrix to add the result to
+    block_size, nthreads, backend : optional
+        The block and thread settings, taken from the tuned profile if None, see compute_basis_collocation
+    threshold, index, xyz_soa, exp_atol, spherical, cart_order, spherical_order, normalization :
+        See compute_basis_collocation
+
+    Returns
+    -------
+    V : array_like
+        The symmetric (nbf, nbf) potential matrix
+    """
+
+    kernel = driver.BlockKernel(basis, grad=0, spherical=spherical, cart_order=cart_order,
+                                spherical_order=spherical_order, normalization=normalization, backend=backend,
+                                block_size=block_size, nthreads=nthreads, exp_atol=exp_atol)
+    basis = kernel.basis
+    nbf = basis.nbf(spherical)
+
+    weights = _grid_weights(xyz, weights, xyz_soa)
+    wv = weights * np.asarray(potential, dtype=np.double)
+    npoints = wv.shape[0]
+
+    if out is None:
+        out = np.zeros((nbf, nbf))
+    elif out.shape != (nbf, nbf):
+        raise ValueError("The output matrix must be (%d, %d) for this basis, found %s" % (nbf, nbf, str(out.shape)))
+
+    if index is None:
+        index = screening.basis_index(basis, threshold=threshold, grad=0)
+    prof = profiling.current()
+
+    def compute_block(start, stop):
+        if xyz_soa:
+            block = tuple(x[start:stop] for x in xyz)
+        else:
+            block = xyz[start:stop, :3]
+
+        shells = index.significant_shells(block, xyz_soa=xyz_soa)
+        if shells.shape[0] == 0:
+            return None
+
+        phi = kernel(block, shells, xyz_soa=xyz_soa)[0]
+
+        if prof is not None:
+            tic = prof.start()
+
+        block_wv = wv[start:stop]
+        phi *= np.sqrt(np.abs(block_wv))
+        negative = block_wv < 0.0
+        if not negative.any():
+            ret = np.dot(phi, phi.T)
+        elif negative.all():
+            ret = np.dot(phi, phi.T)
+            np.negative(ret, out=ret)
+        else:
+            positive = np.ascontiguousarray(phi[:, ~negative])
+            negative = np.ascontiguousarray(phi[:, negative])
+            ret = np.dot(positive, positive.T)
+            ret -= np.dot(negative, negative.T)
+
+        if prof is not None:
+            prof.count(blocks=1, points=stop - start, shells_computed=shells.shape[0])
+            prof.record("contraction", tic)
+        return kernel.functions(shells), ret
+
+    def accumulate(result):
+        if result is not None:
+            functions, block_matrix = result
+            out[np.ix_(functions, functions)] += block_matrix
+
+    _run_blocks(compute_block, accumulate, npoints, kernel.block_size, kernel.nthreads)
+    return out
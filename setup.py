@@ -1,4 +1,28 @@
+import os
+
 import setuptools
+from setuptools.command.build_py import build_py
+
+
+class build_py_kernels(build_py):
+    """
+    Also writes the ahead-of-time generated kernels into the built package, see gau2grid/precompile.py. The highest
+    angular momentum written is taken from $GAU2GRID_KERNEL_MAX_AM.
+    """
+
+    def run(self):
+        build_py.run(self)
+
+        try:
+            from gau2grid import precompile
+        except ImportError as exc:
+            print("Skipping the precompiled kernels, gau2grid can not be imported: %s" % str(exc))
+            return
+
+        max_am = int(os.environ.get("GAU2GRID_KERNEL_MAX_AM", precompile.default_max_am))
+        directory = os.path.join(self.build_lib, "gau2grid", "kernels")
+        precompile.write_kernels(max_am, directory=directory, compile=False)
+
 
 if __name__ == "__main__":
     setuptools.setup(
@@ -9,9 +33,11 @@ if __name__ == "__main__":
         author_email='dgasmith@icloud.com',
         url="https://github.com/dgasmith/gau2grid",
         license='BSD-3C',
-        packages=setuptools.find_packages(),
+        packages=setuptools.find_packages(exclude=["benchmarks", "tests"]),
+        # Submodules are loaded lazily through a module __getattr__ (PEP 562)
+        python_requires='>=3.7',
         install_requires=[
-            'numpy>=1.7',
+            'numpy>=1.13',  # np.unique(axis=) of BasisSet.from_dict
             'mpmath>=0.18',
         ],
         extras_require={
@@ -37,8 +63,12 @@ if __name__ == "__main__":
         classifiers=[
             'Development Status :: 4 - Beta',
             'Intended Audience :: Science/Research',
-            'Programming Language :: Python :: 2.7',
             'Programming Language :: Python :: 3',
+            'Programming Language :: Python :: 3 :: Only',
+            'Programming Language :: Python :: 3.7',
+            'Programming Language :: Python :: 3.8',
+            'Programming Language :: Python :: 3.9',
         ],
+        cmdclass={'build_py': build_py_kernels},
         zip_safe=True,
     )
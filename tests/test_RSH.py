@@ -0,0 +1,59 @@
+"""
+Tests the exact solid harmonic coefficients against the mpmath expansion and the addition theorem.
+"""
+
+import time
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+
+@pytest.mark.parametrize("L", range(13))
+def test_RSH_exact_mpmath(L):
+    exact = gg.RSH.cart_to_RSH_coeffs(L)
+    ref = gg.RSH.cart_to_RSH_coeffs_mpmath(L)
+    assert len(exact) == len(ref) == 2 * L + 1
+
+    # The mpmath sums leave ~1e-100 residuals where the exact coefficients vanish
+    for exact_comp, ref_comp in zip(exact, ref):
+        ref_comp = [(xyz, float(coef)) for xyz, coef in ref_comp if abs(coef) > 1.e-50]
+        assert exact_comp == ref_comp
+
+
+@pytest.mark.parametrize("L", [0, 1, 2, 5, 10, 15, 20])
+def test_RSH_addition_theorem(L):
+    # The squares of all real solid harmonics of L sum to r^2L
+    np.random.seed(L)
+    xyz = np.random.rand(20, 3) * 2.0 - 1.0
+    r2 = np.sum(xyz**2, axis=1)
+
+    total = np.zeros(xyz.shape[0])
+    for comp in gg.RSH.cart_to_RSH_coeffs(L):
+        value = np.zeros(xyz.shape[0])
+        for (lx, ly, lz), coef in comp:
+            value += coef * xyz[:, 0]**lx * xyz[:, 1]**ly * xyz[:, 2]**lz
+        total += value**2
+
+    assert np.allclose(total, r2**L, rtol=1.e-8, atol=0)
+
+
+def test_RSH_exact_rational():
+    # R_20 = z^2 - (x^2 + y^2) / 2 and R_22c = sqrt(3) / 2 (x^2 - y^2)
+    comps = gg.RSH.cart_to_RSH_exact(2)
+    assert comps[0] == (1, [((2, 0, 0), -0.5), ((0, 2, 0), -0.5), ((0, 0, 2), 1)])
+    radicand, terms = comps[3]
+    assert radicand * 4 * terms[0][1]**2 == 3
+
+    assert gg.RSH.cart_to_RSH_coeffs(2)[3][0][1] == np.sqrt(3.0) / 2.0
+
+    for n in list(range(200)) + [2**k + d for k in range(60, 260, 37) for d in (-1, 0, 1)]:
+        root = gg.RSH._isqrt(n)
+        assert root * root <= n < (root + 1) * (root + 1)
+
+
+def test_RSH_exact_timing():
+    t = time.perf_counter()
+    for L in range(21):
+        gg.RSH.cart_to_RSH_exact.func(L)
+    assert time.perf_counter() - t < 2.0
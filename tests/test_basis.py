@@ -0,0 +1,84 @@
+"""
+Tests the array-backed BasisSet container.
+"""
+
+import pickle
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+np.random.seed(0)
+xyzw = np.random.rand(200, 4)
+
+
+@pytest.mark.parametrize("basis_name", ["cc-pVDZ", "cc-pV6Z"])
+def test_basis_roundtrip(basis_name):
+    dict_basis = ref_basis.test_basis[basis_name]
+    basis = gg.BasisSet.from_dict(dict_basis)
+
+    assert basis.nshell == len(dict_basis)
+    assert basis.ncenter == 2
+    assert basis.max_am == max(shell["am"] for shell in dict_basis)
+
+    for ref, shell in zip(dict_basis, basis.to_dict()):
+        assert ref["am"] == shell["am"]
+        assert np.allclose(ref["exp"], shell["exp"])
+        assert np.allclose(ref["coef"], shell["coef"])
+        assert np.allclose(ref["center"], shell["center"])
+
+
+def test_basis_maps():
+    dict_basis = ref_basis.test_basis["cc-pVTZ"]
+    basis = gg.BasisSet.from_dict(dict_basis)
+
+    assert basis.nbf(spherical=False) == sum((s["am"] + 1) * (s["am"] + 2) // 2 for s in dict_basis)
+    assert basis.nbf(spherical=True) == sum(2 * s["am"] + 1 for s in dict_basis)
+    assert basis.function_offsets(True)[-1] == basis.nbf(True)
+
+    on_he = [x for x, s in enumerate(dict_basis) if s["center"][2] == 0.0]
+    assert list(basis.shells_on_center(0)) == on_he
+    assert len(basis.shells_on_center(1)) == len(dict_basis) - len(on_he)
+
+
+def test_basis_slice_pickle():
+    dict_basis = ref_basis.test_basis["cc-pVQZ"]
+    basis = gg.BasisSet.from_dict(dict_basis)
+
+    sliced = basis[3:12]
+    assert sliced.nshell == 9
+    assert np.shares_memory(sliced.exponents, basis.exponents)
+    for ref, shell in zip(dict_basis[3:12], sliced):
+        assert np.allclose(ref["exp"], shell["exp"])
+
+    loaded = pickle.loads(pickle.dumps(sliced))
+    assert np.array_equal(loaded.coefficients, sliced.coefficients)
+    assert np.array_equal(loaded.prim_offsets, sliced.prim_offsets)
+    assert np.array_equal(loaded.center_offsets, sliced.center_offsets)
+
+
+def test_basis_driver():
+    dict_basis = ref_basis.test_basis["cc-pVDZ"]
+    basis = gg.BasisSet.from_dict(dict_basis)
+
+    dict_results = gg.driver.compute_basis_collocation(xyzw, dict_basis, grad=1)
+    basis_results = gg.driver.compute_basis_collocation(xyzw, basis, grad=1)
+    for k in dict_results.keys():
+        assert np.allclose(dict_results[k], basis_results[k])
+
+
+def test_basis_with_centers():
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVTZ"])
+
+    centers = basis.centers + 0.5
+    moved = basis.with_centers(centers)
+    assert np.allclose(moved.shell_centers, basis.shell_centers + 0.5)
+    assert np.shares_memory(moved.exponents, basis.exponents)
+    assert np.array_equal(moved.center_offsets, basis.center_offsets)
+    assert moved.digest() != basis.digest()
+
+    with pytest.raises(ValueError):
+        basis.with_centers(centers[:1])
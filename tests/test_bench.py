@@ -0,0 +1,99 @@
+"""
+Tests the benchmark runner on a tiny suite.
+"""
+
+import json
+
+import gau2grid as gg
+import pytest
+
+from gau2grid import bench
+
+benchmarks = pytest.importorskip("benchmarks")
+
+
+def _tiny_cases():
+    return benchmarks.suite("quick", basis=["cc-pVDZ"], npoints=[100], grad=[0])
+
+
+def test_bench_suite():
+    cases = _tiny_cases()
+    assert {case["kind"] for case in cases} == {"shell", "basis"}
+    assert sorted(case["L"] for case in cases if case["kind"] == "shell") == [0, 1, 2]
+
+    with pytest.raises(KeyError):
+        benchmarks.suite("not_a_suite")
+
+
+def test_bench_run():
+    results = bench.run(_tiny_cases(), benchmarks.basis_sets(), repeats=1)
+
+    assert results["machine"] == gg.tune.machine()
+    ids = [result["id"] for result in results["results"]]
+    assert len(set(ids)) == len(ids)
+    for result in results["results"]:
+        assert result["time"] > 0
+        assert result["peak_bytes"] > 0
+        assert result["throughput"] == pytest.approx(result["npoints"] * result["nfunc"] / result["time"])
+
+    # Baselines round trip through JSON
+    baseline = json.loads(json.dumps(results))
+    comparison = bench.compare(results, baseline)
+    assert len(comparison) == len(ids)
+    assert not any(item["regression"] for item in comparison)
+
+    # A baseline twice as fast is a regression
+    for result in baseline["results"]:
+        result["time"] *= 0.5
+    comparison = bench.compare(results, baseline, tolerance=0.5)
+    assert all(item["regression"] for item in comparison)
+    assert all(item["ratio"] == pytest.approx(2.0) for item in comparison)
+
+
+def test_bench_settings(tmp_path, monkeypatch):
+    # A tuned profile does not change the driver cases, their settings are explicit and recorded
+    profile = str(tmp_path / "profile.json")
+    monkeypatch.setenv("GAU2GRID_PROFILE", profile)
+    gg.tune.save_profile({"version": gg.tune._profile_version, "machine": gg.tune.machine(),
+                          "settings": {"0": {"block_size": 16, "nthreads": 3}}})
+
+    cases = [case for case in _tiny_cases() if case["kind"] == "basis"]
+    assert all((case["block_size"], case["nthreads"]) == (128, 1) for case in cases)
+    assert benchmarks.suite("quick", kinds=("basis", ), block_size=64)[0]["block_size"] == 64
+
+    calls = []
+    driver_settings = gg.tune.driver_settings
+
+    def recorded(*args):
+        calls.append(args)
+        return driver_settings(*args)
+
+    monkeypatch.setattr(gg.tune, "driver_settings", recorded)
+    results = bench.run(cases, benchmarks.basis_sets(), repeats=1)
+    assert calls and all(call[3:] == (128, 1) for call in calls)
+    for result in results["results"]:
+        assert (result["block_size"], result["nthreads"]) == (128, 1)
+        assert result["id"].endswith("/b128/t1")
+
+
+def test_bench_skip():
+    results = bench.run(_tiny_cases(), benchmarks.basis_sets(), repeats=1, max_memory=1024)
+
+    assert all("skipped" in result for result in results["results"])
+    assert bench.compare(results, results) == []
+
+
+def test_bench_main(tmp_path):
+    output = str(tmp_path / "results.json")
+    args = ["--basis", "cc-pVDZ", "--npoints", "100", "--grad", "0", "--kind", "shell", "--repeats", "1"]
+
+    assert bench.main(args + ["--output", output]) == 0
+    with open(output, "r") as handle:
+        baseline = json.load(handle)
+    assert len(baseline["results"]) == 3
+
+    for result in baseline["results"]:
+        result["time"] *= 1.e-3
+    with open(output, "w") as handle:
+        json.dump(baseline, handle)
+    assert bench.main(args + ["--baseline", output]) == 1
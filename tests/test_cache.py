@@ -0,0 +1,96 @@
+"""
+Tests the collocation block cache and its use in the driver.
+"""
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+# Global points in compact blocks
+np.random.seed(0)
+xyzw = np.random.rand(600, 4)
+xyzw[:, :3] *= 10.0
+xyzw[:, :3] -= 4.0
+xyzw = xyzw[np.lexsort((xyzw[:, 2], np.floor(xyzw[:, 1] / 4.0), np.floor(xyzw[:, 0] / 4.0)))]
+
+
+def test_cache_lru():
+
+    cache = gg.CollocationCache(max_bytes=3 * 800)
+    blocks = [np.full((10, 10), float(x)) for x in range(4)]
+    for x, block in enumerate(blocks):
+        cache.put(("block", x), block)
+
+    # The oldest block is evicted, blocks are copies
+    blocks[3][:] = -1.0
+    assert cache.get(("block", 0)) is None
+    assert np.all(cache.get(("block", 3)) == 3.0)
+    assert cache.nbytes == 3 * 800
+
+    # Writing to a returned block does not change the cache
+    cache.get(("block", 3))[:] = 7.0
+    assert np.all(cache.get(("block", 3)) == 3.0)
+
+    # Using block 1 makes block 2 the least recently used
+    assert cache.get(("block", 1)) is not None
+    cache.put(("block", 4), blocks[0])
+    assert ("block", 2) not in cache
+    assert ("block", 1) in cache
+
+    stats = cache.stats()
+    assert stats["hits"] == 4
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 2
+    assert stats["spills"] == 0
+
+
+def test_cache_spill(tmp_path):
+
+    cache = gg.CollocationCache(max_bytes=800, spill_dir=str(tmp_path))
+    for x in range(3):
+        cache.put(("block", x), np.full((10, 10), float(x)))
+
+    assert len(cache) == 3
+    assert cache.stats()["spilled_blocks"] == 2
+    assert len(list(tmp_path.iterdir())) == 2
+
+    out = np.empty((10, 10))
+    assert cache.get(("block", 0), out=out) is out
+    assert np.all(out == 0.0)
+    assert cache.stats()["disk_hits"] == 1
+
+    cache.clear()
+    assert len(cache) == 0
+    assert len(list(tmp_path.iterdir())) == 0
+
+
+@pytest.mark.parametrize("codec", [None, gg.BlockCodec(tol=1.e-12)])
+@pytest.mark.parametrize("backend", ["numpy", "reference"])
+def test_driver_cache(backend, codec, tmp_path):
+
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVDZ"])
+    ref = gg.driver.compute_basis_collocation(xyzw, basis, grad=1, backend=backend, block_size=100)
+
+    # A budget of about two blocks, the rest are spilled
+    nbytes = 4 * basis.nbf() * 100 * 8
+    if codec is not None:
+        nbytes = codec.encode(np.array(list(ref.values()))[:, :, :100]).nbytes
+
+    cache = gg.CollocationCache(max_bytes=2 * nbytes, spill_dir=str(tmp_path), codec=codec)
+    for it in range(3):
+        results = gg.driver.compute_basis_collocation(
+            xyzw, basis, grad=1, backend=backend, block_size=100, cache=cache)
+        for k in ref.keys():
+            assert np.allclose(results[k], ref[k], rtol=0.0, atol=1.e-10), k
+
+    stats = cache.stats()
+    assert stats["misses"] == 6
+    assert stats["hits"] + stats["disk_hits"] == 12
+    assert stats["disk_hits"] > 0
+
+    # A different derivative level does not reuse the blocks
+    gg.driver.compute_basis_collocation(xyzw, basis, grad=0, backend=backend, block_size=100, cache=cache)
+    assert cache.stats()["misses"] == 12
@@ -0,0 +1,66 @@
+"""
+Tests the compressed storage of collocation blocks.
+"""
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+# A collocation block with screened shells
+np.random.seed(0)
+xyz = np.random.rand(200, 3) * 2.0 + 3.0
+block = np.array(list(gg.driver.compute_basis_collocation(xyz, ref_basis.test_basis["cc-pVTZ"], grad=1).values()))
+
+
+@pytest.mark.parametrize("tol", [1.e-3, 1.e-6, 1.e-10, 1.e-14])
+def test_codec_tolerance(tol):
+
+    codec = gg.BlockCodec(tol=tol)
+    encoded = codec.encode(block)
+    decoded = codec.decode(encoded)
+
+    # The bound holds up to the rounding of the doubles
+    scale = np.abs(block).max(axis=-1, keepdims=True)
+    assert np.all(np.abs(decoded - block) <= (tol + 4 * np.finfo(np.double).eps) * scale)
+    assert encoded.nbytes < block.nbytes
+
+
+def test_codec_lossless():
+
+    codec = gg.BlockCodec(tol=None)
+    assert np.array_equal(codec.decode(codec.encode(block)), block)
+
+    codec = gg.BlockCodec(tol=1.e-17)
+    assert codec.dtype is None
+    assert np.array_equal(codec.decode(codec.encode(block)), block)
+
+    # Screened rows are not stored
+    assert np.any(np.all(block == 0.0, axis=-1))
+    assert codec.encode(block).nbytes < block.nbytes
+
+
+def test_codec_dtypes():
+
+    assert gg.BlockCodec(tol=1.e-2).dtype == np.int8
+    assert gg.BlockCodec(tol=1.e-4).dtype == np.int16
+    assert gg.BlockCodec(tol=1.e-9).dtype == np.int32
+    assert gg.BlockCodec(tol=1.e-12).dtype == np.int64
+
+    with pytest.raises(ValueError):
+        gg.BlockCodec(tol=2.0)
+
+
+def test_codec_out():
+
+    codec = gg.BlockCodec(tol=1.e-8)
+    encoded = codec.encode(block[:, :, 50:150])
+
+    # Decode into a strided view of a larger buffer
+    out = np.full(block.shape, np.nan)
+    ret = codec.decode(encoded, out=out[:, :, 50:150])
+    assert ret.base is out
+    assert np.allclose(out[:, :, 50:150], block[:, :, 50:150], rtol=0.0, atol=1.e-7)
+    assert np.all(np.isnan(out[:, :, :50]))
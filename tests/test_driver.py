@@ -0,0 +1,210 @@
+"""
+Compares the screened basis-level driver against stitched shell collocations.
+"""
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+# Tweakers
+npoints = 1000
+
+# Global points, a spread out grid so that screening is active
+np.random.seed(0)
+xyzw = np.random.rand(npoints, 4)
+xyzw[:, :3] *= 20.0
+xyzw[:, :3] -= 8.0
+
+# Sort into compact blocks
+xyzw = xyzw[np.lexsort((xyzw[:, 2], np.floor(xyzw[:, 1] / 4.0), np.floor(xyzw[:, 0] / 4.0)))]
+
+
+def _compute_points_block(xyzw, basis, grad=2, spherical=False):
+    """
+    Computes the reference collocation matrices and stitches them together
+    """
+
+    tmp = []
+    for shell in basis:
+        shell_collocation = gg.ref.compute_collocation(
+            xyzw, shell["am"], shell["coef"], shell["exp"], shell["center"], grad=grad, spherical=spherical)
+        tmp.append(shell_collocation)
+
+    return {k: np.vstack([coll[k] for coll in tmp]) for k in tmp[0].keys()}
+
+
+@pytest.mark.parametrize("basis_name", ["cc-pVDZ", "cc-pVQZ"])
+@pytest.mark.parametrize("backend", ["numpy", "table", "reference"])
+@pytest.mark.parametrize("spherical", ["cart", "spherical"])
+def test_driver_collocation(basis_name, backend, spherical):
+
+    trans = "spherical" == spherical
+    basis = ref_basis.test_basis[basis_name]
+
+    driver_results = gg.driver.compute_basis_collocation(
+        xyzw, basis, grad=2, spherical=trans, backend=backend, block_size=64, threshold=1.e-14)
+    ref_results = _compute_points_block(xyzw, basis, grad=2, spherical=trans)
+
+    assert set(driver_results) == set(ref_results)
+    for k in ref_results.keys():
+        assert np.allclose(driver_results[k], ref_results[k], atol=1.e-12), k
+
+
+def test_cutoff_radius():
+
+    shell = ref_basis.test_basis["cc-pVDZ"][3]
+    radius = gg.screening.shell_cutoff_radius(shell["am"], shell["coef"], shell["exp"], threshold=1.e-10)
+
+    r = np.linspace(radius, 2 * radius, 50)
+    values = np.abs(np.exp(-np.outer(r**2, shell["exp"])).dot(shell["coef"]))
+    assert np.all(values < 1.e-10)
+    assert radius < 15.0
+
+
+def test_shell_index_query():
+
+    np.random.seed(1)
+    centers = np.random.rand(200, 3) * 30.0
+    radii = np.random.rand(200) * 5.0 + 1.0
+    index = gg.screening.ShellIndex(centers, radii)
+
+    for x in range(20):
+        lower = np.random.rand(3) * 30.0
+        upper = lower + np.random.rand(3) * 3.0
+
+        closest = np.clip(centers, lower, upper)
+        brute = np.where(np.sum((closest - centers)**2, axis=1) <= radii**2)[0]
+        assert np.array_equal(index.query(lower, upper), brute)
+
+
+@pytest.mark.parametrize("backend", ["numpy", "table", "reference"])
+@pytest.mark.parametrize("layout,order", [("component", "F"), ("points", "C"), ("points", "F")])
+def test_driver_layout(backend, layout, order):
+
+    basis = ref_basis.test_basis["cc-pVTZ"]
+    ref_results = gg.driver.compute_basis_collocation(xyzw, basis, grad=2, backend=backend)
+
+    nbf = ref_results["PHI"].shape[0]
+    storage = gg.layout.allocate(nbf, npoints, 2, layout=layout, order=order)
+    results = gg.driver.compute_basis_collocation(
+        xyzw, basis, grad=2, backend=backend, layout=layout, order=order, out=storage)
+
+    names = gg.layout.component_names(2)
+    assert list(results) == names
+    for num, k in enumerate(names):
+        assert np.shares_memory(results[k], storage)
+        assert np.allclose(results[k], ref_results[k])
+
+        if layout == "points":
+            assert np.allclose(storage[num], ref_results[k].T)
+        else:
+            assert np.allclose(storage[num], ref_results[k])
+
+
+@pytest.mark.parametrize("backend", ["numpy", "table", "reference"])
+def test_kernel_strided_out(backend):
+
+    L, coeffs, exponents, center = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVQZ"]).shell(-1)
+    kernel = gg.driver.get_kernel(backend, L)
+
+    ref_results = kernel(xyzw, L, coeffs, exponents, center, grad=1, spherical=True)
+
+    storage = np.zeros((4, npoints, 2 * L + 1), order="F")
+    results = kernel(xyzw, L, coeffs, exponents, center, grad=1, spherical=True, out=storage.transpose(0, 2, 1))
+    for num, k in enumerate(gg.layout.component_names(1)):
+        assert np.allclose(results[k], ref_results[k])
+        assert np.allclose(storage[num].T, ref_results[k])
+
+
+@pytest.mark.parametrize("backend", ["numpy", "table", "reference"])
+def test_driver_soa(backend):
+
+    basis = ref_basis.test_basis["cc-pVDZ"]
+    ref_results = gg.driver.compute_basis_collocation(xyzw, basis, grad=2, backend=backend)
+
+    xyz, weights = gg.layout.grid_soa(xyzw)
+    assert xyz.flags["C_CONTIGUOUS"] and xyz.shape == (3, npoints)
+    assert np.allclose(weights, xyzw[:, 3])
+
+    results = gg.driver.compute_basis_collocation(xyz, basis, grad=2, backend=backend, xyz_soa=True)
+    for k in ref_results.keys():
+        assert np.allclose(results[k], ref_results[k])
+
+    # Separate x, y, z arrays
+    L, coeffs, exponents, center = gg.BasisSet.from_dict(basis).shell(6)
+    kernel = gg.driver.get_kernel(backend, L)
+    shell_ref = kernel(xyzw, L, coeffs, exponents, center, grad=2)
+    shell_soa = kernel((xyz[0], xyz[1], xyz[2]), L, coeffs, exponents, center, grad=2, xyz_soa=True)
+    for k in shell_ref.keys():
+        assert np.allclose(shell_soa[k], shell_ref[k])
+
+
+@pytest.mark.parametrize("backend", ["numpy", "table", "reference"])
+def test_driver_exp_atol(backend):
+
+    basis = ref_basis.test_basis["cc-pVDZ"]
+    exact = gg.driver.compute_basis_collocation(xyzw, basis, grad=1, backend=backend)
+    approx = gg.driver.compute_basis_collocation(xyzw, basis, grad=1, backend=backend, exp_atol=1.e-8)
+
+    for k in exact.keys():
+        assert np.allclose(approx[k], exact[k], rtol=0.0, atol=1.e-5), k
+
+    # Truncation is honoured, not ignored
+    coarse = gg.driver.compute_basis_collocation(xyzw, basis, backend=backend, exp_atol=1.e-2)
+    assert not np.allclose(coarse["PHI"], exact["PHI"], rtol=0.0, atol=1.e-6)
+
+
+def test_driver_exp_atol_truncation():
+    # An s shell is zero exactly beyond the cutoff on every backend
+    exponent = 0.8
+    shell = [{"am": 0, "coef": [1.0], "exp": [exponent], "center": [0.0, 0.0, 0.0]}]
+    xyz = np.zeros((2000, 3))
+    xyz[:, 0] = np.linspace(0.0, 6.0, 2000)
+    beyond = exponent * xyz[:, 0]**2 > gg.radial.exp_cutoff(1.e-3)
+
+    ref = gg.driver.compute_basis_collocation(xyz, shell, grad=1, backend="reference", exp_atol=1.e-3)
+    for backend in ["numpy", "table"]:
+        out = gg.driver.compute_basis_collocation(xyz, shell, grad=1, backend=backend, exp_atol=1.e-3)
+        for k in ref:
+            assert np.all(out[k][:, beyond] == 0.0), k
+            assert np.allclose(out[k], ref[k], rtol=1.e-14, atol=0.0), k
+    assert np.all(ref["PHI"][:, ~beyond] > 0.0)
+
+
+@pytest.mark.parametrize("backend", ["numpy", "table", "reference"])
+def test_driver_components(backend):
+    basis = ref_basis.test_basis["cc-pVTZ"]
+    xyz = xyzw[:, :3]
+
+    full = gg.driver.compute_basis_collocation(xyz, basis, grad=3, backend=backend)
+    assert list(full) == gg.layout.component_names(3)
+
+    components = ("PHI_ZZZ", "PHI_X", "PHI_XYZ")
+    cache = gg.CollocationCache()
+    for _ in range(2):
+        selected = gg.driver.compute_basis_collocation(
+            xyz, basis, backend=backend, components=components, layout="points", cache=cache)
+
+        assert list(selected) == list(components)
+        for k in components:
+            assert np.allclose(selected[k], full[k])
+
+
+@pytest.mark.parametrize("backend", ["numpy", "reference"])
+def test_block_kernel(backend):
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVTZ"])
+    xyz = xyzw[:200, :3]
+
+    full = gg.driver.compute_basis_collocation(xyz, basis, grad=1, backend=backend, threshold=0.0)
+    kernel = gg.driver.BlockKernel(basis, grad=1, backend=backend)
+
+    shells = np.array([7, 0, 3, 12])
+    compact = kernel(xyz, shells)
+    functions = kernel.functions(shells)
+
+    assert compact.shape == (4, functions.shape[0], xyz.shape[0])
+    for num, name in enumerate(gg.layout.component_names(1)):
+        assert np.allclose(compact[num], full[name][functions])
@@ -0,0 +1,57 @@
+"""
+Tests that importing gau2grid is cheap and loads the heavy pieces only on use.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(code, *flags):
+    env = dict(os.environ, PYTHONPATH=_root)
+    ret = subprocess.run([sys.executable] + list(flags) + ["-c", code], env=env, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    return ret.stdout, ret.stderr
+
+
+def _loaded(code):
+    stdout, stderr = _run(code + "\nimport sys\nprint(' '.join(sorted(sys.modules)))")
+    return set(stdout.split())
+
+
+def test_import_lazy():
+    loaded = _loaded("import gau2grid")
+    assert "numpy" not in loaded
+    assert "mpmath" not in loaded
+    assert [name for name in loaded if name.startswith("gau2grid.")] == []
+
+
+@pytest.mark.parametrize("attribute", ["driver", "BasisSet", "CollocationCache", "radial", "layout"])
+def test_import_no_mpmath(attribute):
+    loaded = _loaded("import gau2grid\ngau2grid.%s" % attribute)
+    assert "numpy" in loaded
+    assert "mpmath" not in loaded
+    assert "gau2grid.python_reference" not in loaded
+
+
+def test_import_mpmath_on_use():
+    loaded = _loaded("import gau2grid\ngau2grid.RSH.cart_to_RSH_coeffs(2)")
+    assert "mpmath" not in loaded
+
+    loaded = _loaded("import gau2grid\ngau2grid.RSH.cart_to_RSH_coeffs_mpmath(2)")
+    assert "mpmath" in loaded
+
+
+def test_import_attributes():
+    import gau2grid as gg
+
+    assert gg.ref is gg.python_reference
+    assert gg.BasisSet is gg.basis.BasisSet
+    assert set(gg.__all__) <= set(dir(gg))
+    with pytest.raises(AttributeError):
+        gg.not_a_module
+
@@ -0,0 +1,166 @@
+"""
+Tests the thread-safe memoizing decorator.
+"""
+
+import pickle
+import threading
+import time
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+
+def test_memoize_basic():
+    calls = []
+
+    @gg.memoize.memoize()
+    def square(x, power=2):
+        """Squares x."""
+        calls.append(x)
+        return x**power
+
+    assert square.__doc__ == "Squares x."
+    assert square(3) == 9
+    assert square(3) == 9
+    assert square(3, power=3) == 27
+    assert calls == [3, 3]
+
+    stats = square.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 2, 2)
+
+    square.clear()
+    assert square(3) == 9
+    assert len(calls) == 3
+
+
+def test_memoize_bounded():
+
+    @gg.memoize.memoize(maxsize=2)
+    def ident(x):
+        return x
+
+    for x in [0, 1, 0, 2, 0]:
+        ident(x)
+
+    # 1 is the least recently used value when 2 is added
+    assert list(ident.mem) == [(2, ), (0, )]
+    assert ident.stats()["evictions"] == 1
+    assert ident.stats()["hits"] == 2
+
+
+def test_memoize_single_flight():
+    calls = []
+    start = threading.Event()
+
+    @gg.memoize.Memoize
+    def slow(x):
+        calls.append(x)
+        time.sleep(0.05)
+        return [x]
+
+    results = []
+
+    def worker():
+        start.wait()
+        results.append(slow(1))
+
+    threads = [threading.Thread(target=worker) for x in range(8)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+
+    # Computed once, every thread sees the same object
+    assert calls == [1]
+    assert all(result is results[0] for result in results)
+    assert slow.stats()["misses"] == 1
+    assert slow.stats()["waits"] + slow.stats()["hits"] == 7
+
+
+def test_memoize_error():
+    calls = []
+
+    @gg.memoize.Memoize
+    def fails_once(x):
+        calls.append(x)
+        if len(calls) == 1:
+            raise ValueError("first call fails")
+        return x
+
+    with pytest.raises(ValueError):
+        fails_once(1)
+    assert fails_once(1) == 1
+    assert fails_once.stats()["misses"] == 1
+
+
+def test_memoize_persist(tmp_path, monkeypatch):
+    monkeypatch.setenv("GAU2GRID_CACHE_DIR", str(tmp_path))
+
+    def matrix(L):
+        return np.full((L, L), float(L))
+
+    first = gg.memoize.Memoize(matrix, persist=True)
+    first(2)
+    first(3)
+    assert first.filename().startswith(str(tmp_path))
+
+    # A new process, here a new cache, loads the values instead of computing them
+    second = gg.memoize.Memoize(matrix, persist=True)
+    assert np.array_equal(second(3), matrix(3))
+    assert second.stats()["hits"] == 1
+    assert second.stats()["misses"] == 0
+
+    # Values are appended as they are computed
+    second(4)
+    third = gg.memoize.Memoize(matrix, persist=True)
+    assert np.array_equal(third(4), matrix(4))
+    assert third.stats()["misses"] == 0
+
+    # Values of other code are dropped and the file is rewritten
+    with open(first.filename(), "wb") as handle:
+        pickle.dump((0, {(2, ): "stale"}), handle)
+    fourth = gg.memoize.Memoize(matrix, persist=True)
+    assert np.array_equal(fourth(2), matrix(2))
+    assert np.array_equal(gg.memoize.Memoize(matrix, persist=True)(2), matrix(2))
+
+    # Without the directory nothing is persisted
+    monkeypatch.delenv("GAU2GRID_CACHE_DIR")
+    assert gg.memoize.Memoize(matrix, persist=True).filename() is None
+
+
+def test_memoize_persist_unwritable(tmp_path, monkeypatch):
+    # A cache directory below a regular file can not be created
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    monkeypatch.setenv("GAU2GRID_CACHE_DIR", str(blocker / "cache"))
+
+    start = threading.Event()
+
+    def slow(x):
+        start.wait()
+        time.sleep(0.05)
+        return x
+
+    cache = gg.memoize.Memoize(slow, persist=True)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache(1))) for x in range(3)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join(timeout=5.0)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert results == [1, 1, 1]
+    assert cache.stats()["misses"] == 1
+
+
+def test_memoize_gau2grid_caches():
+    for cache in [gg.RSH.cart_to_RSH_coeffs, gg.RSH.cart_to_spherical_matrix, gg.table.angular_tables]:
+        assert isinstance(cache, gg.memoize.Memoize)
+        assert cache.persist
+
+    assert gg.generator.numpy_kernel.maxsize is not None
+    assert gg.RSH.Memoize is gg.memoize.Memoize
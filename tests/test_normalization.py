@@ -0,0 +1,99 @@
+"""
+Tests the normalization conventions of the kernels.
+"""
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+np.random.seed(0)
+xyz = np.random.rand(100, 3) * 4.0 - 2.0
+
+# A cube of points for the numerical overlaps
+_h = 0.2
+_axis = np.arange(-7.0, 7.0 + 0.5 * _h, _h)
+cube = np.stack(np.meshgrid(_axis, _axis, _axis, indexing="ij"), axis=-1).reshape(-1, 3)
+
+
+def test_normalization_factors():
+    factors = gg.normalization.cartesian_factors(2, "row", "cartesian")
+    assert np.allclose(factors, [1.0, 3**0.5, 3**0.5, 1.0, 3**0.5, 1.0])
+    assert gg.normalization.cartesian_factors(2, "row", "none") == (1.0, ) * 6
+
+    # xyz of an f shell is sqrt(15), molden order puts it last
+    assert gg.normalization.cartesian_factors(3, "molden", "full")[-1] == 15**0.5
+
+    with pytest.raises(KeyError):
+        gg.normalization.cartesian_factors(2, "row", "not_a_convention")
+    with pytest.raises(KeyError):
+        gg.driver.get_kernel("numpy", 2, normalization="not_a_convention")
+
+
+@pytest.mark.parametrize("spherical", [False, True])
+@pytest.mark.parametrize("L", [0, 1, 2, 3])
+def test_normalization_full_overlap(L, spherical):
+    coeffs = np.array([0.3, 0.7, 0.2])
+    exponents = np.array([2.5, 0.9, 0.4])
+
+    kernel = gg.driver.get_kernel("numpy", 3, normalization="full")
+    phi = kernel(cube, L, coeffs, exponents, [0.0, 0.0, 0.0], grad=0, spherical=spherical)["PHI"]
+
+    # Every component has a unit norm
+    assert np.allclose(np.sum(phi * phi, axis=1) * _h**3, 1.0, atol=1.e-8)
+
+
+@pytest.mark.parametrize("backend", ["numpy", "table", "reference"])
+@pytest.mark.parametrize("spherical", [False, True])
+def test_normalization_kernels(backend, spherical):
+    basis = ref_basis.test_basis["cc-pVQZ"]
+
+    ref_kernel = gg.driver.get_kernel("reference", 4)
+    kernel = gg.driver.get_kernel(backend, 4, normalization="cartesian")
+    full_kernel = gg.driver.get_kernel(backend, 4, normalization="full")
+
+    for shell in basis:
+        L = shell["am"]
+        ref = ref_kernel(xyz, L, shell["coef"], shell["exp"], shell["center"], grad=2, spherical=spherical)
+        out = kernel(xyz, L, shell["coef"], shell["exp"], shell["center"], grad=2, spherical=spherical)
+
+        coeffs = gg.normalization.contraction_coefficients(L, shell["coef"], shell["exp"])
+        full = full_kernel(xyz, L, shell["coef"], shell["exp"], shell["center"], grad=2, spherical=spherical)
+        full_ref = kernel(xyz, L, coeffs, shell["exp"], shell["center"], grad=2, spherical=spherical)
+
+        # Spherical components do not depend on the Cartesian scaling
+        factors = np.ones(1) if spherical else np.array(gg.normalization.cartesian_factors(L, "row", "cartesian"))
+        for k in ref:
+            assert np.allclose(ref[k] * factors[:, None], out[k], atol=1.e-14, rtol=1.e-12)
+            assert np.allclose(full_ref[k], full[k], atol=1.e-14, rtol=1.e-12)
+
+
+def test_normalization_driver():
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVTZ"])
+    normalized = gg.normalization.normalize_basis(basis)
+
+    # Batched padded contractions give the same coefficients
+    coeffs, exponents = basis.padded_primitives()
+    ncoeffs, nexponents = normalized.padded_primitives()
+    for L in np.unique(basis.am):
+        mask = basis.am == L
+        assert np.allclose(gg.normalization.contraction_coefficients(L, coeffs[mask], exponents[mask]), ncoeffs[mask])
+
+    cache = gg.CollocationCache()
+    ref = gg.driver.compute_basis_collocation(xyz, normalized, grad=1, spherical=False, normalization="cartesian",
+                                              cache=cache)
+    out = gg.driver.compute_basis_collocation(xyz, basis, grad=1, spherical=False, normalization="full", cache=cache)
+    for k in ref:
+        assert np.allclose(ref[k], out[k], atol=1.e-14, rtol=1.e-12)
+
+    # Conventions are part of the cache key
+    none = gg.driver.compute_basis_collocation(xyz, normalized, grad=1, spherical=False, cache=cache)
+    assert not np.allclose(none["PHI"], ref["PHI"])
+
+    # Spherical components only depend on the contraction normalization
+    ref = gg.driver.compute_basis_collocation(xyz, normalized, grad=1)
+    out = gg.driver.compute_basis_collocation(xyz, basis, grad=1, normalization="full")
+    for k in ref:
+        assert np.allclose(ref[k], out[k], atol=1.e-14, rtol=1.e-12)
@@ -47,14 +47,15 @@ for basis in ["cc-pVDZ", "cc-pVTZ", "cc-pVQZ", "cc-pV5Z", "cc-pV6Z"]:
         gg_tests.append((basis, spherical))
 
 
+@pytest.mark.parametrize("monomials", ["power", "recurrence"])
 @pytest.mark.parametrize("basis_name,spherical", gg_tests)
-def test_generator_collocation(basis_name, spherical):
+def test_generator_collocation(basis_name, spherical, monomials):
 
     trans = "spherical" == spherical
     basis = ref_basis.test_basis[basis_name]
 
     max_am = max(shell["am"] for shell in basis)
-    code = gg.generator.numpy_generator(max_am, function_name="tmp_np_gen")
+    code = gg.generator.numpy_generator(max_am, function_name="tmp_np_gen", monomials=monomials)
 
     # Exec the code into a namespace
     test_namespace = {}
@@ -69,7 +70,7 @@ def test_generator_collocation(basis_name, spherical):
     ref_time = time.time() - t
 
     print("")
-    print("%s-%s time REF: %8.4f GG: %8.4f" % (basis_name, spherical, ref_time, gg_time))
+    print("%s-%s-%s time REF: %8.4f GG: %8.4f" % (basis_name, spherical, monomials, ref_time, gg_time))
 
     if set(ref_results) != set(ref_results):
         raise KeyError("Psi4 and GG results dicts do not match")
@@ -79,3 +80,79 @@ def test_generator_collocation(basis_name, spherical):
         diff = np.linalg.norm(gen_results[k] - ref_results[k])
         if not match:
             raise ValueError("NumPy generator results do not match reference for %s" % k)
+
+
+@pytest.mark.parametrize("basis_name", ["cc-pVDZ", "cc-pV6Z"])
+@pytest.mark.parametrize("spherical", ["cart", "spherical"])
+def test_generator_batched(basis_name, spherical):
+
+    trans = "spherical" == spherical
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis[basis_name])
+    kernel = gg.generator.numpy_kernel(basis.max_am, "row")
+
+    for L in range(basis.max_am + 1):
+        shells = np.where(basis.am == L)[0]
+        coeffs, exponents = basis.padded_primitives(shells)
+        batch_results = kernel(xyzw, L, coeffs, exponents, basis.shell_centers[shells], grad=2, spherical=trans)
+
+        for num, shell in enumerate(shells):
+            shell_results = kernel(xyzw, *basis.shell(shell), grad=2, spherical=trans)
+            for k, v in shell_results.items():
+                assert np.allclose(batch_results[k][num], v)
+
+
+@pytest.mark.parametrize("monomials", ["power", "recurrence"])
+@pytest.mark.parametrize("spherical", ["cart", "spherical"])
+def test_generator_third_derivatives(spherical, monomials):
+
+    trans = "spherical" == spherical
+    basis = ref_basis.test_basis["cc-pVQZ"]
+    kernel = gg.generator.numpy_kernel(4, "row", monomials)
+
+    gen_results = _compute_points_block(kernel, xyzw, basis, grad=3, spherical=trans)
+    ref_results = _compute_points_block(gg.ref.compute_collocation, xyzw, basis, grad=3, spherical=trans)
+
+    assert list(gen_results) == gg.layout.component_names(3)
+    for k in ref_results.keys():
+        assert np.allclose(gen_results[k], ref_results[k]), k
+
+
+@pytest.mark.parametrize("L", range(5))
+def test_reference_third_derivatives_finite_difference(L):
+
+    shell = ([0.8, 0.2], [1.3, 0.35], np.array([0.1, -0.2, 0.3]))
+    third = gg.ref.compute_collocation(xyzw, L, *shell, grad=3, spherical=False)
+
+    # d/dx of a point derivative is -d/dx of the center
+    h = 1.e-4
+    for name in gg.layout.component_names(3)[10:]:
+        step = np.zeros(3)
+        step["XYZ".index(name[-1])] = h
+        lower = "PHI_" + name[4:-1]
+        plus = gg.ref.compute_collocation(xyzw, L, *shell[:2], shell[2] - step, grad=2, spherical=False)[lower]
+        minus = gg.ref.compute_collocation(xyzw, L, *shell[:2], shell[2] + step, grad=2, spherical=False)[lower]
+        assert np.allclose((plus - minus) / (2 * h), third[name], rtol=1.e-6, atol=1.e-6), name
+
+
+def test_generator_components():
+
+    shell = ([0.8, 0.2], [1.3, 0.35], [0.1, -0.2, 0.3])
+    full = gg.generator.numpy_kernel(3)(xyzw, 3, *shell, grad=3, spherical=False)
+
+    components = ("PHI_XYZ", "PHI", "PHI_YY")
+    kernel = gg.generator.numpy_kernel(3, components=components)
+    selected = kernel(xyzw, 3, *shell, spherical=False)
+
+    assert list(selected) == list(components)
+    for k in components:
+        assert np.allclose(selected[k], full[k])
+
+    # Only the radial derivatives of the selection are built
+    code = gg.generator.numpy_generator(3, components=("PHI_X", ))
+    assert "SXX " not in code
+    assert "SX = " in code
+
+    with pytest.raises(KeyError):
+        gg.generator.numpy_generator(3, components=("PHI_W", ))
+    with pytest.raises(ValueError):
+        gg.layout.component_names(4)
@@ -0,0 +1,86 @@
+"""
+Tests the cartesian and spherical orderings against permuted row and gaussian ordered results.
+"""
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+np.random.seed(0)
+xyz = np.random.rand(100, 3) * 4.0 - 2.0
+
+
+def _cartesian_permutation(L, cart_order):
+    # Row of each cart_order component in the row order
+    row = {(l, m, n): idx for idx, l, m, n in gg.order.cartesian_order_factory(L, "row")}
+    return [row[(l, m, n)] for idx, l, m, n in gg.order.cartesian_order_factory(L, cart_order)]
+
+
+def _spherical_permutation(L, spherical_order):
+    gaussian = {m: idx for idx, m in gg.order.spherical_order_factory(L, "gaussian")}
+    return [gaussian[m] for idx, m in gg.order.spherical_order_factory(L, spherical_order)]
+
+
+def test_order_factories():
+    assert [x[1:] for x in gg.order.cartesian_order_factory(2, "molden")][:4] == [(2, 0, 0), (0, 2, 0), (0, 0, 2),
+                                                                                 (1, 1, 0)]
+    assert list(gg.order.cartesian_order_factory(3, "cca")) == list(gg.order.cartesian_order_factory(3, "row"))
+    assert [m for idx, m in gg.order.spherical_order_factory(2, "cca")] == [-2, -1, 0, 1, 2]
+    assert [m for idx, m in gg.order.spherical_order_factory(2, "gaussian")] == [0, 1, -1, 2, -2]
+
+    # Every molden order is a permutation of the row order
+    for L in range(5):
+        assert sorted(_cartesian_permutation(L, "molden")) == list(range((L + 1) * (L + 2) // 2))
+
+    with pytest.raises(KeyError):
+        list(gg.order.cartesian_order_factory(5, "molden"))
+    with pytest.raises(KeyError):
+        list(gg.order.spherical_order_factory(2, "not_an_order"))
+
+
+@pytest.mark.parametrize("backend", ["numpy", "table", "reference"])
+@pytest.mark.parametrize("cart_order", ["cca", "molden"])
+@pytest.mark.parametrize("spherical", [False, True])
+def test_order_kernels(backend, cart_order, spherical):
+    basis = ref_basis.test_basis["cc-pVQZ"]
+    spherical_order = "cca" if spherical else "gaussian"
+
+    ref_kernel = gg.driver.get_kernel(backend, 4)
+    kernel = gg.driver.get_kernel(backend, 4, cart_order, spherical_order=spherical_order)
+
+    for shell in basis:
+        L = shell["am"]
+        ref = ref_kernel(xyz, L, shell["coef"], shell["exp"], shell["center"], grad=2, spherical=spherical)
+        out = kernel(xyz, L, shell["coef"], shell["exp"], shell["center"], grad=2, spherical=spherical)
+
+        if spherical:
+            perm = _spherical_permutation(L, spherical_order)
+        else:
+            perm = _cartesian_permutation(L, cart_order)
+        for k in ref:
+            assert np.allclose(ref[k][perm], out[k], atol=1.e-14, rtol=1.e-12)
+
+
+def test_order_driver():
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVTZ"])
+    ref = gg.driver.compute_basis_collocation(xyz, basis, grad=1)
+    out = gg.driver.compute_basis_collocation(xyz, basis, grad=1, spherical_order="cca")
+
+    offsets = basis.function_offsets()
+    perm = np.concatenate(
+        [offsets[shell] + np.array(_spherical_permutation(L, "cca")) for shell, L in enumerate(basis.am)])
+    for k in ref:
+        assert np.array_equal(ref[k][perm], out[k])
+
+    matrix = gg.RSH.cart_to_spherical_matrix(3, "molden", "cca")
+    ref_matrix = gg.RSH.cart_to_spherical_matrix(3, "row")
+    assert np.array_equal(matrix, ref_matrix[_spherical_permutation(3, "cca")][:, _cartesian_permutation(3, "molden")])
+
+
+def test_order_module_names():
+    names = {gg.kernels.module_name(2, c, s) for c in ["row", "molden"] for s in ["gaussian", "cca"]}
+    assert len(names) == 4
+    assert gg.kernels.module_name(2) == gg.kernels.module_name(2, "row", "gaussian")
@@ -0,0 +1,67 @@
+"""
+Tests the ahead-of-time generated kernel modules.
+"""
+
+import sys
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+from gau2grid import kernels
+from gau2grid import precompile
+
+# Import locals
+import ref_basis
+
+np.random.seed(0)
+xyz = np.random.rand(200, 3) * 4.0 - 2.0
+
+
+@pytest.fixture
+def kernel_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(kernels, "__path__", [str(tmp_path)])
+    yield tmp_path
+    for L in range(3):
+        sys.modules.pop("gau2grid.kernels." + kernels.module_name(L), None)
+
+
+def test_precompile_kernels(kernel_dir):
+    filenames = precompile.write_kernels(2, directory=str(kernel_dir))
+    assert len(filenames) == 3
+
+    basis = ref_basis.test_basis["cc-pVDZ"]
+    for L in range(3):
+        kernel = kernels.load_kernel(L)
+        assert kernel.__code__.co_filename == filenames[L]
+
+        shell = [shell for shell in basis if shell["am"] == L][0]
+        ref = gg.ref.compute_collocation(xyz, L, shell["coef"], shell["exp"], shell["center"], grad=2)
+        out = kernel(xyz, L, shell["coef"], shell["exp"], shell["center"], grad=2)
+        for k in ref:
+            assert np.allclose(ref[k], out[k], atol=1.e-14, rtol=1.e-12)
+
+    # Not written
+    assert kernels.load_kernel(3) is None
+
+    removed = precompile.clean_kernels(str(kernel_dir))
+    assert set(filenames) <= set(removed)
+    assert not list(kernel_dir.glob("*.py"))
+    assert not list(kernel_dir.glob("__pycache__/*.pyc"))
+
+
+def test_precompile_stale(kernel_dir, monkeypatch):
+    precompile.write_kernels(0, directory=str(kernel_dir), compile=False)
+    assert kernels.load_kernel(0) is not None
+
+    # Modules written by another generator version are ignored
+    monkeypatch.setattr(kernels, "source_digest", lambda: "other")
+    assert kernels.load_kernel(0) is None
+
+
+def test_runtime_kernel_source():
+    # Kernels generated at runtime still have their source available
+    kernel = gg.generator.numpy_kernel(1, "row", "recurrence")
+
+    import linecache
+    assert "def generated_compute_numpy_shells" in linecache.getline(kernel.__code__.co_filename, 1)
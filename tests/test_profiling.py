@@ -0,0 +1,104 @@
+"""
+Tests the stage-level profiling of the kernels and drivers.
+"""
+
+import json
+import threading
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+np.random.seed(0)
+xyz = np.random.rand(500, 3) * 8.0 - 4.0
+xyz = xyz[np.argsort(xyz[:, 0])]
+
+_kernel_stages = {"distance", "radial", "powers", "cartesian", "spherical"}
+
+
+@pytest.mark.parametrize("backend", ["numpy", "table", "reference"])
+def test_profile_driver(backend):
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVTZ"])
+    ref = gg.driver.compute_basis_collocation(xyz, basis, grad=1, backend=backend, block_size=64)
+
+    with gg.profiling.Profiler() as prof:
+        assert gg.profiling.current() is prof
+        out = gg.driver.compute_basis_collocation(xyz, basis, grad=1, backend=backend, block_size=64)
+    assert gg.profiling.current() is None
+
+    # Instrumentation does not change the values
+    for k in ref:
+        assert np.array_equal(ref[k], out[k])
+
+    report = prof.report()
+    assert _kernel_stages | {"screening"} <= set(report["stages"])
+    assert sum(stage["fraction"] for stage in report["stages"].values()) == pytest.approx(1.0)
+    assert sum(stage["time"] for stage in report["stages"].values()) <= report["wall_time"]
+
+    counters = report["counters"]
+    assert counters["blocks"] == 8
+    assert counters["points"] == xyz.shape[0]
+    assert counters["shells_computed"] + counters["shells_screened"] == 8 * basis.nshell
+    assert counters["shells"] == counters["shells_computed"]
+    assert counters["exp_calls"] > 0
+
+    # One JSON line per stage and counter
+    lines = [json.loads(line) for line in prof.json_lines().split("\n")]
+    assert len(lines) == len(report["stages"]) + len(counters)
+    assert {line["name"] for line in lines if line["kind"] == "stage"} == set(report["stages"])
+
+
+def test_profile_threads():
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVDZ"])
+
+    # Calls of other threads are not recorded
+    other = threading.Thread(target=gg.driver.compute_basis_collocation, args=(xyz, basis))
+    with gg.profiling.Profiler() as prof:
+        other.start()
+        other.join()
+        assert gg.profiling.current() is prof
+    assert prof.report()["counters"] == {}
+
+    # The driver's own worker threads are
+    with gg.profiling.Profiler() as prof:
+        gg.driver.compute_basis_collocation(xyz, basis, block_size=64, nthreads=3)
+    counters = prof.report()["counters"]
+    assert counters["blocks"] == 8
+    assert counters["shells"] == counters["shells_computed"]
+
+
+def test_profile_exp_counts():
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVDZ"])
+    L, coeffs, exponents, center = basis.shell(0)
+
+    # Far away points screen every exponential
+    with gg.profiling.Profiler() as prof:
+        gg.radial.radial_derivatives(np.full(100, 1.e4), coeffs, exponents)
+        gg.radial.radial_derivatives(np.zeros(100), coeffs, exponents)
+
+    counters = prof.report()["counters"]
+    assert counters["exp_screened"] == 100 * len(coeffs)
+    assert counters["exp_calls"] == 100 * len(coeffs)
+
+
+def test_profile_disabled():
+    # Regular kernels carry no instrumentation
+    assert "prof" not in gg.generator.numpy_generator(2)
+    assert "prof" in gg.generator.numpy_generator(2, profile=True)
+
+    basis = ref_basis.test_basis["cc-pVDZ"]
+    with gg.profiling.Profiler(memory=True) as outer:
+        with gg.profiling.Profiler() as inner:
+            gg.driver.compute_basis_collocation(xyz[:50], basis)
+        assert gg.profiling.current() is outer
+        gg.driver.compute_basis_collocation(xyz[:50], basis, spherical=False)
+
+    assert "spherical" in inner.report()["stages"]
+    assert "spherical" not in outer.report()["stages"]
+    assert outer.report()["stages"]["cartesian"]["bytes"] > 0
+
+    outer.reset()
+    assert outer.report()["stages"] == {}
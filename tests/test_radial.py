@@ -0,0 +1,110 @@
+"""
+Compare the primitive-vectorized radial derivatives against a loop over primitives.
+"""
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+# Global points, close to and far from the centers
+np.random.seed(0)
+xyz = np.random.rand(300, 3) * 6.0 - 3.0
+
+
+def _loop_radial(R2, coeffs, exponents, grad):
+    V = np.zeros((grad + 1, ) + R2.shape)
+    for K in range(coeffs.shape[-1]):
+        T = coeffs[..., K, None] * np.exp(-exponents[..., K, None] * R2)
+        for k in range(grad + 1):
+            V[k] += T
+            T = -2.0 * exponents[..., K, None] * T
+    return V
+
+
+def _assert_radial(V, R2, coeffs, exponents, grad):
+    # Errors are relative to the sum of the magnitudes of the primitive terms, which may cancel, plus the largest
+    # value a screened primitive may have
+    ref = _loop_radial(R2, coeffs, exponents, grad)
+    scale = np.abs(_loop_radial(R2, np.abs(coeffs), exponents, grad))
+    screened = np.exp(-gg.radial.primitive_cutoff) * np.abs(_loop_radial(np.zeros_like(R2), np.abs(coeffs), exponents,
+                                                                        grad))
+    assert np.all(np.abs(V - ref) <= 1.e-14 * scale + screened)
+
+
+@pytest.mark.parametrize("grad", [0, 1, 2])
+@pytest.mark.parametrize("basis_name", ["cc-pVDZ", "cc-pV5Z"])
+def test_radial_shells(basis_name, grad):
+
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis[basis_name])
+    for shell in range(basis.nshell):
+        L, coeffs, exponents, center = basis.shell(shell)
+
+        # Single points and compact blocks, the core primitives are screened out for most of them
+        for block in [xyz, xyz[:1], xyz[np.argsort(xyz[:, 0])][-20:]]:
+            R2 = np.sum((block - center)**2, axis=1)
+            V = gg.radial.radial_derivatives(R2, coeffs, exponents, grad)
+            _assert_radial(V, R2, coeffs, exponents, grad)
+
+
+def test_radial_batched():
+
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVQZ"])
+    shells = np.where(basis.am == 0)[0]
+    coeffs, exponents = basis.padded_primitives(shells)
+
+    R2 = np.sum((xyz[None, :, :] - basis.shell_centers[shells][:, None, :])**2, axis=-1)
+    V = gg.radial.radial_derivatives(R2, coeffs, exponents, 2)
+    assert V.shape == (3, shells.shape[0], xyz.shape[0])
+    _assert_radial(V, R2, coeffs, exponents, 2)
+
+
+def test_radial_screened_block():
+
+    # A block far away from a tight primitive skips it entirely
+    R2 = np.linspace(4.0, 9.0, 10)
+    V = gg.radial.radial_derivatives(R2, [1.0, 0.5], [6665.0, 0.3], 1)
+    assert np.allclose(V, _loop_radial(R2, np.array([0.5]), np.array([0.3]), 1))
+
+    V = gg.radial.radial_derivatives(R2, [1.0], [6665.0], 1)
+    assert V.shape == (2, 10)
+    assert np.all(V == 0.0)
+
+    # Blocks that are mostly significant evaluate every exponential, masked ones only when very sparse
+    R2 = np.linspace(0.0, 40.0, 1000)
+    for exponent, dense in [(5.0, True), (400.0, False)]:
+        with gg.profiling.Profiler() as prof:
+            V = gg.radial.radial_derivatives(R2, [1.0], [exponent], 1)
+        assert prof.report()["counters"]["exp_calls"] == (1000 if dense else np.count_nonzero(exponent * R2 <= 100.0))
+        assert np.allclose(V, _loop_radial(R2, np.array([1.0]), np.array([exponent]), 1), atol=1.e-40)
+
+
+@pytest.mark.parametrize("exp_atol", [1.e-4, 1.e-6, 1.e-10])
+def test_radial_exp_atol(exp_atol):
+
+    # Arguments spanning the whole range of grid work, from the nucleus to far beyond the cutoffs
+    R2 = np.linspace(0.0, 1.0, 2000)**2 * 400.0
+    for coeffs, exponents in [([1.0], [6665.0]), ([0.6, -0.3, 0.8], [12.0, 1.5, 0.1])]:
+        coeffs = np.array(coeffs)
+        exponents = np.array(exponents)
+        V = gg.radial.radial_derivatives(R2, coeffs, exponents, 2, exp_atol=exp_atol)
+        ref = _loop_radial(R2, coeffs, exponents, 2)
+        peak = _loop_radial(np.zeros(1), np.abs(coeffs), exponents, 2)
+        assert np.all(np.abs(V - ref) <= exp_atol * np.abs(peak))
+
+        # Each single exponential against np.exp
+        for exponent in exponents:
+            V = gg.radial.radial_derivatives(R2, [1.0], [exponent], 0, exp_atol=exp_atol)
+            assert np.all(np.abs(V[0] - np.exp(-exponent * R2)) <= exp_atol)
+
+
+def test_radial_exp_atol_cutoff():
+
+    assert gg.radial.exp_cutoff() == gg.radial.primitive_cutoff
+    assert np.isclose(np.exp(-gg.radial.exp_cutoff(1.e-6)), 1.e-6)
+    assert gg.radial.exp_cutoff(1.e-60) == gg.radial.primitive_cutoff
+
+    with pytest.raises(ValueError):
+        gg.radial.exp_cutoff(0.0)
@@ -0,0 +1,51 @@
+"""
+Compare the table-driven kernel against the NumPy reference code.
+"""
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+# Tweakers
+npoints = 500
+
+# Global points
+np.random.seed(0)
+xyzw = np.random.rand(npoints, 4)
+
+
+@pytest.mark.parametrize("grad", [0, 1, 2, 3])
+@pytest.mark.parametrize("spherical", ["cart", "spherical"])
+@pytest.mark.parametrize("L", range(9))
+def test_table_collocation(L, spherical, grad):
+
+    trans = "spherical" == spherical
+    shell = ([0.8, 0.2], [1.3, 0.35], [0.1, -0.2, 0.3])
+
+    ref_results = gg.ref.compute_collocation(xyzw, L, *shell, grad=grad, spherical=trans)
+    table_results = gg.table.compute_collocation(xyzw, L, *shell, grad=grad, spherical=trans)
+
+    assert list(ref_results) == list(table_results)
+    for k in ref_results.keys():
+        assert np.allclose(table_results[k], ref_results[k]), k
+
+
+@pytest.mark.parametrize("spherical", ["cart", "spherical"])
+def test_table_batched(spherical):
+
+    trans = "spherical" == spherical
+    basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pV5Z"])
+
+    for L in range(basis.max_am + 1):
+        shells = np.where(basis.am == L)[0]
+        coeffs, exponents = basis.padded_primitives(shells)
+        batch_results = gg.table.compute_collocation(
+            xyzw, L, coeffs, exponents, basis.shell_centers[shells], grad=2, spherical=trans)
+
+        for num, shell in enumerate(shells):
+            shell_results = gg.ref.compute_collocation(xyzw, *basis.shell(shell), grad=2, spherical=trans)
+            for k, v in shell_results.items():
+                assert np.allclose(batch_results[k][num], v)
@@ -0,0 +1,79 @@
+"""
+Tests the evaluation of a basis on the frames of a trajectory against independent collocations of each frame.
+"""
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+npoints = 500
+nframes = 5
+
+np.random.seed(0)
+basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVTZ"])
+centers = basis.centers[None, :, :] + np.random.rand(nframes, basis.ncenter, 3) - 0.5
+grids = np.random.rand(nframes, npoints, 3) * 6.0 - 3.0
+
+
+def _frame_reference(frame, xyz, **kwargs):
+    moved = gg.BasisSet(centers[frame], basis.shell_center, basis.am, basis.prim_offsets, basis.exponents,
+                        basis.coefficients)
+    return gg.driver.compute_basis_collocation(xyz, moved, **kwargs)
+
+
+@pytest.mark.parametrize("nthreads", [1, 3])
+@pytest.mark.parametrize("backend", ["numpy", "table"])
+def test_trajectory_map(backend, nthreads):
+    evaluator = gg.FrameEvaluator(basis, grad=1, backend=backend)
+
+    frames = list(evaluator.map(centers, grids, nthreads=nthreads))
+    assert len(frames) == nframes
+    for frame, out in enumerate(frames):
+        ref = _frame_reference(frame, grids[frame], grad=1, backend=backend)
+        for k in ref:
+            assert np.allclose(ref[k], out[k], atol=1.e-14, rtol=1.e-12)
+
+    report = evaluator.report()
+    assert report["frames"] == nframes
+    assert report["points"] == nframes * npoints
+    assert report["frames_per_second"] > 0.0
+
+
+def test_trajectory_options():
+    # A shared grid, in structure-of-arrays form
+    xyz = np.ascontiguousarray(grids[0].T)
+    outputs, report = gg.trajectory.compute_trajectory_collocation(xyz, basis, centers, xyz_soa=True, nthreads=2,
+                                                                   spherical=False, normalization="full",
+                                                                   components=("PHI", "PHI_XX"))
+    assert report["frames"] == nframes
+    for frame, out in enumerate(outputs):
+        ref = _frame_reference(frame, grids[0], grad=2, spherical=False, normalization="full")
+        assert list(out) == ["PHI", "PHI_XX"]
+        for k in out:
+            assert np.allclose(ref[k], out[k], atol=1.e-14, rtol=1.e-12)
+
+    # A shared grid as a tuple of arrays, three frames as many as the grid has arrays
+    soa = tuple(np.ascontiguousarray(x) for x in grids[1].T)
+    outputs, report = gg.trajectory.compute_trajectory_collocation(soa, basis, centers[:3], xyz_soa=True)
+    assert report["frames"] == 3
+    for frame, out in enumerate(outputs):
+        assert np.allclose(_frame_reference(frame, grids[1])["PHI"], out["PHI"], atol=1.e-14, rtol=1.e-12)
+
+    # Single frames into a given output
+    evaluator = gg.FrameEvaluator(basis, grad=0, layout="points")
+    storage = gg.layout.allocate(basis.nbf(), npoints, 0, layout="points")
+    out = evaluator.compute(grids[2], centers[2], out=storage)
+    assert np.shares_memory(out["PHI"], storage)
+    assert np.allclose(_frame_reference(2, grids[2])["PHI"], out["PHI"])
+    assert evaluator.report()["frames"] == 1
+
+    evaluator.reset()
+    assert evaluator.report()["frames"] == 0
+
+    with pytest.raises(ValueError):
+        list(evaluator.map(centers, grids[:2]))
+    with pytest.raises(ValueError):
+        evaluator.compute(grids[0], centers[0, :1])
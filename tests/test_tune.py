@@ -0,0 +1,85 @@
+"""
+Tests the driver auto-tuner and its profiles.
+"""
+
+import json
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+
+@pytest.fixture
+def profile_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "profile.json")
+    monkeypatch.setenv("GAU2GRID_PROFILE", path)
+    monkeypatch.delenv("GAU2GRID_AUTOTUNE", raising=False)
+    return path
+
+
+def test_tune_profile(profile_file):
+
+    assert gg.tune.load_profile() is None
+    assert gg.tune.driver_settings(1, 3) == (["numpy"] * 4, 128, 1)
+
+    profile = gg.tune.tune(max_am=2, grads=(1, ), block_sizes=(64, 256), nthreads=(1, 2), npoints=512, repeats=1)
+    settings = profile["settings"]["1"]
+    assert len(settings["backends"]) == 3
+    assert settings["block_size"] in [64, 256]
+    assert settings["nthreads"] in [1, 2]
+
+    gg.tune.save_profile(profile)
+    with open(profile_file) as handle:
+        assert json.load(handle)["settings"] == profile["settings"]
+
+    # Tuned knobs are used unless given, higher L use the backend of the highest tuned L
+    backends, block_size, nthreads = gg.tune.driver_settings(1, 4)
+    assert backends == settings["backends"] + [settings["backends"][-1]] * 2
+    assert (block_size, nthreads) == (settings["block_size"], settings["nthreads"])
+    assert gg.tune.driver_settings(1, 1, backend="reference", block_size=32, nthreads=3) == (["reference"] * 2, 32, 3)
+
+    # Untuned derivative levels use the defaults
+    assert gg.tune.driver_settings(0, 1) == (["numpy"] * 2, 128, 1)
+
+
+def test_tune_other_machine(profile_file):
+
+    profile = {"version": 1, "machine": {"node": "elsewhere"}, "settings": {"0": {"block_size": 16}}}
+    gg.tune.save_profile(profile)
+    assert gg.tune.load_profile() is None
+    assert gg.tune.driver_settings(0, 0) == (["numpy"], 128, 1)
+
+
+def test_tune_corrupt_profile(profile_file):
+
+    # A truncated profile, as left by a killed run, is ignored
+    with open(profile_file, "w") as handle:
+        handle.write("{bad")
+    assert gg.tune.load_profile() is None
+
+    # As is a profile of this machine without settings
+    gg.tune.save_profile({"version": gg.tune._profile_version, "machine": gg.tune.machine()})
+    assert gg.tune.load_profile() is None
+    gg.tune.save_profile({"version": gg.tune._profile_version, "machine": gg.tune.machine(), "settings": {"0": 1}})
+    assert gg.tune.load_profile() is None
+
+    basis = [{"am": 0, "coef": [1.0], "exp": [1.0], "center": [0.0, 0.0, 0.0]}]
+    phi = gg.driver.compute_basis_collocation(np.zeros((1, 3)), basis)["PHI"]
+    assert np.allclose(phi, 1.0)
+
+
+@pytest.mark.parametrize("nthreads", [1, 3])
+def test_driver_mixed_backends(nthreads, profile_file):
+
+    np.random.seed(0)
+    xyz = np.random.rand(700, 3) * 8.0 - 3.0
+    basis = ref_basis.test_basis["cc-pVTZ"]
+
+    ref = gg.driver.compute_basis_collocation(xyz, basis, grad=2, backend="reference")
+    results = gg.driver.compute_basis_collocation(
+        xyz, basis, grad=2, backend=["numpy", "table", "numpy"], block_size=100, nthreads=nthreads)
+    for k in ref.keys():
+        assert np.allclose(results[k], ref[k]), k
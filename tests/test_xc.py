@@ -0,0 +1,109 @@
+"""
+Tests the fused XC quadrature drivers against contractions of the full collocation matrices.
+"""
+
+import numpy as np
+import gau2grid as gg
+import pytest
+
+# Import locals
+import ref_basis
+
+npoints = 2000
+
+# Spatially compact blocks as DFT grids have them
+np.random.seed(0)
+xyzw = np.random.rand(npoints, 4)
+xyzw[:, :3] *= 10.0
+xyzw[:, :3] -= 3.0
+xyzw = xyzw[np.lexsort((xyzw[:, 2], np.floor(xyzw[:, 1] / 3.0), np.floor(xyzw[:, 0] / 3.0)))]
+
+basis = gg.BasisSet.from_dict(ref_basis.test_basis["cc-pVDZ"])
+nbf = basis.nbf()
+density = np.random.rand(nbf, nbf)
+density += density.T
+potential = np.random.rand(npoints) - 0.5
+
+
+def _moved_basis(center, direction, step):
+    centers = basis.centers.copy()
+    centers[center, direction] += step
+    return gg.BasisSet(centers, basis.shell_center, basis.am, basis.prim_offsets, basis.exponents,
+                       basis.coefficients)
+
+
+def _energy(moved):
+    phi = gg.driver.compute_basis_collocation(xyzw[:, :3], moved)["PHI"]
+    return np.einsum("mn,mp,np,p->", density, phi, phi, xyzw[:, 3] * potential)
+
+
+@pytest.mark.parametrize("backend", ["numpy", "table", "reference"])
+def test_xc_gradient(backend):
+
+    gradient = gg.xc.compute_xc_gradient(xyzw, basis, density, potential, backend=backend)
+
+    phi = gg.driver.compute_basis_collocation(xyzw[:, :3], basis, grad=1)
+    dphi = np.dot(density, phi["PHI"] * (xyzw[:, 3] * potential))
+    for direction, name in enumerate(["PHI_X", "PHI_Y", "PHI_Z"]):
+        ref = np.bincount(basis.function_centers(), weights=-np.sum(phi[name] * dphi, axis=1))
+        assert np.allclose(gradient[:, direction], ref, atol=1.e-12)
+
+
+def test_xc_gradient_finite_difference():
+
+    gradient = gg.xc.compute_xc_gradient(xyzw, basis, density, potential)
+
+    h = 1.e-5
+    for center in range(basis.ncenter):
+        for direction in range(3):
+            fd = (_energy(_moved_basis(center, direction, h)) - _energy(_moved_basis(center, direction, -h))) / (2 * h)
+            assert np.allclose(fd, 2.0 * gradient[center, direction], rtol=1.e-6, atol=1.e-8)
+
+
+def test_xc_gradient_options():
+
+    ref = gg.xc.compute_xc_gradient(xyzw, basis, density, potential)
+
+    # Explicit weights, structure-of-arrays grids, and threads
+    xyz, weights = gg.layout.grid_soa(xyzw)
+    out = gg.xc.compute_xc_gradient(xyz, basis, density, potential, weights=weights, xyz_soa=True, nthreads=2,
+                                    block_size=64)
+    assert np.allclose(out, ref, atol=1.e-12)
+
+    # Unweighted grids
+    out = gg.xc.compute_xc_gradient(xyzw[:, :3], basis, density, potential * xyzw[:, 3])
+    assert np.allclose(out, ref, atol=1.e-12)
+
+    with pytest.raises(ValueError):
+        gg.xc.compute_xc_gradient(xyzw, basis, density[1:], potential)
+
+
+@pytest.mark.parametrize("backend", ["numpy", "table", "reference"])
+@pytest.mark.parametrize("sign", ["mixed", "positive", "negative"])
+def test_xc_matrix(backend, sign):
+
+    pot = {"mixed": potential, "positive": np.abs(potential), "negative": -np.abs(potential)}[sign]
+    matrix = gg.xc.compute_xc_matrix(xyzw, basis, pot, backend=backend)
+
+    phi = gg.driver.compute_basis_collocation(xyzw[:, :3], basis)["PHI"]
+    ref = np.dot(phi * (xyzw[:, 3] * pot), phi.T)
+
+    assert np.allclose(matrix, ref, atol=1.e-12)
+    assert np.array_equal(matrix, matrix.T)
+
+
+def test_xc_matrix_options():
+
+    ref = gg.xc.compute_xc_matrix(xyzw, basis, potential)
+
+    xyz, weights = gg.layout.grid_soa(xyzw)
+    out = gg.xc.compute_xc_matrix(xyz, basis, potential, weights=weights, xyz_soa=True, nthreads=3, block_size=32)
+    assert np.allclose(out, ref, atol=1.e-12)
+
+    # Results are added to out, e.g. over several grid batches
+    out = gg.xc.compute_xc_matrix(xyzw[:500], basis, potential[:500])
+    gg.xc.compute_xc_matrix(xyzw[500:], basis, potential[500:], out=out)
+    assert np.allclose(out, ref, atol=1.e-12)
+
+    with pytest.raises(ValueError):
+        gg.xc.compute_xc_matrix(xyzw, basis, potential[1:])